@@ -0,0 +1,268 @@
+"""Offline throughput benchmark of the download pipeline.
+
+Runs a single video and 10/100/1000-item playlists through the real
+Pipeline (downloader, HTTP pool, metadata cache, ffmpeg encoder) against
+a local fake YouTube (fake_youtube.py), with no network access. Each
+scenario runs in its own process so its peak memory is measured alone.
+
+Reported per scenario: tracks per minute, seconds until the first track
+is done, MB/s downloaded, mean and p95 seconds per stage, and peak RSS of
+the Python process and of the largest ffmpeg child. Playlists are listed
+100 videos per page; --page-latency makes each page as slow as YouTube's.
+
+    python benchmarks/benchmark.py                      # all scenarios
+    python benchmarks/benchmark.py -n 1,10 --seconds 30 --bandwidth 2048 --latency 50
+    python benchmarks/benchmark.py -n 2000 --seconds 10 --page-latency 500
+    python benchmarks/benchmark.py --json results.json
+    python benchmarks/benchmark.py --baseline results.json   # exit 1 on a regression
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SCENARIOS = "1,10,100,1000"
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "ytmd-benchmark")
+DEFAULT_TOLERANCE = 0.2
+STAGE_NAMES = ("fetch+wait", "download", "encode wait", "encode")
+
+
+def peak_rss_mb(who):
+    """Peak resident set size in MB of this process or of its largest child, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class StageClock:
+    """Turns pipeline status callbacks into per-stage durations"""
+
+    # Stage -> (status that starts it, statuses that may end it)
+    BOUNDS = {
+        # No status marks the end of a fetch, so this includes waiting for a download thread
+        "fetch+wait": ("fetching", ("downloading",)),
+        "download": ("downloading", ("downloaded", "encoding", "done")),
+        "encode wait": ("downloaded", ("encoding",)),
+        "encode": ("encoding", ("done",)),
+    }
+
+    def __init__(self):
+        self.times = {}  # Track index -> {status: first time seen}
+        self.first_done = None
+        self._lock = threading.Lock()
+
+    def on_status(self, track, status, message):
+        now = time.perf_counter()
+        with self._lock:
+            self.times.setdefault(track.index, {}).setdefault(status, now)
+            if status == "done" and self.first_done is None:
+                self.first_done = now
+
+    def durations(self):
+        result = {stage: [] for stage in self.BOUNDS}
+        for times in self.times.values():
+            for stage, (start, ends) in self.BOUNDS.items():
+                end = next((times[status] for status in ends if status in times), None)
+                if start in times and end is not None and end >= times[start]:
+                    result[stage].append(end - times[start])
+        return result
+
+
+def summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {"mean": round(sum(values) / len(values), 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3)}
+
+
+def run_scenario(count, args):
+    """Run one scenario in this process and return its measurements"""
+    import httppool
+    import ratelimit
+    from encoder import find_ffmpeg
+    from metacache import MetadataCache, PlaylistUrls
+    from pipeline import Pipeline
+    import fake_youtube
+
+    sources = fake_youtube.make_sources(os.path.join(args.work_dir, "sources"), find_ffmpeg(),
+                                        seconds=args.seconds, bitrate=args.source_bitrate)
+    server = fake_youtube.FakeServer(sources, latency=args.latency / 1000,
+                                     bandwidth=args.bandwidth * 1024).start()
+    calls = fake_youtube.install(server, seconds=args.seconds, page_latency=args.page_latency / 1000)
+    ratelimit.limiter.configure(ratelimit.parse_rate(args.limit_rate))
+    run_dir = tempfile.mkdtemp(prefix=f"run-{count}-", dir=args.work_dir)
+    clock = StageClock()
+    metadata = MetadataCache(path=os.path.join(run_dir, "metadata.sqlite3"))
+    try:
+        started = time.perf_counter()
+        with httppool.session() as http:
+            if count == 1:
+                urls = [fake_youtube.video_url(0)]
+            else:
+                urls = PlaylistUrls(metadata, fake_youtube.playlist_url(count))
+            pipeline = Pipeline(os.path.join(run_dir, "out"), concurrency=args.concurrency,
+                                on_status=clock.on_status, streaming=args.streaming,
+                                output_format=args.format, bitrate=args.bitrate,
+                                connections=args.connections, metadata=metadata,
+                                adaptive=args.adaptive, max_concurrency=args.max_concurrency,
+                                dedup=False)  # Every scenario reuses the same video IDs
+            tracks = pipeline.run(urls)
+        elapsed = time.perf_counter() - started
+        http_stats = http.stats()
+    finally:
+        metadata.close()
+        server.stop()
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    done = sum(1 for track in tracks if track.status == "done")
+    return {
+        "items": count,
+        "done": done,
+        "failed": sum(1 for track in tracks if track.status == "failed"),
+        "seconds": round(elapsed, 3),
+        "tracks_per_minute": round(done / elapsed * 60, 1),
+        "first_track_seconds": round(clock.first_done - started, 3) if clock.first_done else None,
+        "mb_per_second": round(server.bytes_sent / elapsed / (1024 * 1024), 2),
+        "stages": {stage: summarize(values) for stage, values in clock.durations().items()},
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "peak_child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        "server_requests": server.requests,
+        "http": http_stats,
+        "youtube_calls": calls,
+    }
+
+
+def child_command(count, args):
+    command = [sys.executable, os.path.abspath(__file__), "--run", str(count),
+               "--seconds", str(args.seconds), "--source-bitrate", args.source_bitrate,
+               "--latency", str(args.latency), "--bandwidth", str(args.bandwidth),
+               "--page-latency", str(args.page_latency),
+               "--format", args.format, "--bitrate", args.bitrate,
+               "--concurrency", str(args.concurrency), "--connections", str(args.connections),
+               "--limit-rate", args.limit_rate, "--max-concurrency", str(args.max_concurrency),
+               "--work-dir", args.work_dir]
+    if not args.streaming:
+        command.append("--no-streaming")
+    if args.adaptive:
+        command.append("--adaptive")
+    return command
+
+
+def format_stage(stats):
+    return f"{stats['mean']:.2f}/{stats['p95']:.2f}" if stats else "-"
+
+
+def print_table(results):
+    header = (f"{'items':>6} {'done':>5} {'seconds':>8} {'tracks/min':>10} {'first s':>7} {'MB/s':>7} "
+              + " ".join(f"{name:>13}" for name in STAGE_NAMES) + f" {'RSS MB':>7} {'ffmpeg MB':>9}")
+    print(header)
+    for result in results:
+        print(f"{result['items']:>6} {result['done']:>5} {result['seconds']:>8.1f} "
+              f"{result['tracks_per_minute']:>10.1f} {result['first_track_seconds'] or '-':>7} "
+              f"{result['mb_per_second']:>7.2f} "
+              + " ".join(f"{format_stage(result['stages'][name]):>13}" for name in STAGE_NAMES)
+              + f" {result['peak_rss_mb'] or '-':>7} {result['peak_child_rss_mb'] or '-':>9}")
+    print("Stage columns are mean/p95 seconds per track.")
+
+
+def regressions(results, baseline, tolerance):
+    """Messages for every scenario that got slower or bigger than the baseline allows"""
+    previous = {result["items"]: result for result in baseline["results"]}
+    messages = []
+    for result in results:
+        before = previous.get(result["items"])
+        if not before:
+            continue
+        if result["tracks_per_minute"] < before["tracks_per_minute"] * (1 - tolerance):
+            messages.append(f"{result['items']} items: {result['tracks_per_minute']} tracks/min, "
+                            f"baseline {before['tracks_per_minute']}")
+        first, first_before = result.get("first_track_seconds"), before.get("first_track_seconds")
+        if first and first_before and first > first_before * (1 + tolerance):
+            messages.append(f"{result['items']} items: first track after {first}s, baseline {first_before}s")
+        if (result["peak_rss_mb"] and before.get("peak_rss_mb")
+                and result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance)):
+            messages.append(f"{result['items']} items: peak RSS {result['peak_rss_mb']} MB, "
+                            f"baseline {before['peak_rss_mb']} MB")
+    return messages
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the download pipeline.")
+    parser.add_argument("-n", "--scenarios", default=DEFAULT_SCENARIOS,
+                        help=f"comma-separated item counts; 1 is a single video, more a playlist "
+                             f"(default: {DEFAULT_SCENARIOS})")
+    parser.add_argument("--seconds", type=int, default=60, help="length of each synthetic track (default: 60)")
+    parser.add_argument("--source-bitrate", default="128k", help="bitrate of the synthetic sources (default: 128k)")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every request")
+    parser.add_argument("--bandwidth", type=int, default=0, help="KB/s per connection, 0 for unlimited")
+    parser.add_argument("--page-latency", type=float, default=0,
+                        help="milliseconds to list each page of 100 playlist videos")
+    parser.add_argument("-f", "--format", default="mp3", help="output format (default: mp3)")
+    parser.add_argument("-b", "--bitrate", default="320k", help="output bitrate (default: 320k)")
+    parser.add_argument("-j", "--concurrency", type=int, default=3, help="videos in flight (default: 3)")
+    parser.add_argument("--connections", type=int, default=4, help="connections per large download (default: 4)")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false",
+                        help="download to a file before encoding")
+    parser.add_argument("--limit-rate", default="0", help="global download rate limit, e.g. 2M (default: none)")
+    parser.add_argument("--adaptive", action="store_true", help="let the pipeline adapt the number of downloads")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="upper bound for --adaptive (default: 8)")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help=f"scratch folder (default: {DEFAULT_WORK_DIR})")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="results of an earlier --json run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"allowed slowdown/growth against the baseline (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)  # Internal: run one scenario, print JSON
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+    if args.run:
+        print(json.dumps(run_scenario(args.run, args)))
+        return 0
+
+    results = []
+    for count in (int(item) for item in args.scenarios.split(",") if item.strip()):
+        print(f"Running {count} item(s)...", file=sys.stderr)
+        completed = subprocess.run(child_command(count, args), stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f"Scenario with {count} item(s) failed", file=sys.stderr)
+            return 1
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print_table(results)
+    report = {"settings": {key: value for key, value in vars(args).items()
+                           if key not in ("json", "baseline", "run")},
+              "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            messages = regressions(results, json.load(fh), args.tolerance)
+        for message in messages:
+            print(f"REGRESSION: {message}")
+        if messages:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Local stand-in for YouTube, for benchmarking the pipeline offline.
+
+FakeServer serves synthetic audio streams over HTTP/1.1 with Range and
+keep-alive support, an optional per-request latency and an optional
+per-connection bandwidth cap. FakeYouTube and FakePlaylist mimic the
+parts of pytubefix's YouTube and Playlist the app uses and point every
+stream at the server; install() swaps them in for the real classes,
+which the app looks up on pytubefix each time it needs them.
+
+Every video shares the same synthetic source files, generated once with
+ffmpeg, so the encoder works on real audio.
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SEND_SIZE = 16 * 1024
+PAGE_SIZE = 100  # Videos per playlist page, as on YouTube
+
+# Source codec -> (file extension, ffmpeg audio codec, mime subtype, itag)
+SOURCE_FORMATS = {
+    "mp4a.40.2": ("m4a", "aac", "mp4", 140),
+    "opus": ("webm", "libopus", "webm", 251),
+}
+
+
+def make_sources(folder, ffmpeg, seconds=180, bitrate="128k"):
+    """Generate one synthetic track per source format; returns {extension: path}"""
+    os.makedirs(folder, exist_ok=True)
+    sources = {}
+    for extension, codec, _, _ in SOURCE_FORMATS.values():
+        path = os.path.join(folder, f"source-{seconds}s-{bitrate}.{extension}")
+        if not os.path.exists(path):
+            subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+                            "-ac", "2", "-c:a", codec, "-b:a", bitrate, path], check=True)
+        sources[extension] = path
+    return sources
+
+
+class FakeServer:
+    """Threaded HTTP server for the synthetic sources.
+
+    Any path ending in ".<extension>" serves the source of that extension,
+    so every fake video has its own URL. latency (seconds) delays every
+    response; bandwidth (bytes/s, 0 for unlimited) caps each connection.
+    """
+
+    def __init__(self, sources, latency=0.0, bandwidth=0, host="127.0.0.1", port=0):
+        self.data = {}
+        for extension, path in sources.items():
+            with open(path, "rb") as fh:
+                self.data[extension] = fh.read()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_port}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def size(self, extension):
+        return len(self.data[extension])
+
+    def _count(self, sent):
+        with self._lock:
+            self.bytes_sent += sent
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                extension = urlsplit(self.path).path.rsplit(".", 1)[-1]
+                data = server.data.get(extension)
+                if data is None:
+                    self.send_error(404)
+                    return
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    start = int(match[1])
+                    end = min(int(match[2]) if match[2] else len(data) - 1, len(data) - 1)
+                    if start > end:
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    start, end = 0, len(data) - 1
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+
+                started = time.monotonic()
+                sent = 0
+                try:
+                    for offset in range(start, end + 1, SEND_SIZE):
+                        block = data[offset:min(offset + SEND_SIZE, end + 1)]
+                        self.wfile.write(block)
+                        sent += len(block)
+                        if server.bandwidth:
+                            ahead = sent / server.bandwidth - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    server._count(sent)
+
+        return Handler
+
+
+class FakeStream:
+    """The attributes of a pytubefix audio Stream the app reads"""
+    is_sabr = False
+    is_default_audio_track = True
+
+    def __init__(self, video, codec, server):
+        extension, _, subtype, itag = SOURCE_FORMATS[codec]
+        self.video = video
+        self.audio_codec = codec
+        self.subtype = subtype
+        self.mime_type = f"audio/{subtype}"
+        self.itag = itag
+        self.abr = "160kbps" if codec == "opus" else "128kbps"
+        self.filesize = server.size(extension)
+        expire = int(time.time()) + 6 * 60 * 60
+        self.url = f"{server.base_url}{video.video_id}.{extension}?itag={itag}&expire={expire}"
+        self._extension = extension
+
+    @property
+    def default_filename(self):
+        return f"{self.video.title}.{self._extension}"
+
+    def get_file_path(self, output_path=None, **kwargs):
+        output_path = os.path.abspath(output_path or os.getcwd())
+        os.makedirs(output_path, exist_ok=True)
+        return os.path.join(output_path, self.default_filename)
+
+    def on_progress_for_chunks(self, chunk, bytes_remaining):
+        if self.video.on_progress:
+            self.video.on_progress(self, chunk, bytes_remaining)
+
+
+class StreamQuery(list):
+    def filter(self, **kwargs):
+        return self
+
+    def first(self):
+        return self[0] if self else None
+
+
+def video_url(index):
+    return f"https://www.youtube.com/watch?v=bm{index:09d}"
+
+
+def playlist_url(count):
+    """URL of a fake playlist with count videos"""
+    return f"https://www.youtube.com/playlist?list=BENCH{count}"
+
+
+def install(server, codecs=("mp4a.40.2", "opus"), seconds=180, page_latency=0.0):
+    """Make the app's pytubefix lookups answer from server; returns the call counters.
+
+    Playlists are listed PAGE_SIZE videos at a time, each page taking
+    page_latency seconds.
+    """
+    import metacache
+
+    pytubefix = metacache.load_pytubefix()
+    calls = {"YouTube": 0, "Playlist": 0, "Playlist pages": 0}
+
+    class FakeYouTube:
+        def __init__(self, url, on_progress_callback=None, **kwargs):
+            calls["YouTube"] += 1
+            self.video_id = parse_qs(urlsplit(url).query)["v"][0]
+            self.title = f"Benchmark track {self.video_id}"
+            self.length = seconds
+            self.on_progress = on_progress_callback
+            self.streams = StreamQuery(FakeStream(self, codec, server) for codec in codecs)
+
+    class FakePlaylist:
+        def __init__(self, url, **kwargs):
+            calls["Playlist"] += 1
+            self.length = int(parse_qs(urlsplit(url).query)["list"][0][len("BENCH"):])
+
+        def url_generator(self):
+            for start in range(0, self.length, PAGE_SIZE):
+                calls["Playlist pages"] += 1
+                time.sleep(page_latency)
+                yield from (video_url(index) for index in range(start, min(start + PAGE_SIZE, self.length)))
+
+        @property
+        def video_urls(self):
+            return list(self.url_generator())
+
+    pytubefix.YouTube = FakeYouTube
+    pytubefix.Playlist = FakePlaylist
+    return calls
@@ -0,0 +1,73 @@
+"""Cold-start budget check of the application's entry points.
+
+Imports each frontend module in fresh interpreters and fails when the
+median import time exceeds its budget, or when a module that should only
+load on first use (pytubefix and the aiohttp stack it pulls in) was
+imported. Run it after changing imports so startup does not creep back up:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 9 --scale 2    # a slower machine
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+# Module -> seconds its import may take, median of cold runs
+BUDGETS = {
+    "cli_main": 0.2,
+    "gui_main": 0.3,
+}
+DEFERRED_MODULES = ("pytubefix", "aiohttp")  # Must not be imported at startup
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, runs):
+    """(median import seconds, deferred modules that got loaded) over fresh interpreters"""
+    times, loaded = [], set()
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", PROBE.format(module=module, deferred=DEFERRED_MODULES)],
+                                   cwd=SRC, stdout=subprocess.PIPE, text=True, check=True)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return statistics.median(times), sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the app's entry points.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module (default: 5)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    parser.add_argument("-m", "--module", action="append", choices=BUDGETS,
+                        help="check only this module; may be repeated (default: all)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in args.module or BUDGETS:
+        budget = BUDGETS[module] * args.scale
+        seconds, loaded = measure(module, max(1, args.runs))
+        print(f"{module:>10}: {seconds * 1000:6.1f} ms (budget {budget * 1000:.0f} ms)"
+              + (f", loaded {', '.join(loaded)}" if loaded else ""))
+        if seconds > budget:
+            failures.append(f"{module} takes {seconds * 1000:.0f} ms to import, budget {budget * 1000:.0f} ms")
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)} at startup")
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
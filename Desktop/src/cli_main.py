@@ -1,41 +1,742 @@
+"""Command-line interface.
+
+Run without arguments for interactive prompts. With arguments it runs
+headless, e.g. from cron or a script:
+
+    python cli_main.py URL [URL ...] [-i FILE|-] [-o DIR] [-f FORMAT] [-b BITRATE] [-j N] [--json]
+
+Playlist URLs are expanded and everything goes through one pipeline,
+so a batch of thousands shares one process, cache and connection pool.
+Playlists are listed page by page as the pipeline asks for more videos,
+so the first download starts before a long playlist is fully listed.
+With --json, progress, one result per item and a final summary are
+printed as JSON lines. Exit status: 0 when every item was downloaded or
+skipped, 1 when any failed, 2 for bad arguments, 130 when interrupted.
+
+Network errors and throttling are retried with backoff (--retries,
+--retry-delay). Videos that still fail are recorded in the output
+folder's ledger, and --retry-failed runs just those again:
+
+    python cli_main.py -o DIR --retry-failed
+
+Every run is written to a crash-safe job journal (journal.py). After
+Ctrl+C, a closed terminal or a crash, --resume continues the interrupted
+runs with their own settings, skipping the videos they already finished
+and trying failed ones again:
+
+    python cli_main.py --resume
+
+A video already encoded with the same settings, for any folder, is
+linked from the content store instead of being downloaded again
+(--no-dedup turns this off, --store picks the store's folder).
+
+--serve runs the background service (service.py), which keeps caches
+and connections warm across jobs; --service hands the batch to it and
+follows its progress, and --detach leaves it running there:
+
+    python cli_main.py --serve &
+    python cli_main.py --service -o DIR URL [URL ...] [--detach]
+    python cli_main.py --list-jobs
+    python cli_main.py --cancel JOB
+"""
 import os
-from pytubefix import YouTube, Playlist
-from moviepy import AudioFileClip
-
-def download_and_convert(video_url, out_folder):
-    try:
-        yt = YouTube(video_url)
-        print(f"🎵 Downloading: {yt.title}")
-        audio_stream = yt.streams.filter(only_audio=True).first()
-        downloaded_path = audio_stream.download(output_path=out_folder)
-        base, _ = os.path.splitext(downloaded_path)
-        mp3_path = base + '.mp3'
-        with AudioFileClip(downloaded_path) as audio_clip:
-            audio_clip.write_audiofile(mp3_path, bitrate="320k")
-        os.remove(downloaded_path)
-        print(f"Done: {yt.title}\n")
-    except Exception as e:
-        print(f"Error downloading {video_url}: {e}")
-
-def process_playlist(playlist_url, out_folder):
-    try:
-        pl = Playlist(playlist_url)
-        print(f"📋 Found {len(pl.video_urls)} videos in playlist.")
-        for url in pl.video_urls:
-            download_and_convert(url, out_folder)
-    except Exception as e:
-        print(f"Error processing playlist: {e}")
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+import downloader
+from pipeline import Pipeline, failure_cause, DEFAULT_CONCURRENCY, MAX_ADAPTIVE_CONCURRENCY
+from encoder import OUTPUT_FORMATS, DEFAULT_FORMAT, DEFAULT_BITRATE
+from selection import SELECTION_POLICIES, DEFAULT_POLICY
+from metacache import MetadataCache, BatchUrls, is_playlist
+import httppool
+import metrics
+import ratelimit
+import retry
+from ledger import Ledger
+from contentstore import ContentStore
+from journal import Journal, COMPLETED, STALE_AFTER
+import service
 
-if __name__ == "__main__":
+PROGRESS_INTERVAL = 1.0  # seconds between --json progress records of one track
+EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_INTERRUPTED = 0, 1, 2, 130
+ITEM_EXIT_CODES = {"done": EXIT_OK, "skipped": EXIT_OK, "failed": EXIT_FAILED, "stopped": EXIT_INTERRUPTED}
+
+STATUS_ICONS = {
+    "fetching": "🔍",
+    "downloading": "🎵",
+    "encoding": "🔄",
+    "retrying": "🔁",
+    "done": "✅",
+    "skipped": "⏭️",
+    "failed": "❌",
+    "stopped": "🛑",
+}
+
+def print_status(track, status, message):
+    icon = STATUS_ICONS.get(status)
+    if not icon:
+        return
+    if status == "fetching":
+        print(f"{icon} Fetching{track.position}: {track.url}")
+    elif status == "failed":
+        print(f"{icon} Error downloading {track.url}: {message}")
+    elif status == "downloading":
+        print(f"{icon} Downloading{track.position}: {track.name} ({message})")
+    elif status == "encoding":
+        print(f"{icon} {message}{track.position}: {track.name}")
+    elif status == "skipped":
+        print(f"{icon} Already downloaded{track.position}: {message}")
+    elif status == "retrying":
+        print(f"{icon} Retrying{track.position} {track.name}: {message}")
+    else:
+        print(f"{icon} {status.capitalize()}{track.position}: {track.name}")
+
+def print_pause(seconds):
+    print(f"⏸️ YouTube keeps rejecting requests; pausing all downloads for {seconds:.0f}s")
+
+def print_queues(pipeline):
+    stats = pipeline.stage_stats()
+    print("📊 Queues: " + ", ".join(
+        f"{stage} {waiting} waiting/{active} active" for stage, (waiting, active) in stats.items()))
+
+def run_pipeline(urls, out_folder, concurrency=DEFAULT_CONCURRENCY, total=None, streaming=True,
+                 output_format=DEFAULT_FORMAT, bitrate=DEFAULT_BITRATE, selection=DEFAULT_POLICY, sync=False,
+                 metadata=None, journal=None, ledger=None):
+    finished = []
+
+    def on_status(track, status, message):
+        print_status(track, status, message)
+        if status in ("done", "skipped", "failed", "stopped"):
+            finished.append(track)
+            if track.total and track.total > 1:
+                print(f"📊 Progress: {len(finished)}/{track.total} finished")
+                print_queues(pipeline)
+
+    pipeline = Pipeline(out_folder, concurrency=concurrency, on_status=on_status, streaming=streaming,
+                        output_format=output_format, bitrate=bitrate, selection=selection, sync=sync,
+                        metadata=metadata, on_pause=print_pause, journal=journal, ledger=ledger,
+                        on_total=lambda count: print(f"📋 Playlist: {count} videos"))
+    try:
+        tracks = pipeline.run(urls, total=total)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping all downloads...")
+        pipeline.stop()
+        if journal:
+            print("⏯️ Run the CLI with --resume to continue where this run stopped.")
+        raise
+
+    print(f"🔌 {pipeline.http.describe()}")
+    if pipeline.store and pipeline.store.hits:
+        print(f"♻️ {pipeline.store.describe()}")
+    print(f"📝 Event log: {pipeline.event_log.path}")
+    skipped = sum(1 for track in tracks if track.status == "skipped")
+    if skipped:
+        print(f"⏭️ {skipped} video(s) already downloaded, skipped")
+    failed = [track for track in tracks if track.status == "failed"]
+    if failed:
+        print(f"❌ {len(failed)} video(s) failed:")
+        for track in failed:
+            print(f"   {track.url}")
+        print("🔁 Run the CLI with --retry-failed to retry only these.")
+    return not failed
+
+def download_and_convert(video_url, out_folder, streaming=True, output_format=DEFAULT_FORMAT,
+                         bitrate=DEFAULT_BITRATE, selection=DEFAULT_POLICY, sync=False, journal=None):
+    return run_pipeline([video_url], out_folder, concurrency=1, streaming=streaming,
+                        output_format=output_format, bitrate=bitrate, selection=selection, sync=sync,
+                        journal=journal)
+
+def process_playlist(playlist_url, out_folder, concurrency=DEFAULT_CONCURRENCY, streaming=True,
+                     output_format=DEFAULT_FORMAT, bitrate=DEFAULT_BITRATE, selection=DEFAULT_POLICY, sync=False,
+                     journal=None):
+    listing_errors = []
+
+    def on_playlist(url, count):
+        ledger.forget_failure(url)
+
+    def on_playlist_error(url, error):
+        # Reported like a failed video, and the videos listed until then still run
+        print(f"❌ Error reading playlist {url}: {error}", file=sys.stderr)
+        listing_errors.append(error)
+        ledger.record_failure(url, error=str(error), cause=failure_cause(error))
+
+    metadata = MetadataCache()
+    ledger = Ledger.for_folder(out_folder)
+    try:
+        # One HTTP session, so the playlist lookup shares connections with the downloads
+        with httppool.session():
+            video_urls = BatchUrls([playlist_url], metadata, on_playlist=on_playlist, on_error=on_playlist_error)
+            print(f"⚡ Downloading up to {concurrency} videos at a time.")
+            succeeded = run_pipeline(video_urls, out_folder, concurrency, streaming=streaming,
+                                     output_format=output_format, bitrate=bitrate, selection=selection, sync=sync,
+                                     metadata=metadata, journal=journal, ledger=ledger)
+            if listing_errors:
+                print("🔁 Run the CLI with --retry-failed to retry the playlist.")
+            return succeeded and not listing_errors
+    finally:
+        metadata.close()
+        ledger.close()
+
+class JsonLines:
+    """Thread-safe writer of one JSON record per line to stdout"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def unique(urls, key=lambda url: url):
+    seen = set()
+    return [url for url in urls if not (key(url) in seen or seen.add(key(url)))]
+
+
+def read_urls(args):
+    """URLs from the command line followed by those in --input, in order and without duplicates"""
+    urls = list(args.urls)
+    sources = list(args.input)
+    if not urls and not sources and not args.retry_failed and not sys.stdin.isatty():
+        sources = ["-"]
+    for source in sources:
+        fh = sys.stdin if source == "-" else open(source, encoding="utf-8")
+        try:
+            urls.extend(line.strip() for line in fh)
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+    return unique(url for url in urls if url and not url.startswith("#"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download YouTube videos and playlists as audio files.",
+        epilog="Without any arguments the CLI asks for everything interactively.")
+    parser.add_argument("urls", nargs="*", metavar="URL", help="video or playlist URLs")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="FILE",
+                        help="read URLs from FILE, one per line ('-' for stdin; blank lines and # comments "
+                             "are ignored); may be repeated. Read from stdin when no URL is given and it is a pipe")
+    parser.add_argument("-o", "--output", default="downloads", metavar="DIR",
+                        help="output folder (default: downloads)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help=f"output format (default: {DEFAULT_FORMAT})")
+    parser.add_argument("-b", "--bitrate", default=DEFAULT_BITRATE,
+                        help=f"bitrate in kbit/s, e.g. 192 or 192k (default: {DEFAULT_BITRATE})")
+    parser.add_argument("-s", "--selection", choices=SELECTION_POLICIES, default=DEFAULT_POLICY,
+                        help=f"source stream policy (default: {DEFAULT_POLICY})")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, metavar="N",
+                        help=f"videos downloaded at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--connections", type=int, default=downloader.DEFAULT_CONNECTIONS, metavar="N",
+                        help=f"parallel connections per large download (default: {downloader.DEFAULT_CONNECTIONS})")
+    parser.add_argument("--limit-rate", default="0", metavar="RATE",
+                        help="total download rate limit, e.g. 500K or 2M bytes/s (default: unlimited)")
+    parser.add_argument("--limit-schedule", metavar="SPEC",
+                        help="rate limits by time of day, e.g. '09:00-18:00=2M,22:00-06:00=0'; "
+                             "other times use --limit-rate")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adjust the number of simultaneous downloads to the measured throughput, "
+                             "backing off on errors or throttling")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_ADAPTIVE_CONCURRENCY, metavar="N",
+                        help=f"upper bound for --adaptive (default: {MAX_ADAPTIVE_CONCURRENCY})")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false",
+                        help="download to a temporary file before encoding")
+    parser.add_argument("--sync", action="store_true",
+                        help="skip videos already downloaded to the output folder")
+    parser.add_argument("--retries", type=int, default=retry.DEFAULT_RETRIES, metavar="N",
+                        help=f"retries of a video after a network error or throttling; permanent errors "
+                             f"such as a private video are not retried (default: {retry.DEFAULT_RETRIES})")
+    parser.add_argument("--retry-delay", type=float, default=retry.DEFAULT_BASE_DELAY, metavar="SECONDS",
+                        help=f"wait before the first retry, doubled for each further one, with jitter "
+                             f"(default: {retry.DEFAULT_BASE_DELAY:g})")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="also process every URL that failed in earlier runs into the output folder "
+                             "and has not succeeded since")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the runs that were interrupted or crashed, each with its own URLs, "
+                             "output folder and settings, skipping the videos they already finished")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false",
+                        help="always download and encode, even if the content store already has the video "
+                             "in the same format and bitrate")
+    parser.add_argument("--store", metavar="DIR",
+                        help="content store folder; keep it on the same drive as the output so files can be "
+                             "hardlinked or cloned (default: $YTMD_STORE_DIR or the user cache folder)")
+    parser.add_argument("--json", action="store_true",
+                        help="print progress, per-item results and a summary as JSON lines")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help=f"serve Prometheus metrics at http://127.0.0.1:PORT/metrics "
+                             f"(default: ${metrics.METRICS_PORT_ENV})")
+    parser.add_argument("--metrics-json", metavar="FILE",
+                        help=f"write a JSON snapshot of the metrics to FILE periodically and at the end "
+                             f"(default: ${metrics.METRICS_JSON_ENV})")
+    parser.add_argument("--metrics-interval", type=float, default=metrics.DEFAULT_SNAPSHOT_INTERVAL,
+                        metavar="SECONDS", help=f"seconds between JSON snapshots "
+                                                f"(default: {metrics.DEFAULT_SNAPSHOT_INTERVAL})")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the background download service until interrupted; other runs hand it "
+                             "jobs with --service and keep its caches and connections warm")
+    parser.add_argument("--port", type=int, default=0, metavar="PORT",
+                        help="port of --serve on 127.0.0.1; clients find it in the user cache folder "
+                             "(default: any free port)")
+    parser.add_argument("--parallel-jobs", type=int, default=service.DEFAULT_JOBS, metavar="N",
+                        help=f"jobs --serve runs at once (default: {service.DEFAULT_JOBS})")
+    parser.add_argument("--service", action="store_true",
+                        help="hand the batch to the running background service and follow it, Ctrl+C "
+                             "cancelling the job; the service's content store and rate limits apply")
+    parser.add_argument("--detach", action="store_true",
+                        help="with --service, return as soon as the job is queued")
+    parser.add_argument("--list-jobs", action="store_true",
+                        help="show the jobs of the background service and how far they got")
+    parser.add_argument("--cancel", metavar="JOB", help="cancel a job of the background service")
+    args = parser.parse_args(argv)
+
+    bitrate = args.bitrate.strip().lower().rstrip("k")
+    if not bitrate.isdigit() or int(bitrate) <= 0:
+        parser.error(f"invalid bitrate: {args.bitrate}")
+    args.bitrate = f"{bitrate}k"
+    if args.concurrency < 1 or args.connections < 1:
+        parser.error("--concurrency and --connections must be at least 1")
+    if args.retries < 0 or args.retry_delay < 0:
+        parser.error("--retries and --retry-delay cannot be negative")
+    if args.detach and not args.service:
+        parser.error("--detach needs --service")
+    if args.serve and (args.urls or args.input or args.service or args.retry_failed):
+        parser.error("--serve takes no URLs; submit them from another run with --service")
+    if args.resume and (args.urls or args.input or args.retry_failed or args.service or args.serve):
+        parser.error("--resume takes no URLs; it continues interrupted runs with their own settings")
+    if args.parallel_jobs < 1 or not 0 <= args.port <= 65535:
+        parser.error("--parallel-jobs must be at least 1 and --port between 0 and 65535")
+    try:
+        args.limit_rate = ratelimit.parse_rate(args.limit_rate)
+        args.limit_schedule = ratelimit.RateSchedule(args.limit_schedule) if args.limit_schedule else None
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main(args):
+    """Run a headless invocation; returns the exit status"""
+    if args.serve:
+        return run_service(args)
+    if args.list_jobs or args.cancel:
+        return manage_jobs(args)
+    return run_batch(args)
+
+
+def run_batch(args):
+    """Run every URL of a headless invocation through one pipeline; returns the exit status"""
+    out = JsonLines() if args.json else None
+    started = time.time()
+    if args.service:
+        return _run_urls(args, out, started, None)
+    journal = Journal()  # The service journals the jobs it runs itself
+    try:
+        return _run_urls(args, out, started, journal)
+    finally:
+        journal.close()
+
+
+def _run_urls(args, out, started, journal):
+    if args.resume:
+        batches = resumed_batches(args, journal)
+        if not batches:
+            print(f"No interrupted runs to resume; a run that crashed can be resumed {STALE_AFTER:.0f}s later.",
+                  file=sys.stderr)
+            return EXIT_OK
+    else:
+        try:
+            urls = read_urls(args)
+        except OSError as e:
+            print(f"Cannot read URLs: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        os.makedirs(args.output, exist_ok=True)
+        if args.retry_failed:
+            ledger = Ledger.for_folder(args.output)
+            try:
+                urls = unique(urls + ledger.failed_urls())
+            finally:
+                ledger.close()
+            if not urls:
+                print(f"No recorded failures in {args.output}.", file=sys.stderr)
+                return EXIT_OK
+        if not urls:
+            print("No URLs given.", file=sys.stderr)
+            return EXIT_USAGE
+        batches = [(args, urls, None)]
+    ratelimit.limiter.configure(args.limit_rate, schedule=args.limit_schedule)
+
+    try:
+        metrics_server, metrics_writer = metrics.start_exports(args.metrics_port, args.metrics_json,
+                                                               args.metrics_interval)
+    except (OSError, ValueError) as e:
+        print(f"Cannot export metrics: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        exit_code = EXIT_OK
+        for batch_args, urls, journal_job in batches:
+            code = _run_batch(batch_args, urls, out, started, journal, journal_job)
+            if code == EXIT_INTERRUPTED:
+                return code
+            exit_code = max(exit_code, code)
+            started = time.time()
+        return exit_code
+    finally:
+        if metrics_writer:
+            metrics_writer.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+
+
+def job_options(args):
+    """The download settings of a batch, as the service and the job journal take them"""
+    return {"output": os.path.abspath(args.output), "format": args.format, "bitrate": args.bitrate,
+            "selection": args.selection, "concurrency": args.concurrency, "connections": args.connections,
+            "streaming": args.streaming, "sync": args.sync, "adaptive": args.adaptive,
+            "max_concurrency": args.max_concurrency, "retries": args.retries,
+            "retry_delay": args.retry_delay, "dedup": args.dedup}
+
+
+def resumed_batches(args, journal):
+    """(args, URLs, journal job) of every interrupted run this process claimed from the journal"""
+    batches = []
+    for job in journal.resumable("cli"):
+        journal_job = journal.claim(job["id"])
+        if journal_job is None:
+            continue  # Another --resume got to it first
+        # Settings missing from the journal, such as those of interactive runs, come from this run
+        batch_args = argparse.Namespace(**{**vars(args), **job["options"]})
+        os.makedirs(batch_args.output, exist_ok=True)
+        finished = sum(count for status, count in job["counts"].items() if status in COMPLETED)
+        print(f"⏯️ Resuming a run from {time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at']))}: "
+              f"{len(job['urls'])} URL(s) into {batch_args.output}, {finished} video(s) already finished",
+              file=sys.stderr)
+        batches.append((batch_args, job["urls"], journal_job))
+    return batches
+
+
+def _run_batch(args, urls, out, started, journal=None, journal_job=None):
+    results = []  # Final status of every item, including playlists that could not be read
+    last_progress = {}
+    ledger = None  # The service keeps the ledger of the batches it runs
+
+    def result(url, status, **fields):
+        results.append(status)
+        if out:
+            out.emit("result", url=url, status=status, exit_code=ITEM_EXIT_CODES[status], **fields)
+
+    def on_status(track, status, message):
+        if out:
+            out.emit("status", index=track.index, total=track.total, url=track.url, status=status,
+                     video_id=track.video_id, title=track.title, message=message)
+        else:
+            print_status(track, status, message)
+        if status in ITEM_EXIT_CODES:
+            result(track.url, status, index=track.index, video_id=track.video_id, title=track.title,
+                   output=track.output_path if status in ("done", "skipped") else None,
+                   error=message if status == "failed" else None)
+
+    def on_progress(track, stream, chunk, bytes_remaining):
+        now = time.time()
+        if now - last_progress.get(track.index, 0) < PROGRESS_INTERVAL and bytes_remaining:
+            return
+        last_progress[track.index] = now
+        out.emit("progress", index=track.index, url=track.url,
+                 bytes=stream.filesize - bytes_remaining, size=stream.filesize)
+
+    def on_pause(seconds):
+        if out:
+            out.emit("paused", seconds=round(seconds, 1))
+        else:
+            print_pause(seconds)
+
+    def on_total(total):
+        if out:
+            out.emit("total", total=total)
+
+    def on_playlist(url, count):
+        if ledger:
+            ledger.forget_failure(url)
+        if out:
+            out.emit("playlist", url=url, videos=count)
+        else:
+            print(f"📋 Listed {count} videos in playlist {url}")
+
+    def on_playlist_error(url, error):
+        if not out:
+            print(f"❌ Error reading playlist {url}: {error}", file=sys.stderr)
+        result(url, "failed", error=str(error))
+        if ledger:
+            ledger.record_failure(url, error=str(error), cause=failure_cause(error))
+
+    if args.service:
+        return _run_on_service(args, urls, out, started, results, dict(
+            on_status=on_status, on_progress=on_progress if out else None, on_pause=on_pause,
+            on_total=on_total, on_playlist=on_playlist, on_playlist_error=on_playlist_error))
+
+    if journal_job is None:
+        journal_job = journal.start(urls, job_options(args), "cli")
+    metadata = MetadataCache()
+    ledger = Ledger.for_folder(args.output)
+    store = ContentStore(args.store) if args.dedup else None
+    pipeline = None
+    try:
+        with httppool.session() as http:
+            if len(urls) > 1 or is_playlist(urls[0]):
+                video_urls = BatchUrls(urls, metadata, on_playlist=on_playlist, on_error=on_playlist_error)
+            else:
+                video_urls = urls  # A single video has no total
+            pipeline = Pipeline(args.output, concurrency=args.concurrency, on_status=on_status,
+                                on_progress=on_progress if out else None, streaming=args.streaming,
+                                output_format=args.format, bitrate=args.bitrate, selection=args.selection,
+                                sync=args.sync, metadata=metadata, connections=args.connections,
+                                adaptive=args.adaptive, max_concurrency=args.max_concurrency,
+                                ledger=ledger, on_pause=on_pause, on_total=on_total,
+                                dedup=args.dedup, store=store,
+                                retry_policy=retry.RetryPolicy(args.retries, args.retry_delay),
+                                journal=journal_job)
+            pipeline.run(video_urls)
+    except KeyboardInterrupt:
+        # Pipeline.run re-raises Ctrl+C only once its stages stopped and cleaned up, so the
+        # ledger, caches and journal below are closed after the last worker wrote to them
+        if pipeline:
+            pipeline.stop()
+        if out:
+            out.emit("summary", interrupted=True, elapsed=round(time.time() - started, 3), job=journal_job.id)
+        else:
+            print("\n🛑 Stopped. Run with --resume to continue where this run stopped.")
+        return EXIT_INTERRUPTED
+    finally:
+        metadata.close()
+        ledger.close()
+        if store:
+            store.close()
+
+    counts, exit_code = _outcome(results)
+    if out:
+        out.emit("summary", items=len(results), **counts, elapsed=round(time.time() - started, 3),
+                 resumed=journal_job.resumed, http=http.stats(), store=store.stats() if store else None,
+                 event_log=pipeline.event_log.path, exit_code=exit_code)
+    else:
+        if journal_job.resumed:
+            print(f"⏯️ {journal_job.resumed} video(s) finished by the interrupted run, skipped")
+        print_outcome(counts, started)
+        print(f"🔌 {http.describe()}")
+        if store:
+            print(f"♻️ {store.describe()}")
+        print(f"📝 Event log: {pipeline.event_log.path}")
+    return exit_code
+
+
+def _outcome(results):
+    """(count of each final status, exit status) of a batch's results"""
+    counts = {status: results.count(status) for status in ITEM_EXIT_CODES}
+    return counts, EXIT_FAILED if counts["failed"] else EXIT_INTERRUPTED if counts["stopped"] else EXIT_OK
+
+
+def print_outcome(counts, started):
+    print(f"🏁 {counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed "
+          f"in {time.time() - started:.1f}s")
+    if counts["failed"]:
+        print("🔁 Add --retry-failed to the next run to retry the failed items.")
+
+
+def find_service():
+    client = service.Client.discover()
+    if client is None:
+        print("No background service is running; start one with --serve.", file=sys.stderr)
+    return client
+
+
+def _run_on_service(args, urls, out, started, results, callbacks):
+    client = find_service()
+    if client is None:
+        return EXIT_USAGE
+    job = None
+    try:
+        job = client.submit(urls, job_options(args))
+        if out:
+            out.emit("job", **job)
+        else:
+            print(f"🛰️ Job {job['id']} queued on the background service")
+        if args.detach:
+            return EXIT_OK
+        job = client.follow(job["id"], **callbacks)
+    except KeyboardInterrupt:
+        if job:
+            try:
+                client.cancel(job["id"])
+            except (OSError, service.ServiceError):
+                pass
+        if out:
+            out.emit("summary", interrupted=True, elapsed=round(time.time() - started, 3))
+        else:
+            print("\n🛑 Cancelled the job.")
+        return EXIT_INTERRUPTED
+    except (OSError, service.ServiceError) as e:
+        print(f"Background service: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    counts, exit_code = _outcome(results)
+    if job["error"]:
+        exit_code = EXIT_FAILED
+    if out:
+        out.emit("summary", items=len(results), **counts, elapsed=round(time.time() - started, 3),
+                 job=job["id"], state=job["state"], error=job["error"], exit_code=exit_code)
+    else:
+        if job["error"]:
+            print(f"❌ Job {job['id']} failed: {job['error']}")
+        print_outcome(counts, started)
+    return exit_code
+
+
+def describe_job(job):
+    counts = job["counts"]
+    total = job["total"] if job["total"] is not None else "?"
+    return (f"{job['id']}  {job['state']:<9}  {sum(counts.values())}/{total} finished "
+            f"({counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed)  {job['output']}")
+
+
+def manage_jobs(args):
+    """--list-jobs or --cancel against the background service; returns the exit status"""
+    out = JsonLines() if args.json else None
+    client = find_service()
+    if client is None:
+        return EXIT_USAGE
+    try:
+        jobs = [client.cancel(args.cancel)] if args.cancel else client.jobs()
+    except (OSError, service.ServiceError) as e:
+        print(f"Background service: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    for job in jobs:
+        if out:
+            out.emit("job", **job)
+        else:
+            print(describe_job(job))
+    if not jobs and not out:
+        print("The background service has no jobs.")
+    return EXIT_OK
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_service(args):
+    """Run the background service until interrupted or terminated; returns the exit status"""
+    if service.Client.discover():
+        print("A background service is already running.", file=sys.stderr)
+        return EXIT_USAGE
+    out = JsonLines() if args.json else None
+    ratelimit.limiter.configure(args.limit_rate, schedule=args.limit_schedule)
+
+    def on_status(job, track, status, message):
+        if out:
+            out.emit("status", job=job.id, index=track.index, total=track.total, url=track.url, status=status,
+                     video_id=track.video_id, title=track.title, message=message)
+        else:
+            print_status(track, status, message)
+
+    def on_job(job):
+        if out:
+            out.emit("job", **job.summary())
+        else:
+            print(f"🛰️ Job {job.id} {job.state}: {len(job.urls)} URL(s) into {job.options['output']}"
+                  + (f" ({job.error})" if job.error else ""))
+
+    try:
+        metrics_server, metrics_writer = metrics.start_exports(args.metrics_port, args.metrics_json,
+                                                               args.metrics_interval)
+    except (OSError, ValueError) as e:
+        print(f"Cannot export metrics: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    daemon = service.Service(args.parallel_jobs, args.store, on_status=on_status, on_job=on_job).start()
+    server = None
+    # An init system stops the service with SIGTERM; wind down as on Ctrl+C
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        server = service.serve(daemon, args.port)
+        if out:
+            out.emit("listening", url=server.url, state=server.state_path)
+        else:
+            print(f"🛰️ Background service listening at {server.url}; hand it jobs with --service")
+        while True:
+            time.sleep(3600)
+    except OSError as e:
+        print(f"Cannot start the service: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        if not out:
+            print("\n🛑 Stopping the service...")
+    finally:
+        if server:
+            server.shutdown()
+        daemon.close()
+        if metrics_writer:
+            metrics_writer.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+    return EXIT_OK
+
+
+def interactive():
+    """Ask for a URL and settings, then download; returns the exit status"""
+    journal = Journal()
+    if journal.resumable("cli"):
+        print("⏯️ An earlier run was interrupted; run the CLI with --resume to continue it.")
     url = input("Enter YouTube video or playlist URL: ").strip()
     out_folder = input("Enter output folder (default: downloads): ").strip() or "downloads"
     os.makedirs(out_folder, exist_ok=True)
 
     if not url.startswith("http"):
-        print("Please enter a valid YouTube URL.")
-        exit()
+        print("Please enter a valid YouTube URL.", file=sys.stderr)
+        return EXIT_USAGE
 
-    if "playlist" in url or "list=" in url:
-        process_playlist(url, out_folder)
-    else:
-        download_and_convert(url, out_folder)
+    output_format = input(f"Output format [{'/'.join(OUTPUT_FORMATS)}] (default: {DEFAULT_FORMAT}): ").strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        output_format = DEFAULT_FORMAT
+    bitrate = input(f"Bitrate in kbit/s (default: {DEFAULT_BITRATE}): ").strip().lower().rstrip("k")
+    bitrate = f"{bitrate}k" if bitrate.isdigit() else DEFAULT_BITRATE
+    selection = input(f"Source stream [{'/'.join(SELECTION_POLICIES)}] (default: {DEFAULT_POLICY}): ").strip().lower()
+    if selection not in SELECTION_POLICIES:
+        selection = DEFAULT_POLICY
+    streaming = input("Stream audio straight into the encoder, without temp files? (Y/n): ").strip().lower() != "n"
+    sync = input("Skip videos already downloaded to this folder (sync)? (y/N): ").strip().lower() == "y"
+
+    options = {"output": os.path.abspath(out_folder), "format": output_format, "bitrate": bitrate,
+               "selection": selection, "streaming": streaming, "sync": sync}
+    try:
+        if is_playlist(url):
+            concurrency = input(f"Parallel downloads (default: {DEFAULT_CONCURRENCY}): ").strip()
+            concurrency = int(concurrency) if concurrency.isdigit() and int(concurrency) > 0 else DEFAULT_CONCURRENCY
+            journal_job = journal.start([url], {**options, "concurrency": concurrency}, "cli")
+            succeeded = process_playlist(url, out_folder, concurrency, streaming, output_format, bitrate,
+                                         selection, sync, journal=journal_job)
+        else:
+            journal_job = journal.start([url], {**options, "concurrency": 1}, "cli")
+            succeeded = download_and_convert(url, out_folder, streaming, output_format, bitrate, selection, sync,
+                                             journal=journal_job)
+        return EXIT_OK if succeeded else EXIT_FAILED
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        journal.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 or not sys.stdin.isatty():
+        sys.exit(main(parse_args()))
+    # Interactive runs export metrics only when the environment asks for it
+    _, metrics_writer = metrics.start_exports()
+    try:
+        sys.exit(interactive())
+    finally:
+        if metrics_writer:
+            metrics_writer.stop()
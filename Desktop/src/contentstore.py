@@ -0,0 +1,210 @@
+"""Content-addressed store of finished outputs, shared by every output folder.
+
+Each encoded file is added under its sha256 and indexed by video ID and
+encode profile (output format, bitrate and stream selection policy).
+When the same video is asked for again with the same profile, in any
+playlist or folder, the pipeline materializes the stored file instead of
+downloading and encoding it again: as a reflink (copy-on-write clone)
+where the file system supports it, else as a hardlink, else as a copy.
+
+Objects are added only by reflink or hardlink, so the store never costs
+extra disk space; an output on another file system than the store is
+simply not added. Keep the store (YTMD_STORE_DIR) on the same drive as
+the music to get hits. A hardlinked file shares its data with the store,
+so an object whose size or modification time changed (e.g. tags edited
+in place) is dropped instead of being handed out.
+
+hits, misses and bytes_saved count the lookups of one store; the same
+numbers are in the metrics registry.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import metrics
+from ledger import file_checksum
+from metacache import default_cache_path
+
+STORE_DIR_ENV = "YTMD_STORE_DIR"
+FICLONE = 0x40049409  # Linux ioctl that clones a file's extents (btrfs, XFS, ...)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    video_id  TEXT NOT NULL,
+    profile   TEXT NOT NULL,  -- e.g. "mp3/320k/match"
+    checksum  TEXT NOT NULL,  -- sha256, also the object's file name
+    extension TEXT NOT NULL,
+    filename  TEXT NOT NULL,  -- name of the output it was added from
+    title     TEXT,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    added_at  REAL NOT NULL,
+    PRIMARY KEY (video_id, profile)
+)
+"""
+
+LOOKUPS = metrics.registry.counter(
+    "ytmd_store_lookups_total", "Content store lookups by result (hit or miss)")
+BYTES_SAVED = metrics.registry.counter(
+    "ytmd_store_bytes_saved_total", "Bytes of outputs served from the content store, by method")
+
+
+def default_store_dir():
+    return os.environ.get(STORE_DIR_ENV) or os.path.join(os.path.dirname(default_cache_path()), "store")
+
+
+def profile_key(output_format, bitrate, selection):
+    return f"{output_format}/{bitrate}/{selection}"
+
+
+def reflink(source, target):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link(source, target, methods=("reflink", "hardlink", "copy")):
+    """Make target a copy of source by the first method that works; returns its name.
+
+    The file appears at target atomically, replacing any earlier one, and
+    an earlier target is never written to in place.
+    """
+    temp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    for method in methods:
+        try:
+            if method == "reflink":
+                reflink(source, temp_path)
+            elif method == "hardlink":
+                os.link(source, temp_path)
+            else:
+                shutil.copyfile(source, temp_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            continue
+        os.replace(temp_path, target)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)  # rename() does nothing when both are links to the same file
+        return method
+    raise OSError(f"Could not link {source} to {target}")
+
+
+class ContentStore:
+    """Thread-safe store of encoded files keyed by (video ID, encode profile)"""
+
+    def __init__(self, folder=None):
+        self.folder = folder or default_store_dir()
+        self.objects = os.path.join(self.folder, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        # The GUI and CLI may share the index, so wait for the other's write lock
+        self._db = sqlite3.connect(os.path.join(self.folder, "index.sqlite3"), timeout=10,
+                                   check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute(SCHEMA)
+
+    def object_path(self, checksum, extension):
+        return os.path.join(self.objects, checksum[:2], checksum + extension)
+
+    def lookup(self, video_id, profile):
+        """The entry for a video and profile if its object is intact, else None; counts a hit or miss"""
+        entry = None
+        if video_id:
+            with self._lock:
+                row = self._db.execute("SELECT * FROM objects WHERE video_id = ? AND profile = ?",
+                                       (video_id, profile)).fetchone()
+            entry = dict(row) if row else None
+        if entry:
+            entry["path"] = self.object_path(entry["checksum"], entry["extension"])
+            try:
+                stat = os.stat(entry["path"])
+                intact = stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+            except OSError:
+                intact = False
+            if not intact:
+                self._drop(entry)
+                entry = None
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        LOOKUPS.inc(result="hit" if entry else "miss")
+        return entry
+
+    def materialize(self, entry, target):
+        """Put the object of a lookup() entry at target; returns the method used"""
+        method = link(entry["path"], target)
+        with self._lock:
+            self.bytes_saved += entry["size"]
+        BYTES_SAVED.inc(entry["size"], method=method)
+        return method
+
+    def add(self, video_id, profile, output_path, title=None):
+        """Add a finished output and return its sha256 checksum; only kept if it can be linked"""
+        checksum = file_checksum(output_path)
+        extension = os.path.splitext(output_path)[1]
+        path = self.object_path(checksum, extension)
+        if not self._trusted(checksum, path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                link(output_path, path, methods=("reflink", "hardlink"))
+            except OSError:
+                return checksum  # Another file system; a copy would double the space used
+        stat = os.stat(path)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects "
+                "(video_id, profile, checksum, extension, filename, title, size, mtime_ns, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, profile, checksum, extension, os.path.basename(output_path), title,
+                 stat.st_size, stat.st_mtime_ns, time.time()))
+        return checksum
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved}
+
+    def describe(self):
+        stats = self.stats()
+        return (f"Store: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['bytes_saved'] / (1024 * 1024):.1f} MB saved")
+
+    def _trusted(self, checksum, path):
+        """Whether an object exists as it was indexed; a changed one is replaced by the next add"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM objects WHERE checksum = ? AND size = ? AND mtime_ns = ?",
+                                   (checksum, stat.st_size, stat.st_mtime_ns)).fetchone()
+        return row is not None
+
+    def _drop(self, entry):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM objects WHERE video_id = ? AND profile = ?",
+                             (entry["video_id"], entry["profile"]))
+            still_used = self._db.execute("SELECT 1 FROM objects WHERE checksum = ?",
+                                          (entry["checksum"],)).fetchone()
+        if not still_used:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
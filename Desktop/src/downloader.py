@@ -0,0 +1,238 @@
+"""HTTP download of audio streams with byte-range resume.
+
+Files are written to "<name>.part" next to a "<name>.part.json" sidecar
+that records which stream the bytes belong to. A download that was
+stopped, crashed or lost its connection continues from the end of the
+.part file with HTTP Range requests instead of starting from byte zero.
+
+Large streams are fetched as SEGMENT_SIZE byte ranges over several
+parallel connections and reassembled in order, so per-connection
+throttling no longer caps the speed. Only a small window of segments is
+in flight or buffered at a time, and the bytes still arrive in order,
+so resuming and streaming into ffmpeg work the same as with one
+connection.
+
+Every block read counts against the process-wide bandwidth limit
+(ratelimit.limiter).
+"""
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import metrics
+import ratelimit
+
+RANGE_SIZE = 9 * 1024 * 1024  # googlevideo throttles larger single ranges
+CHUNK_SIZE = 64 * 1024
+SEGMENT_SIZE = 2 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+MAX_RECONNECTS = 5
+TIMEOUT = 30
+HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+RECONNECTS = metrics.registry.counter(
+    "ytmd_download_reconnects_total", "Range requests retried after a dropped connection or error, by cause")
+
+
+def is_transient(error):
+    """True for errors worth reconnecting for: dropped connections, timeouts, 5xx/429"""
+    if isinstance(error, HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return isinstance(error, (URLError, http.client.HTTPException, ConnectionError, socket.timeout))
+
+
+def iter_range(url, start, end):
+    """Yield the bytes start..end (inclusive) of url from one Range request"""
+    request = Request(url, headers={**HEADERS, "Range": f"bytes={start}-{end}"})
+    with urlopen(request, timeout=TIMEOUT) as response:
+        remaining = end - start + 1
+        if response.status == 200 and start > 0:
+            # The server ignored Range and sent the whole file; skip to our offset
+            skip = start
+            while skip > 0:
+                skipped = len(response.read(min(CHUNK_SIZE, skip)))
+                if not skipped:
+                    return
+                skip -= skipped
+        while remaining > 0:
+            # read1 returns what has arrived instead of blocking for a full chunk
+            chunk = response.read1(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise http.client.IncompleteRead(b"", remaining)
+            remaining -= len(chunk)
+            ratelimit.limiter.consume(len(chunk))
+            yield chunk
+
+
+def iter_span(url, start, end, on_reconnect=None):
+    """Yield the bytes start..end (inclusive) of url in RANGE_SIZE requests.
+
+    A dropped connection is picked up again at the last received byte,
+    up to MAX_RECONNECTS times in a row; on_reconnect() is called for each.
+    """
+    offset = start
+    reconnects = 0
+    while offset <= end:
+        range_end = min(offset + RANGE_SIZE - 1, end)
+        try:
+            for chunk in iter_range(url, offset, range_end):
+                offset += len(chunk)
+                reconnects = 0
+                yield chunk
+        except Exception as e:
+            if not is_transient(e) or reconnects >= MAX_RECONNECTS:
+                raise
+            RECONNECTS.inc(cause=f"http_{e.code}" if isinstance(e, HTTPError) else "network")
+            if on_reconnect:
+                on_reconnect()
+            reconnects += 1
+            time.sleep(min(2 ** reconnects, 30))
+
+
+def _fetch_segment(url, start, end, out, cancelled, on_reconnect=None):
+    """Put the segment's chunks on out, then None; or the exception that ended it"""
+    try:
+        for chunk in iter_span(url, start, end, on_reconnect):
+            if cancelled.is_set():
+                return
+            out.put(chunk)
+        out.put(None)
+    except BaseException as e:
+        out.put(e)
+
+
+def iter_segments(url, start, size, connections=DEFAULT_CONNECTIONS, on_reconnect=None):
+    """Yield url's bytes from start to size, fetched as SEGMENT_SIZE ranges in parallel.
+
+    Up to `connections` segments download at once and as many again are
+    queued behind them. Chunks are yielded strictly in order: the oldest
+    segment's chunks as they arrive, later ones from memory once it is done.
+    """
+    offsets = iter(range(start, size, SEGMENT_SIZE))
+    pool = ThreadPoolExecutor(max_workers=connections, thread_name_prefix="segment")
+    cancelled = threading.Event()
+    pending = deque()
+
+    def submit_next():
+        offset = next(offsets, None)
+        if offset is not None:
+            out = queue.Queue()
+            end = min(offset + SEGMENT_SIZE, size) - 1
+            pending.append(out)
+            pool.submit(_fetch_segment, url, offset, end, out, cancelled, on_reconnect)
+
+    try:
+        for _ in range(connections * 2):
+            submit_next()
+        while pending:
+            out = pending.popleft()
+            while True:
+                chunk = out.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+            submit_next()
+    finally:
+        # Stopped or failed: running segments give up at their next chunk
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_stream(stream, start=0, connections=DEFAULT_CONNECTIONS, on_reconnect=None):
+    """Yield a pytubefix stream's bytes from `start` to the end, in order.
+
+    Progress goes through the stream's on_progress callback, exactly like
+    Stream.download(), always from the calling thread. Streams with at
+    least two segments left are fetched over `connections` connections.
+    on_reconnect() is called, from any thread, for every reconnect.
+    """
+    size = stream.filesize
+    if connections > 1 and size - start >= 2 * SEGMENT_SIZE:
+        chunks = iter_segments(stream.url, start, size, connections, on_reconnect)
+    else:
+        chunks = iter_span(stream.url, start, size - 1, on_reconnect)
+    offset = start
+    try:
+        for chunk in chunks:
+            offset += len(chunk)
+            stream.on_progress_for_chunks(chunk, size - offset)
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _read_state(state_path):
+    try:
+        with open(state_path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state_path, state):
+    with open(state_path, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+
+
+def _identity(stream, video_id):
+    return {"video_id": video_id, "itag": stream.itag, "filesize": stream.filesize}
+
+
+def resume_offset(stream, file_path, video_id=None):
+    """Bytes of this stream already in file_path's .part file, 0 if there is nothing to resume.
+
+    A .part file whose sidecar describes a different stream (another
+    video, itag or size) is not resumable and will be overwritten.
+    """
+    part_path = file_path + PART_SUFFIX
+    state = _read_state(file_path + STATE_SUFFIX)
+    if not os.path.exists(part_path) or not state or state.get("stream") != _identity(stream, video_id):
+        return 0
+    return min(os.path.getsize(part_path), stream.filesize)
+
+
+def download(stream, file_path, video_id=None, connections=DEFAULT_CONNECTIONS, on_reconnect=None):
+    """Download a stream to file_path, resuming a matching .part file if one exists.
+
+    Returns the number of bytes that were already on disk from an earlier
+    attempt. On any error the .part file and its sidecar are kept so the
+    next attempt can resume.
+    """
+    part_path = file_path + PART_SUFFIX
+    state_path = file_path + STATE_SUFFIX
+    identity = _identity(stream, video_id)
+
+    offset = resume_offset(stream, file_path, video_id)
+    _write_state(state_path, {"stream": identity, "downloaded": offset})
+
+    with open(part_path, "r+b" if offset else "wb") as fh:
+        fh.seek(offset)
+        fh.truncate()
+        written = offset
+        try:
+            for chunk in iter_stream(stream, offset, connections, on_reconnect):
+                fh.write(chunk)
+                written += len(chunk)
+                if written % RANGE_SIZE < len(chunk):
+                    fh.flush()
+                    _write_state(state_path, {"stream": identity, "downloaded": written})
+        except BaseException:
+            fh.flush()
+            _write_state(state_path, {"stream": identity, "downloaded": written})
+            raise
+
+    os.replace(part_path, file_path)
+    os.remove(state_path)
+    return offset
@@ -0,0 +1,218 @@
+"""Audio encoding that drives ffmpeg directly.
+
+Each encode is its own ffmpeg process, so encodes run outside the Python
+process (and the GIL) and up to one per CPU core can run side by side.
+
+Output formats:
+    mp3   - always transcoded with libmp3lame
+    m4a   - AAC sources are remuxed as-is, anything else is transcoded to AAC
+    opus  - Opus sources are remuxed as-is, anything else is transcoded to Opus
+    auto  - keep the original codec (AAC -> .m4a, Opus -> .opus) and only
+            transcode to MP3 when no container fits the source codec
+
+A long transcode, such as a three-hour mix, still runs on one core.
+It is not split into segments encoded side by side: LAME carries state
+from frame to frame that a segment cannot inherit, so the joined file
+would not sound the same as a single pass.
+"""
+import contextlib
+import os
+import shutil
+import subprocess
+import threading
+
+DEFAULT_BITRATE = "320k"
+DEFAULT_FORMAT = "mp3"
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+OUTPUT_FORMATS = ("mp3", "m4a", "opus", "auto")
+ENCODERS = {"mp3": "libmp3lame", "m4a": "aac", "opus": "libopus"}
+PASSTHROUGH_FORMATS = {"aac": "m4a", "opus": "opus"}  # Source codec -> container that holds it
+MAX_BITRATES = {"opus": 256}  # kbit/s; libopus rejects more than 256k per channel
+
+
+class EncodeError(Exception):
+    """ffmpeg failed to encode a file; the message is ffmpeg's own error"""
+
+
+def find_ffmpeg():
+    """Locate ffmpeg on PATH, falling back to the imageio-ffmpeg bundled binary"""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        raise EncodeError("ffmpeg not found. Install ffmpeg or the imageio-ffmpeg package")
+
+
+def source_codec(audio_codec):
+    """Normalise a pytubefix codec string such as "mp4a.40.2" or "opus" """
+    audio_codec = (audio_codec or "").lower()
+    if audio_codec.startswith("mp4a"):
+        return "aac"
+    return audio_codec.split(".")[0]
+
+
+class Encoder:
+    """Pool of ffmpeg processes, at most `workers` transcodes running at once"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, bitrate=DEFAULT_BITRATE, output_format=DEFAULT_FORMAT):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        # Look ffmpeg up once so a missing binary fails before any download starts
+        self.ffmpeg = find_ffmpeg()
+        self.workers = max(1, workers)
+        self.bitrate = bitrate
+        self.output_format = output_format
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    def plan(self, audio_codec):
+        """Return (extension, remux) for a source stream codec.
+
+        remux is True when the codec can be copied into the target
+        container unchanged, so no transcode is needed.
+        """
+        codec = source_codec(audio_codec)
+        passthrough = PASSTHROUGH_FORMATS.get(codec)
+        if self.output_format == "auto":
+            return ("." + passthrough, True) if passthrough else (".mp3", False)
+        return "." + self.output_format, passthrough == self.output_format
+
+    def codec_args(self, output_format):
+        bitrate = self.bitrate
+        limit = MAX_BITRATES.get(output_format)
+        if limit and int(bitrate.rstrip("kK")) > limit:
+            bitrate = f"{limit}k"
+        return ["-c:a", ENCODERS[output_format], "-b:a", bitrate]
+
+    def command(self, source_path, output_path, remux=False, progress=False):
+        _, extension = os.path.splitext(output_path)
+        codec_args = ["-c:a", "copy"] if remux else self.codec_args(extension[1:])
+        return [
+            self.ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+            "-i", source_path,
+            "-map", "0:a:0", "-vn",
+            *codec_args,
+            # Machine-readable position updates on stdout, about twice a second
+            *(["-progress", "pipe:1"] if progress else []),
+            output_path,
+        ]
+
+    def encode(self, source_path, output_path, should_stop=None, remux=False,
+               duration=None, on_progress=None):
+        """Encode source_path to output_path, blocking until ffmpeg exits.
+
+        Raises EncodeError straight away when ffmpeg fails; there is no
+        second attempt with other settings. should_stop is polled while
+        ffmpeg runs and kills it when it returns True. Remuxes only copy
+        bytes, so they do not wait for a transcode slot.
+
+        on_progress(fraction) is called from a helper thread with ffmpeg's
+        own position divided by duration (seconds of audio); without a
+        duration it is only called once, with 1.0, when ffmpeg finishes.
+        """
+        slot = contextlib.nullcontext() if remux else self._slots
+        with slot:
+            process, stderr, cancelled = _run(self.command(source_path, output_path, remux, bool(on_progress)),
+                                              should_stop, duration, on_progress)
+        if cancelled:
+            _remove(output_path)
+            raise EncodeError("Encoding cancelled")
+        _check_result(process, stderr, output_path)
+        return output_path
+
+    def encode_stream(self, chunks, output_path, remux=False):
+        """Encode audio fed chunk by chunk to ffmpeg's stdin as it downloads.
+
+        No temporary file is written. These encodes do not take a pool
+        slot: the download paces them and download concurrency bounds them.
+        If iterating chunks raises (e.g. the user stopped the download),
+        ffmpeg is killed, the partial output removed and the error re-raised.
+        """
+        process = subprocess.Popen(self.command("pipe:0", output_path, remux), stdin=subprocess.PIPE,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # Drain stderr on the side so a chatty ffmpeg can never block on it
+        stderr = []
+        reader = _drain(process.stderr, stderr)
+        try:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg gave up on the input; its exit code says why
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            _remove(output_path)
+            raise
+        finally:
+            reader.join()
+        _check_result(process, b"".join(stderr), output_path)
+        return output_path
+
+
+def _run(command, should_stop=None, duration=None, on_progress=None):
+    """Run ffmpeg until it exits, killing it once should_stop() returns True.
+
+    Returns (process, stderr bytes, cancelled). With on_progress the
+    command must write -progress output to stdout.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    stderr = []
+    readers = [_drain(process.stderr, stderr)]
+    if on_progress:
+        readers.append(threading.Thread(target=_report_progress, daemon=True,
+                                        args=(process.stdout, duration, on_progress)))
+        readers[-1].start()
+    cancelled = False
+    while True:
+        try:
+            process.wait(timeout=0.2)
+            break
+        except subprocess.TimeoutExpired:
+            if should_stop and should_stop():
+                cancelled = True
+                process.kill()
+    for reader in readers:
+        reader.join()
+    return process, b"".join(stderr), cancelled
+
+
+def _drain(pipe, out):
+    """Read pipe to the end on a daemon thread, appending the bytes to out"""
+    reader = threading.Thread(target=lambda: out.append(pipe.read()), daemon=True)
+    reader.start()
+    return reader
+
+
+def _report_progress(pipe, duration, on_progress):
+    """Turn ffmpeg's -progress key=value blocks into on_progress(fraction) calls"""
+    for line in pipe:
+        key, _, value = line.decode("ascii", "replace").strip().partition("=")
+        # out_time_ms is in microseconds despite its name; every ffmpeg version prints it
+        if key == "out_time_ms" and duration and value.isdigit():
+            on_progress(min(int(value) / 1_000_000 / duration, 1.0))
+        elif key == "progress" and value == "end":
+            on_progress(1.0)
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _check_result(process, stderr, output_path):
+    """Raise EncodeError with ffmpeg's last error line if it failed"""
+    if process.returncode != 0:
+        _remove(output_path)
+        lines = stderr.decode("utf-8", "replace").strip().splitlines()
+        raise EncodeError(lines[-1] if lines else f"ffmpeg exited with code {process.returncode}")
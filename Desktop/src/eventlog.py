@@ -0,0 +1,79 @@
+"""Structured log of pipeline runs, one JSON object per line.
+
+Every run appends a "run_start" event, one event per status change of
+each track (fetching, downloading, ..., done/skipped/failed/stopped) and
+a closing "run_end" summary to the output folder's log file, so a long
+batch can be analysed afterwards with any JSON-lines tool, e.g.
+
+    jq 'select(.event == "failed")' .download_log.jsonl
+
+Download and encode progress is not logged; it would dwarf everything
+else. When the file grows past MAX_BYTES it is moved to "<name>.1" and
+a new one started, checked on every write so a service running for
+weeks rotates too. The CLI, GUI and service may log to the same folder;
+a writer whose file another one rotated reopens the new file.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+LOG_NAME = ".download_log.jsonl"
+MAX_BYTES = 20 * 1024 * 1024
+
+
+class EventLog:
+    """Thread-safe append-only JSON-lines writer"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.run_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._fh = None
+        self._open()
+
+    def _open(self):
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+        # Line buffered: each event is on disk as soon as it is written
+        self._fh = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    def _reopen_if_rotated(self):
+        """Start a new file once this one outgrew max_bytes or another writer rotated it"""
+        try:
+            current = os.stat(self.path)
+            opened = os.fstat(self._fh.fileno())
+            if (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino) and current.st_size <= self.max_bytes:
+                return
+        except OSError:
+            pass  # Moved away or deleted: start it again
+        self._fh.close()
+        self._open()
+
+    @classmethod
+    def for_folder(cls, out_folder):
+        os.makedirs(out_folder, exist_ok=True)
+        return cls(os.path.join(out_folder, LOG_NAME))
+
+    def write(self, event, **fields):
+        record = {"ts": round(time.time(), 3), "run": self.run_id, "event": event, **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._fh.closed:
+                self._reopen_if_rotated()
+                self._fh.write(line + "\n")
+
+    def track(self, track, status, message=""):
+        """Record a status change of a pipeline Track; elapsed counts from when it was queued"""
+        self.write(status, index=track.index, total=track.total, url=track.url,
+                   video_id=track.video_id, title=track.title, message=message,
+                   elapsed=round(time.time() - track.queued_at, 3))
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
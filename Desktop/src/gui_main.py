@@ -1,10 +1,50 @@
 import os
+import collections
+import multiprocessing
+import queue
 import threading
 import time
-from tkinter import Tk, Label, Entry, Button, filedialog, Text, END, Frame, StringVar, Canvas
+from tkinter import Tk, Label, Entry, Button, filedialog, Text, END, Frame, StringVar, BooleanVar, Canvas, Spinbox, Checkbutton, OptionMenu
 from tkinter import ttk
-from pytubefix import YouTube, Playlist
-from moviepy import AudioFileClip
+from pipeline import Pipeline, StopRequested, DEFAULT_CONCURRENCY, MAX_ADAPTIVE_CONCURRENCY as MAX_CONCURRENCY, STAGES
+from encoder import OUTPUT_FORMATS, DEFAULT_FORMAT, DEFAULT_BITRATE
+from selection import SELECTION_POLICIES, DEFAULT_POLICY
+from metacache import MetadataCache, PlaylistUrls, BatchUrls, fetch_playlist_urls, cached_title, load_pytubefix
+from ledger import Ledger
+from journal import Journal, COMPLETED, STALE_AFTER
+import httppool
+import service
+import metrics
+import ratelimit
+
+MAX_ROWS_HEIGHT = 180  # Rows beyond this height scroll
+FRAME_MS = 50  # The Tk thread applies queued UI updates at this interval
+SPEED_WINDOW = 0.5  # Seconds of progress each speed/ETA sample is measured over
+DONE_DISPLAY_MS = 1000  # How long a finished track's row stays up
+LOG_FLUSH_MS = 200  # New log lines are inserted into the log view in one batch this often
+LOG_MAX_LINES = 2000  # The log view keeps only the most recent lines
+BITRATES = ("320k", "256k", "192k", "160k", "128k")
+
+class ProgressRow:
+    """Progress display for one active track.
+
+    The bar, shine and label are canvas items created once and then only
+    moved or reconfigured.
+    """
+    def __init__(self, frame, canvas, text_var):
+        self.frame = frame
+        self.canvas = canvas
+        self.text_var = text_var
+        self.progress = 0
+        self.speed = 0
+        self.active = False
+        self.shine_position = 0
+        self.last_update_time = 0
+        self.last_bytes_downloaded = 0
+        self.encode_started = 0
+        self.bar = None
+        self.shine = None
+        self.label = None
 
 class ModernDownloader:
     def __init__(self):
@@ -35,13 +75,44 @@ class ModernDownloader:
         self.download_speed_var = StringVar(value="")
         self.eta_var = StringVar(value="")
         self.total_files_var = StringVar(value="")
+        self.queue_var = StringVar(value="")
+        self.concurrency_var = StringVar(value=str(DEFAULT_CONCURRENCY))
+        self.streaming_var = BooleanVar(value=True)
+        self.format_var = StringVar(value=DEFAULT_FORMAT)
+        self.bitrate_var = StringVar(value=DEFAULT_BITRATE)
+        self.selection_var = StringVar(value=DEFAULT_POLICY)
+        self.sync_var = BooleanVar(value=False)
+        self.rate_limit_var = StringVar(value="")
+        self.adaptive_var = BooleanVar(value=False)
+        self.service_var = BooleanVar(value=False)
         self.is_downloading = False
         self.stop_download = False  # Add stop flag
+        self.download_cancelled = False  # Stop pressed, rather than the window closed
+        self.closing = False  # Window closed; it goes once the download thread has drained
         self.current_progress = 0
         self.start_time = 0
         self.downloaded_bytes = 0
         self.total_bytes = 0
         self.download_thread = None  # Track download thread
+        self.download_finished = threading.Event()  # Set once the download thread has drained and exited
+        self.download_finished.set()
+        self.pipeline = None
+        self.service_job = None  # ID of the background service job this window follows
+        self.metadata = MetadataCache()  # Shared by every run and URL check of this window
+        self.journal = Journal()  # Lets a run cut short by Stop, closing the window or a crash resume
+        self.journal_job = None  # journal.JournalJob of the current run
+        self.finished_videos = 0
+        self.failed_videos = 0
+        self.progress_rows = []  # Every row ever created, shown or idle
+        self.idle_rows = []
+        self.track_rows = {}  # Track index -> row of each active track
+        self.row_bar_height = 30
+        # Worker threads never touch Tk: they post here and the Tk thread applies it
+        self.ui_events = queue.SimpleQueue()
+        self.progress_updates = {}  # Track index -> latest (bytes_downloaded, total_size, track)
+        self.encode_updates = {}  # Track index -> latest (fraction, track)
+        self.pending_log = collections.deque(maxlen=LOG_MAX_LINES)  # Lines not yet in the log view
+        self.progress_lock = threading.Lock()
         
     def setup_styles(self):
         style = ttk.Style()
@@ -166,6 +237,85 @@ class ModernDownloader:
                            activebackground='#00cc33', activeforeground='#000000')
         browse_btn.pack(side='right', padx=(8, 8), pady=8)
         
+        # Download options
+        options_frame = Frame(folder_frame, bg='#1a1a2e')
+        options_frame.pack(fill='x')
+        
+        concurrency_label = Label(options_frame, text="⚡ Parallel downloads:",
+                                 bg='#1a1a2e', fg='#ffffff', font=('Arial', 10, 'bold'))
+        concurrency_label.pack(side='left')
+        
+        self.concurrency_spinbox = Spinbox(options_frame, from_=1, to=MAX_CONCURRENCY, width=4,
+                                          textvariable=self.concurrency_var, font=('Arial', 10),
+                                          bg='#1e1e2e', fg='#ffffff', buttonbackground='#2c2c54',
+                                          relief='flat', bd=0, highlightthickness=0,
+                                          insertbackground='#00ff41')
+        self.concurrency_spinbox.pack(side='left', padx=(8, 0))
+        
+        streaming_check = Checkbutton(options_frame, text="💾 Stream into encoder (no temp files)",
+                                     variable=self.streaming_var, bg='#1a1a2e', fg='#ffffff',
+                                     selectcolor='#1e1e2e', activebackground='#1a1a2e',
+                                     activeforeground='#00ff41', font=('Arial', 10),
+                                     highlightthickness=0, bd=0, cursor='hand2')
+        streaming_check.pack(side='left', padx=(20, 0))
+        
+        # mp3 always re-encodes; m4a/opus/auto copy the original codec when they can
+        format_label = Label(options_frame, text="🎧 Format:",
+                            bg='#1a1a2e', fg='#ffffff', font=('Arial', 10, 'bold'))
+        format_label.pack(side='left', padx=(20, 0))
+        
+        format_menu = self.create_option_menu(options_frame, self.format_var, OUTPUT_FORMATS)
+        format_menu.pack(side='left', padx=(8, 0))
+        
+        # Output bitrate and which source stream to download
+        quality_frame = Frame(folder_frame, bg='#1a1a2e')
+        quality_frame.pack(fill='x', pady=(6, 0))
+        
+        bitrate_label = Label(quality_frame, text="🎚️ Bitrate:",
+                             bg='#1a1a2e', fg='#ffffff', font=('Arial', 10, 'bold'))
+        bitrate_label.pack(side='left')
+        self.create_option_menu(quality_frame, self.bitrate_var, BITRATES).pack(side='left', padx=(8, 0))
+        
+        selection_label = Label(quality_frame, text="📡 Source stream:",
+                               bg='#1a1a2e', fg='#ffffff', font=('Arial', 10, 'bold'))
+        selection_label.pack(side='left', padx=(20, 0))
+        self.create_option_menu(quality_frame, self.selection_var, SELECTION_POLICIES).pack(side='left', padx=(8, 0))
+        
+        # Sync skips videos the output folder's ledger says are already there
+        sync_check = Checkbutton(quality_frame, text="🔁 Skip already downloaded",
+                                variable=self.sync_var, bg='#1a1a2e', fg='#ffffff',
+                                selectcolor='#1e1e2e', activebackground='#1a1a2e',
+                                activeforeground='#00ff41', font=('Arial', 10),
+                                highlightthickness=0, bd=0, cursor='hand2')
+        sync_check.pack(side='left', padx=(20, 0))
+        
+        # Bandwidth: a total cap such as "2M" (empty for none), and automatic parallelism
+        rate_frame = Frame(folder_frame, bg='#1a1a2e')
+        rate_frame.pack(fill='x', pady=(6, 0))
+        
+        rate_label = Label(rate_frame, text="🚦 Speed limit (e.g. 2M):",
+                          bg='#1a1a2e', fg='#ffffff', font=('Arial', 10, 'bold'))
+        rate_label.pack(side='left')
+        rate_entry = Entry(rate_frame, textvariable=self.rate_limit_var, width=8, font=('Arial', 10),
+                           bg='#1e1e2e', fg='#ffffff', relief='flat', bd=0, highlightthickness=0,
+                           insertbackground='#00ff41')
+        rate_entry.pack(side='left', padx=(8, 0))
+        
+        adaptive_check = Checkbutton(rate_frame, text="📈 Adapt parallel downloads to the connection",
+                                    variable=self.adaptive_var, bg='#1a1a2e', fg='#ffffff',
+                                    selectcolor='#1e1e2e', activebackground='#1a1a2e',
+                                    activeforeground='#00ff41', font=('Arial', 10),
+                                    highlightthickness=0, bd=0, cursor='hand2')
+        adaptive_check.pack(side='left', padx=(20, 0))
+        
+        # Downloads run in the background service (cli_main.py --serve) and outlive the window
+        service_check = Checkbutton(rate_frame, text="🛰️ Run on background service",
+                                   variable=self.service_var, bg='#1a1a2e', fg='#ffffff',
+                                   selectcolor='#1e1e2e', activebackground='#1a1a2e',
+                                   activeforeground='#00ff41', font=('Arial', 10),
+                                   highlightthickness=0, bd=0, cursor='hand2')
+        service_check.pack(side='left', padx=(20, 0))
+        
         # Enhanced Progress Section
         progress_frame = Frame(main_frame, bg='#1a1a2e')
         progress_frame.pack(fill='x', pady=(0, 25))
@@ -182,13 +332,26 @@ class ModernDownloader:
                                       bg='#1a1a2e', fg='#16537e', font=('Arial', 10))
         self.total_files_label.pack(anchor='w')
         
-        # Enhanced Progress bar with border
-        progress_container = Frame(progress_frame, bg='#16537e', height=34)
-        progress_container.pack(fill='x', pady=(5, 10))
-        progress_container.pack_propagate(False)
+        self.queue_label = Label(file_info_frame, textvariable=self.queue_var,
+                                bg='#1a1a2e', fg='#16537e', font=('Arial', 9))
+        self.queue_label.pack(anchor='w')
         
-        self.progress_canvas = Canvas(progress_container, height=30, bg='#0f0f23', highlightthickness=0)
-        self.progress_canvas.pack(fill='both', expand=True, padx=2, pady=2)
+        # Progress rows, one per active track, scrolling once they outgrow the space
+        rows_container = Frame(progress_frame, bg='#1a1a2e')
+        rows_container.pack(fill='x', pady=(5, 10))
+        
+        self.rows_canvas = Canvas(rows_container, height=1, bg='#1a1a2e', highlightthickness=0)
+        rows_scrollbar = ttk.Scrollbar(rows_container, orient="vertical", command=self.rows_canvas.yview)
+        self.rows_canvas.configure(yscrollcommand=rows_scrollbar.set)
+        self.rows_canvas.pack(side='left', fill='x', expand=True)
+        rows_scrollbar.pack(side='right', fill='y')
+        
+        self.rows_frame = Frame(self.rows_canvas, bg='#1a1a2e')
+        rows_window = self.rows_canvas.create_window(0, 0, window=self.rows_frame, anchor='nw')
+        self.rows_frame.bind('<Configure>', lambda e: self.rows_canvas.configure(
+            scrollregion=self.rows_canvas.bbox('all'),
+            height=min(max(self.rows_frame.winfo_reqheight(), 1), MAX_ROWS_HEIGHT)))
+        self.rows_canvas.bind('<Configure>', lambda e: self.rows_canvas.itemconfigure(rows_window, width=e.width))
         
         # Enhanced Stats frame
         stats_frame = Frame(progress_frame, bg='#1a1a2e')
@@ -227,6 +390,23 @@ class ModernDownloader:
                                   activebackground='#00cc33', activeforeground='#000000')
         self.download_btn.pack(side='left', padx=(0, 10))
         
+        # Reruns only the videos that failed in earlier runs into the output folder
+        self.retry_btn = Button(button_container, text="🔁 Retry Failed",
+                               command=self.retry_failed,
+                               bg='#16537e', fg='#ffffff', font=('Arial', 12, 'bold'),
+                               relief='flat', bd=0, padx=20, pady=15, cursor='hand2',
+                               activebackground='#1e6ba8', activeforeground='#ffffff')
+        self.retry_btn.pack(side='left', padx=(0, 10))
+        
+        # Continues a run that was stopped or cut short (shown only when there is one)
+        self.resume_btn = Button(button_container, text="⏯️ Resume",
+                                command=self.resume_download,
+                                bg='#16537e', fg='#ffffff', font=('Arial', 12, 'bold'),
+                                relief='flat', bd=0, padx=20, pady=15, cursor='hand2',
+                                activebackground='#1e6ba8', activeforeground='#ffffff')
+        self.resume_btn.pack(side='left', padx=(0, 10))
+        self.resume_btn.pack_forget()
+        
         # Stop button (initially hidden)
         self.stop_btn = Button(button_container, text="⛔ Stop Download", 
                               command=self.stop_download_process,
@@ -275,8 +455,17 @@ class ModernDownloader:
         
     def setup_animations(self):
         self.animation_running = False
-        self.shine_position = 0
         
+    def create_option_menu(self, parent, variable, values):
+        """Dropdown styled to match the dark theme"""
+        menu = OptionMenu(parent, variable, *values)
+        menu.configure(bg='#1e1e2e', fg='#ffffff', activebackground='#2c2c54',
+                       activeforeground='#00ff41', font=('Arial', 10), relief='flat',
+                       bd=0, highlightthickness=0, cursor='hand2')
+        menu['menu'].configure(bg='#1e1e2e', fg='#ffffff', activebackground='#00ff41',
+                               activeforeground='#000000')
+        return menu
+    
     def clear_log(self):
         self.log_text.delete(1.0, END)
         
@@ -293,210 +482,368 @@ class ModernDownloader:
         """Add hover effect to button"""
         self.animate_button(button, original_color, hover_color)
     
-    def update_progress_bar(self, percentage):
-        self.progress_canvas.delete("all")
-        canvas_width = self.progress_canvas.winfo_width()
-        if canvas_width > 1:
-            progress_width = (percentage / 100) * canvas_width
+    def reset_progress_rows(self, bar_height):
+        """Remove every progress row; new rows use the given bar height"""
+        for row in self.progress_rows:
+            row.frame.destroy()
+        self.progress_rows = []
+        self.idle_rows = []
+        self.track_rows = {}
+        self.row_bar_height = bar_height
+    
+    def acquire_row(self, track):
+        """Show a progress row for a track that just became active"""
+        if self.idle_rows:
+            row = self.idle_rows.pop()
+        else:
+            row_frame = Frame(self.rows_frame, bg='#1a1a2e')
             
-            # Background
-            self.progress_canvas.create_rectangle(0, 0, canvas_width, 30, fill='#0f0f23', outline='')
+            text_var = StringVar(value="")
+            Label(row_frame, textvariable=text_var, bg='#1a1a2e', fg='#ffffff',
+                  font=('Arial', 9), anchor='w').pack(fill='x')
             
-            # Progress bar with gradient effect
-            if progress_width > 0:
-                # Main progress bar
-                self.progress_canvas.create_rectangle(0, 0, progress_width, 30, fill='#00ff41', outline='')
-                
-                # Animated shine effect
-                if self.is_downloading and percentage < 100:
-                    self.shine_position = (self.shine_position + 5) % canvas_width
-                    shine_width = 30
-                    shine_start = self.shine_position
-                    shine_end = min(shine_start + shine_width, progress_width)
-                    
-                    if shine_start < progress_width:
-                        self.progress_canvas.create_rectangle(shine_start, 0, shine_end, 30, fill='#ffffff', stipple='gray25')
+            bar_container = Frame(row_frame, bg='#16537e', height=self.row_bar_height + 4)
+            bar_container.pack(fill='x')
+            bar_container.pack_propagate(False)
             
-            # Progress text
-            self.progress_canvas.create_text(canvas_width//2, 15, text=f"{percentage:.1f}%",fill='#000000' if percentage > 50 else '#ffffff', font=('Arial', 11, 'bold'))
+            canvas = Canvas(bar_container, height=self.row_bar_height, bg='#0f0f23', highlightthickness=0)
+            canvas.pack(fill='both', expand=True, padx=2, pady=2)
+            
+            row = ProgressRow(row_frame, canvas, text_var)
+            self.progress_rows.append(row)
+        
+        row.frame.pack(fill='x', pady=(0, 4))
+        row.active = True
+        row.progress = 0
+        row.speed = 0
+        row.last_bytes_downloaded = 0
+        row.last_update_time = time.time()
+        self.track_rows[track.index] = row
+        return row
+    
+    def release_row(self, track, row=None):
+        """Hide the progress row of a finished track so it can be reused.
+
+        With row given, only release it if it still belongs to the track;
+        a later run may have replaced every row in the meantime.
+        """
+        if row is not None and self.track_rows.get(track.index) is not row:
+            return
+        row = self.track_rows.pop(track.index, None)
+        if row:
+            row.active = False
+            row.speed = 0
+            row.frame.pack_forget()
+            self.idle_rows.append(row)
+    
+    def update_progress_bar(self, row, percentage):
+        """Move a row's existing canvas items to show the given percentage"""
+        canvas = row.canvas
+        canvas_width = canvas.winfo_width()
+        canvas_height = canvas.winfo_height()
+        if canvas_width <= 1:
+            return  # Not laid out yet
+        if row.bar is None:
+            row.bar = canvas.create_rectangle(0, 0, 0, 0, fill='#00ff41', outline='')
+            row.shine = canvas.create_rectangle(0, 0, 0, 0, fill='#ffffff', stipple='gray25', outline='')
+            row.label = canvas.create_text(0, 0, font=('Arial', 11 if canvas_height >= 30 else 8, 'bold'))
+        
+        progress_width = (percentage / 100) * canvas_width
+        canvas.coords(row.bar, 0, 0, progress_width, canvas_height)
+        
+        # Animated shine effect
+        shine_start = shine_end = 0
+        if row.active and 0 < percentage < 100:
+            row.shine_position = (row.shine_position + 5) % canvas_width
+            if row.shine_position < progress_width:
+                shine_start = row.shine_position
+                shine_end = min(shine_start + 30, progress_width)
+        canvas.coords(row.shine, shine_start, 0, shine_end, canvas_height)
+        
+        canvas.coords(row.label, canvas_width // 2, canvas_height // 2)
+        canvas.itemconfigure(row.label, text=f"{percentage:.1f}%",
+                             fill='#000000' if percentage > 50 else '#ffffff')
+    
+    def post(self, func, *args):
+        """Run func(*args) on the Tk thread at the next frame; safe from any thread"""
+        self.ui_events.put((func, args))
+    
+    def process_ui_events(self):
+        """One UI frame: apply everything worker threads posted since the last one"""
+        while True:
+            try:
+                func, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        
+        # Only the latest progress of each track matters; older samples were overwritten
+        with self.progress_lock:
+            updates, self.progress_updates = self.progress_updates, {}
+            encode_updates, self.encode_updates = self.encode_updates, {}
+        now = time.time()
+        for index, (bytes_downloaded, total_size, track) in updates.items():
+            row = self.track_rows.get(index)
+            if row:
+                self.apply_progress(row, track, bytes_downloaded, total_size, now)
+        for index, (fraction, track) in encode_updates.items():
+            row = self.track_rows.get(index)
+            if row:
+                self.apply_encode_progress(row, track, fraction, now)
+        if updates:
+            # Overall speed is the sum of every active download
+            total_speed = sum(r.speed for r in self.progress_rows if r.active)
+            self.download_speed_var.set(f"Speed: {total_speed / (1024 * 1024):.1f} MB/s")
+        
+        if self.is_downloading:
+            for row in self.progress_rows:
+                if row.active:
+                    self.update_progress_bar(row, row.progress)
+            self.update_queue_depths()
+    
+    def apply_progress(self, row, track, bytes_downloaded, total_size, now):
+        row.progress = (bytes_downloaded / total_size) * 100
+        
+        # Measure speed over a short window so it does not jump with every frame
+        time_diff = now - row.last_update_time
+        if time_diff >= SPEED_WINDOW:
+            row.speed = (bytes_downloaded - row.last_bytes_downloaded) / time_diff
+            row.last_update_time = now
+            row.last_bytes_downloaded = bytes_downloaded
+            if not track.total:
+                if row.speed > 0:
+                    eta_seconds = (total_size - bytes_downloaded) / row.speed
+                    eta_min = int(eta_seconds // 60)
+                    eta_sec = int(eta_seconds % 60)
+                    self.eta_var.set(f"ETA: {eta_min:02d}:{eta_sec:02d}")
+                else:
+                    self.eta_var.set("ETA: --:--")
+        
+        if not track.total:
+            self.current_progress = row.progress
+            self.progress_var.set(f"{row.progress:.1f}%")
+    
+    def apply_encode_progress(self, row, track, fraction, now):
+        row.progress = fraction * 100
+        if not track.total:
+            verb = "Remuxing" if track.remux else "Converting"
+            self.progress_var.set(f"{verb}... {row.progress:.0f}%")
+            self.download_speed_var.set(f"{verb}...")
+            elapsed = now - row.encode_started
+            if 0 < fraction < 1 and elapsed > 0:
+                eta_seconds = elapsed / fraction - elapsed
+                self.eta_var.set(f"ETA: {int(eta_seconds // 60):02d}:{int(eta_seconds % 60):02d}")
     
     def log_message(self, message):
+        """Queue a line for the activity log; safe from any thread"""
         timestamp = time.strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] {message}"
-        self.log_text.insert(END, formatted_message + "\n")
+        self.pending_log.append(f"[{timestamp}] {message}")
+    
+    def flush_log(self):
+        """Insert the lines logged since the last flush at once, dropping the oldest beyond LOG_MAX_LINES"""
+        if not self.pending_log:
+            return
+        lines = []
+        while self.pending_log:
+            lines.append(self.pending_log.popleft())
+        self.log_text.insert(END, "\n".join(lines) + "\n")
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
         self.log_text.see(END)
-        self.root.update()
     
-    def progress_callback(self, stream, chunk, bytes_remaining):
+    def set_var(self, variable, value):
+        """Set a Tk variable from any thread"""
+        self.post(variable.set, value)
+    
+    def progress_callback(self, track, stream, chunk, bytes_remaining):
+        """Called by the download threads for every chunk; only records the numbers"""
         # Check stop flag during download
         if self.stop_download:
-            raise Exception("Download stopped by user")
-            
+            raise StopRequested()
+        self.record_progress(track, stream, chunk, bytes_remaining)
+    
+    def record_progress(self, track, stream, chunk, bytes_remaining):
         total_size = stream.filesize
-        bytes_downloaded = total_size - bytes_remaining
-        percentage = (bytes_downloaded / total_size) * 100
-        
-        # Calculate speed
-        current_time = time.time()
-        if hasattr(self, 'last_update_time'):
-            time_diff = current_time - self.last_update_time
-            if time_diff > 0:
-                speed = (bytes_downloaded - self.last_bytes_downloaded) / time_diff
-                speed_mb = speed / (1024 * 1024)
-                
-                # Calculate ETA
-                if speed > 0:
-                    eta_seconds = bytes_remaining / speed
-                    eta_min = int(eta_seconds // 60)
-                    eta_sec = int(eta_seconds % 60)
-                    eta_str = f"ETA: {eta_min:02d}:{eta_sec:02d}"
-                else:
-                    eta_str = "ETA: --:--"
-                
-                self.download_speed_var.set(f"Speed: {speed_mb:.1f} MB/s")
-                self.eta_var.set(eta_str)
+        with self.progress_lock:
+            self.progress_updates[track.index] = (total_size - bytes_remaining, total_size, track)
+    
+    def encode_progress_callback(self, track, fraction):
+        """Called with ffmpeg's position while a track encodes; only records it"""
+        with self.progress_lock:
+            self.encode_updates[track.index] = (fraction, track)
+    
+    def on_track_status(self, track, status, message):
+        """Called by the pipeline threads; the UI work happens on the Tk thread"""
+        self.post(self.show_track_status, track, status, message)
+    
+    def show_track_status(self, track, status, message):
+        """Reflect a pipeline stage change of one track in the UI"""
+        if status == "fetching":
+            # A retried fetch keeps the row it already has
+            row = self.track_rows.get(track.index) or self.acquire_row(track)
+            row.text_var.set(f"🔍 Fetching video information...{track.position}")
+            self.update_progress_bar(row, 0)
+            return
         
-        self.last_update_time = current_time
-        self.last_bytes_downloaded = bytes_downloaded
+        row = self.track_rows.get(track.index)
+        if status == "downloading":
+            file_info = f"📹 {track.title}{track.position}"
+            row.text_var.set(f"⬇️ {track.title}{track.position}")
+            if not track.total:
+                self.current_file_var.set(file_info)
+            self.log_message(f"🎵 Found: {track.title}")
+            self.log_message(f"📊 {message}")
+        elif status == "downloaded":
+            row.text_var.set(f"⏳ Waiting for encoder: {track.title}{track.position}")
+        elif status == "encoding":
+            verb = "Remuxing" if track.remux else "Converting"
+            row.text_var.set(f"🔄 {verb}: {track.title}{track.position}")
+            row.progress = 0
+            row.encode_started = time.time()
+            if not track.total:
+                self.progress_var.set(f"{verb}... 0%")
+                self.download_speed_var.set(f"{verb}...")
+                self.eta_var.set("ETA: --:--")
+            self.log_message(f"🔄 {message.rstrip('.')}: {track.title}")
+        elif status == "done":
+            self.log_message(f"✅ Completed: {track.title}")
+            self.log_message(f"💾 Saved as: {message}")
+            row.progress = 100
+            self.update_progress_bar(row, 100)
+            row.text_var.set(f"✅ {track.title}{track.position}")
+            if not track.total:
+                self.current_file_var.set(f"✅ {track.title}")
+                self.download_speed_var.set("Completed")
+                self.eta_var.set("Done")
+        elif status == "skipped":
+            # Skipped before fetching, so the track never got a progress row
+            self.log_message(f"⏭️ Already downloaded: {message}")
+        elif status == "stopped":
+            self.log_message("🛑 Download stopped by user")
+            self.status_var.set("🛑 Download stopped")
+        elif status == "retrying":
+            row.progress = 0
+            self.update_progress_bar(row, 0)
+            row.text_var.set(f"🔁 Retrying: {track.name}{track.position}")
+            self.log_message(f"🔁 {track.name}: {message}")
+        elif status == "failed":
+            self.log_message(f"❌ Error: {track.name}: {message}")
+            if not track.total:
+                self.status_var.set("❌ Download failed")
         
-        # Update progress
-        self.current_progress = percentage
-        self.progress_var.set(f"{percentage:.1f}%")
-        self.update_progress_bar(percentage)
-        self.root.update()
+        if status == "done":
+            # Leave the finished row up briefly without holding up the pipeline
+            self.root.after(DONE_DISPLAY_MS, self.release_row, track, row)
+        elif status in ("skipped", "stopped", "failed"):
+            self.release_row(track)
+        if status in ("done", "skipped", "stopped", "failed"):
+            if track.total:
+                self.finished_videos += 1
+                self.progress_var.set(f"{self.finished_videos}/{track.total} videos")
+                self.status_var.set(f"📹 Completed {self.finished_videos}/{track.total} videos")
     
-    def download_and_convert(self, video_url, out_folder, video_index=None, total_videos=None):
+    def run_pipeline(self, urls, options, total=None):
+        """Send URLs through the fetch/download/encode pipeline with the job_options() of the run"""
+        self.finished_videos = 0
+        self.pipeline = Pipeline(options["output"], concurrency=options["concurrency"],
+                                 on_status=self.on_track_status,
+                                 on_progress=self.progress_callback,
+                                 on_encode_progress=self.encode_progress_callback,
+                                 on_pause=lambda seconds: self.log_message(
+                                     f"⏸️ YouTube keeps rejecting requests; pausing all downloads for {seconds:.0f}s"),
+                                 on_total=lambda count: self.set_var(self.total_files_var, f"Playlist: {count} videos"),
+                                 streaming=options["streaming"],
+                                 output_format=options["format"],
+                                 bitrate=options["bitrate"],
+                                 selection=options["selection"],
+                                 sync=options["sync"],
+                                 adaptive=options["adaptive"],
+                                 max_concurrency=options["max_concurrency"],
+                                 metadata=self.metadata,
+                                 journal=self.journal_job)
+        # The user may have pressed Stop before the pipeline existed
+        if self.stop_download:
+            self.pipeline.stop()
+        store = self.pipeline.store
         try:
-            # Check stop flag at the beginning
-            self.check_stop_flag()
-            
-            # Reset progress tracking
-            self.last_bytes_downloaded = 0
-            self.last_update_time = time.time()
-            
-            # Fetch video info
-            self.status_var.set("🔍 Fetching video information...")
-            self.root.update()
-            self.check_stop_flag()
-            
-            yt = YouTube(video_url, on_progress_callback=self.progress_callback)
-            
-            # Update file info
-            file_info = f"📹 {yt.title}"
-            if video_index and total_videos:
-                file_info += f" ({video_index}/{total_videos})"
-            
-            self.current_file_var.set(file_info)
-            self.log_message(f"🎵 Found: {yt.title}")
-            self.check_stop_flag()
-            
-            # Get audio stream
-            self.status_var.set("⬇️ Downloading audio stream...")
-            audio_stream = yt.streams.filter(only_audio=True).first()
-            
-            if not audio_stream:
-                raise Exception("No audio stream available")
-            
-            self.log_message(f"📊 File size: {audio_stream.filesize / (1024*1024):.1f} MB")
-            self.check_stop_flag()
-            
-            # Download
-            downloaded_path = audio_stream.download(output_path=out_folder)
-            self.check_stop_flag()
-            
-            # Convert to MP3
-            self.status_var.set("🔄 Converting to MP3...")
-            self.current_file_var.set(f"🔄 Converting: {yt.title}")
-            self.log_message(f"🔄 Converting: {yt.title}")
-            
-            base, _ = os.path.splitext(downloaded_path)
-            mp3_path = base + '.mp3'
-            
-            # Show conversion progress with realistic animation
-            conversion_steps = [0, 25, 50, 75, 90, 100]
-            for i, step in enumerate(conversion_steps):
-                self.check_stop_flag()  # Check before each step
-                self.update_progress_bar(step)
-                self.progress_var.set(f"Converting... {step}%")
-                self.download_speed_var.set("Converting...")
-                self.eta_var.set(f"Step {i+1}/{len(conversion_steps)}")
-                self.root.update()
-                time.sleep(0.2)
-            
-            # Actual conversion with proper parameters
-            self.check_stop_flag()
-            try:
-                with AudioFileClip(downloaded_path) as audio_clip:
-                    # Use only supported parameters
-                    audio_clip.write_audiofile(mp3_path, bitrate="320k")
-            except Exception as conv_error:
-                if "stopped by user" in str(conv_error):
-                    raise conv_error
-                # Fallback conversion without bitrate if it fails
-                self.log_message(f"⚠️ Trying alternative conversion method...")
-                with AudioFileClip(downloaded_path) as audio_clip:
-                    audio_clip.write_audiofile(mp3_path)
-            
-            # Cleanup
-            if os.path.exists(downloaded_path):
-                os.remove(downloaded_path)
-            
-            self.check_stop_flag()
-            
-            # Success
-            self.log_message(f"✅ Completed: {yt.title}")
-            self.log_message(f"💾 Saved as: {os.path.basename(mp3_path)}")
-            self.update_progress_bar(100)
-            self.current_file_var.set(f"✅ {yt.title}")
-            self.download_speed_var.set("Completed")
-            self.eta_var.set("Done")
-            time.sleep(1)  # Show completion briefly
-            
-        except Exception as e:
-            if "stopped by user" in str(e):
-                # Clean up partial downloads
-                try:
-                    if 'downloaded_path' in locals() and os.path.exists(downloaded_path):
-                        os.remove(downloaded_path)
-                    if 'mp3_path' in locals() and os.path.exists(mp3_path):
-                        os.remove(mp3_path)
-                except:
-                    pass
-                self.log_message("🛑 Download stopped by user")
-                self.status_var.set("🛑 Download stopped")
-                raise e
-            else:
-                self.log_message(f"❌ Error: {str(e)}")
-                self.status_var.set("❌ Download failed")
-                raise e
+            tracks = self.pipeline.run(urls, total=total)
+        finally:
+            self.pipeline = None
+        if store and store.hits:
+            self.log_message(f"♻️ {store.describe()}")
+        # A failed video does not end the playlist; the pipeline records it for Retry Failed
+        self.failed_videos = sum(1 for track in tracks if track.status == "failed")
+        self.check_stop_flag()
+    
+    def run_on_service(self, urls, options):
+        """Hand URLs to the background service and show its job like a run of this window"""
+        client = service.Client.discover()
+        if client is None:
+            raise RuntimeError("No background service is running; start one with cli_main.py --serve")
+        self.finished_videos = 0
+        job = client.submit(urls, options)
+        self.service_job = job["id"]
+        self.log_message(f"🛰️ Job {job['id']} queued on the background service")
+        try:
+            # Stop cancels the job; closing the window leaves it running
+            job = client.follow(job["id"], on_status=self.on_track_status,
+                                on_progress=self.record_progress,
+                                on_encode_progress=self.encode_progress_callback,
+                                on_pause=lambda seconds: self.log_message(
+                                    f"⏸️ YouTube keeps rejecting requests; pausing all downloads for {seconds:.0f}s"),
+                                on_total=lambda count: self.set_var(self.total_files_var, f"Playlist: {count} videos"),
+                                on_playlist=lambda url, count: self.log_message(f"📋 Playlist had {count} videos"),
+                                on_playlist_error=lambda url, error: self.log_message(f"❌ Playlist error: {error}"),
+                                should_stop=lambda: self.stop_download)
+        finally:
+            self.service_job = None
+        self.failed_videos = job["counts"]["failed"]
+        if job["error"]:
+            raise RuntimeError(job["error"])
+        self.check_stop_flag()
     
-    def process_playlist(self, playlist_url, out_folder):
+    def job_options(self, out_folder):
+        """The download settings of this window, as the service and the job journal take them.
+        
+        Tk variables may only be used on the Tk thread, so a run reads its
+        settings here once, before it starts, and its download thread only
+        sees this dict.
+        """
+        return {"output": os.path.abspath(out_folder),
+                "format": self.format_var.get(),
+                "bitrate": self.bitrate_var.get(),
+                "selection": self.selection_var.get(),
+                "concurrency": self.get_concurrency(),
+                "streaming": self.streaming_var.get(),
+                "sync": self.sync_var.get(),
+                "adaptive": self.adaptive_var.get(),
+                "max_concurrency": MAX_CONCURRENCY}
+    
+    def download_and_convert(self, video_url, options):
+        self.run_pipeline([video_url], options)
+    
+    def process_playlist(self, playlist_url, options):
         try:
             self.check_stop_flag()
-            self.status_var.set("🔍 Analyzing playlist...")
+            self.set_var(self.status_var, "🔍 Analyzing playlist...")
             self.log_message("🔍 Analyzing playlist...")
             
-            pl = Playlist(playlist_url)
-            video_urls = list(pl.video_urls)  # Convert to list to get count
-            total_videos = len(video_urls)
-            
-            self.log_message(f"📋 Found playlist with {total_videos} videos")
-            self.total_files_var.set(f"Playlist: {total_videos} videos")
-            self.check_stop_flag()
-            
-            for index, url in enumerate(video_urls, 1):
-                self.check_stop_flag()  # Check before each video
-                self.status_var.set(f"📹 Processing video {index}/{total_videos}")
-                self.download_and_convert(url, out_folder, index, total_videos)
+            # Listed page by page while the first videos already download
+            video_urls = PlaylistUrls(self.metadata, playlist_url)
+            self.log_message(f"⚡ Downloading up to {options['concurrency']} videos at a time")
+            self.set_var(self.status_var, "📹 Processing playlist...")
+            self.run_pipeline(video_urls, options)
+            self.log_message(f"📋 Playlist had {video_urls.total} videos")
                 
         except Exception as e:
             if "stopped by user" in str(e):
                 self.log_message("🛑 Playlist download stopped by user")
-                self.status_var.set("🛑 Playlist stopped")
+                self.set_var(self.status_var, "🛑 Playlist stopped")
                 raise e
             else:
                 self.log_message(f"❌ Playlist error: {str(e)}")
-                self.status_var.set("❌ Playlist processing failed")
+                self.set_var(self.status_var, "❌ Playlist processing failed")
                 raise e
     
     def start_download(self):
@@ -518,42 +865,202 @@ class ModernDownloader:
             self.url_status_label.config(text="❌ Please enter a valid YouTube URL", fg='#ff4757')
             return
             
+        options = self.job_options(self.folder_var.get() or "downloads")
+        on_service = self.service_var.get()
+        is_playlist = "playlist" in url or "list=" in url
+        
+        def work():
+            if on_service:
+                self.run_on_service([url], options)
+            elif is_playlist:
+                self.process_playlist(url, options)
+            else:
+                self.set_var(self.total_files_var, "Single video")
+                self.download_and_convert(url, options)
+        
+        self.begin_download(options, work, compact=is_playlist, sources=None if on_service else [url])
+    
+    def retry_failed(self):
+        """Run the videos that failed in earlier runs into the output folder again"""
+        if self.is_downloading:
+            return
         folder = self.folder_var.get() or "downloads"
-        os.makedirs(folder, exist_ok=True)
+        ledger = Ledger.for_folder(folder)
+        try:
+            urls = ledger.failed_urls()
+        finally:
+            ledger.close()
+        if not urls:
+            self.log_message(f"✅ No failed downloads recorded in {folder}")
+            return
+        self.log_message(f"🔁 Retrying {len(urls)} failed download(s)")
+        options = self.job_options(folder)
+        on_service = self.service_var.get()
+        
+        def work():
+            if on_service:
+                # The service lists the playlists itself
+                self.run_on_service(urls, options)
+                return
+            video_urls = []
+            for url in urls:
+                # The CLI also records playlists it could not read
+                if "playlist" in url or "list=" in url:
+                    video_urls.extend(fetch_playlist_urls(self.metadata, url))
+                else:
+                    video_urls.append(url)
+            self.set_var(self.total_files_var, f"Retrying {len(video_urls)} failed videos")
+            self.run_pipeline(video_urls, options, len(video_urls))
+        
+        self.begin_download(options, work, compact=len(urls) > 1, sources=None if on_service else urls)
+    
+    def resume_download(self):
+        """Continue the oldest run that was stopped or cut short, with its own folder and settings"""
+        if self.is_downloading:
+            return
+        for entry in self.journal.resumable("gui"):
+            journal_job = self.journal.claim(entry["id"])
+            if journal_job:
+                break
+        else:
+            self.log_message("✅ Nothing left to resume")
+            self.refresh_resumable()
+            return
+        
+        # The run keeps its own settings; show them in the window too
+        options = entry["options"]
+        folder = options["output"]
+        self.folder_var.set(folder)
+        self.format_var.set(options["format"])
+        self.bitrate_var.set(options["bitrate"])
+        self.selection_var.set(options["selection"])
+        self.concurrency_var.set(str(options["concurrency"]))
+        self.streaming_var.set(options["streaming"])
+        self.sync_var.set(options["sync"])
+        self.adaptive_var.set(options["adaptive"])
+        urls = entry["urls"]
+        finished = sum(count for status, count in entry["counts"].items() if status in COMPLETED)
+        self.log_message(f"⏯️ Resuming {len(urls)} URL(s) into {folder}; {finished} video(s) already finished")
+        is_batch = len(urls) > 1 or "playlist" in urls[0] or "list=" in urls[0]
+        
+        def work():
+            if is_batch:
+                video_urls = BatchUrls(urls, self.metadata,
+                                       on_playlist=lambda url, count: self.log_message(f"📋 Playlist had {count} videos"),
+                                       on_error=lambda url, error: self.log_message(f"❌ Playlist error: {error}"))
+            else:
+                self.set_var(self.total_files_var, "Single video")
+                video_urls = urls
+            self.run_pipeline(video_urls, options)
+            if journal_job.resumed:
+                self.log_message(f"⏯️ {journal_job.resumed} video(s) finished before, skipped")
+        
+        self.begin_download(options, work, compact=is_batch, journal_job=journal_job)
+    
+    def refresh_resumable(self):
+        """Show the Resume button while the journal holds runs to resume"""
+        count = len(self.journal.resumable("gui"))
+        if count and not self.is_downloading:
+            self.resume_btn.configure(text=f"⏯️ Resume ({count})" if count > 1 else "⏯️ Resume", state='normal')
+            self.resume_btn.pack(side='left', padx=(0, 10))
+        else:
+            self.resume_btn.pack_forget()
+        return count
+    
+    def begin_download(self, options, work, compact, sources=None, journal_job=None):
+        """Run work() on a download thread with the UI in downloading state.
+        
+        options are the job_options() work() runs with. A local run of
+        sources is journaled for resuming; a resumed run passes the
+        journal_job it claimed.
+        """
+        try:
+            rate_limit = ratelimit.parse_rate(self.rate_limit_var.get())
+        except ValueError:
+            self.log_message("❌ Speed limit must look like 500K or 2M")
+            if journal_job:
+                journal_job.end(stopped=True)
+            return
+        ratelimit.limiter.configure(rate_limit)
+        
+        os.makedirs(options["output"], exist_ok=True)
+        if journal_job is None and sources:
+            journal_job = self.journal.start(sources, options, "gui")
+        self.journal_job = journal_job
+        
+        # Keep the bars compact when several tracks share the space
+        self.reset_progress_rows(18 if compact else 30)
         
         # Reset stop flag and set downloading state
         self.stop_download = False
+        self.download_cancelled = False
+        self.failed_videos = 0
         self.is_downloading = True
         
         # Update UI - show stop button, hide start button
         self.download_btn.configure(text="⏳ Downloading...", state='disabled', bg='#666666')
+        self.retry_btn.configure(state='disabled')
+        self.resume_btn.pack_forget()
         self.stop_btn.pack(side='left')
         
+        finished = threading.Event()
+        
         def task():
             try:
-                if "playlist" in url or "list=" in url:
-                    self.process_playlist(url, folder)
-                else:
-                    self.total_files_var.set("Single video")
-                    self.download_and_convert(url, folder)
-                    
-                # Only show success if not stopped
-                if not self.stop_download:
-                    self.status_var.set("✅ All downloads completed!")
-                    self.log_message("🎉 All downloads finished successfully!")
-                
-            except Exception as e:
-                if "stopped by user" not in str(e):
-                    self.log_message(f"❌ Unexpected error: {str(e)}")
-                    self.status_var.set("❌ Download failed")
+                run_task()
             finally:
-                # Reset UI state
-                self.root.after(0, self.reset_download_state)
+                finished.set()
+        
+        def run_task():
+            # One HTTP session per run: the playlist lookup and every download share connections
+            with httppool.session() as http:
+                try:
+                    work()
+                    
+                    # Only show success if not stopped
+                    if self.stop_download:
+                        pass
+                    elif self.failed_videos:
+                        self.set_var(self.status_var, f"⚠️ Finished, {self.failed_videos} failed")
+                        self.log_message(f"🔁 {self.failed_videos} download(s) failed; "
+                                         f"press Retry Failed to try them again")
+                    else:
+                        self.set_var(self.status_var, "✅ All downloads completed!")
+                        self.log_message("🎉 All downloads finished successfully!")
+                    
+                except Exception as e:
+                    if "stopped by user" not in str(e):
+                        self.log_message(f"❌ Unexpected error: {str(e)}")
+                        self.set_var(self.status_var, "❌ Download failed")
+                finally:
+                    if self.journal_job:
+                        if self.download_cancelled:
+                            # Stop cancels the run; only a closed window or a crash leaves it to resume
+                            self.journal_job.discard()
+                        else:
+                            # Ended by the pipeline already unless work() failed before or around it
+                            self.journal_job.end(stopped=self.stop_download)
+                        self.journal_job = None
+                    if http.requests:
+                        self.log_message(f"🔌 {http.describe()}")
+                    # Reset UI state once the queued updates before it are shown
+                    self.post(self.reset_download_state)
         
         # Start download in separate thread
+        self.download_finished = finished
         self.download_thread = threading.Thread(target=task, daemon=True)
         self.download_thread.start()
     
+    def get_concurrency(self):
+        """Read the parallel downloads setting, clamped to a sane range the field then shows; Tk thread only"""
+        try:
+            value = int(self.concurrency_var.get())
+        except ValueError:
+            value = DEFAULT_CONCURRENCY
+        value = max(1, min(MAX_CONCURRENCY, value))
+        self.concurrency_var.set(str(value))
+        return value
+    
     def browse_folder(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -563,6 +1070,7 @@ class ModernDownloader:
         # Add button hover effects
         self.animate_button(self.download_btn, '#00ff41', '#00cc33')
         self.animate_button(self.stop_btn, '#ff4757', '#ff3838')
+        self.animate_button(self.retry_btn, '#16537e', '#1e6ba8')
         
         # Add hover effects for all buttons after widgets are created
         def setup_button_hover():
@@ -572,27 +1080,91 @@ class ModernDownloader:
         
         self.root.after(100, setup_button_hover)
         
-        # Start animation loop for progress bar
-        def animate_progress():
-            if self.is_downloading:
-                self.update_progress_bar(self.current_progress)
-            self.root.after(100, animate_progress)
+        # Frame loop: apply queued UI updates and animate the progress bars
+        def frame():
+            self.process_ui_events()
+            self.root.after(FRAME_MS, frame)
+        
+        frame()
         
-        animate_progress()
+        def log_flush():
+            self.flush_log()
+            self.root.after(LOG_FLUSH_MS, log_flush)
+        
+        log_flush()
         self.log_message("🎵 YouTube Music Downloader Pro - Ready!")
         
-        # Handle window close event
-        def on_closing():
-            if self.is_downloading:
-                self.stop_download = True
-                self.log_message("🛑 Stopping download before exit...")
-                # Give time for cleanup
-                self.root.after(1000, self.root.destroy)
-            else:
-                self.root.destroy()
+        # Runs cut short by closing the window can be resumed; a crashed one once its heartbeat is stale
+        if self.refresh_resumable():
+            self.log_message("⏯️ An earlier download was interrupted; press Resume to continue it")
+        self.root.after(int(STALE_AFTER * 1000) + 1000, self.refresh_resumable)
+        
+        # pytubefix is slow to import, so load it once the window is up instead of before
+        self.root.after(200, lambda: threading.Thread(target=load_pytubefix, daemon=True).start())
         
-        self.root.protocol("WM_DELETE_WINDOW", on_closing)
-        self.root.mainloop()
+        # Metrics are exported only when the environment asks for it
+        try:
+            metrics_server, metrics_writer = metrics.start_exports()
+        except (OSError, ValueError) as e:
+            metrics_server, metrics_writer = None, None
+            self.log_message(f"⚠️ Cannot export metrics: {e}")
+        if metrics_server:
+            self.log_message(f"📈 Metrics at http://127.0.0.1:{metrics_server.server_port}/metrics")
+        if metrics_writer:
+            self.log_message(f"📈 Metrics snapshot: {metrics_writer.path}")
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        try:
+            self.root.mainloop()
+        finally:
+            if not self.download_finished.is_set() and not self.service_job:
+                # Left the main loop some other way, such as Ctrl+C: still drain before closing what
+                # the run writes to
+                self.stop_download = True
+                if self.pipeline:
+                    self.pipeline.stop()
+                self.wait_for_download()
+            # Runs still going are left resumable
+            self.journal.close()
+            if metrics_writer:
+                metrics_writer.stop()
+    
+    def on_closing(self):
+        """Close the window; a local run is stopped first, left resumable, and the window waits for it"""
+        if self.is_downloading and not self.service_job:
+            if self.closing:
+                return
+            self.closing = True
+            if not self.stop_download:
+                self.stop_download = True
+                if self.pipeline:
+                    self.pipeline.stop()
+                self.log_message("🛑 Stopping download before exit; press Resume next time to continue it")
+            self.status_var.set("🛑 Stopping download before exit...")
+            self.close_when_drained()
+        else:
+            self.root.destroy()
+    
+    def close_when_drained(self):
+        """Destroy the window once the download thread has exited.
+
+        The pipeline waits for its workers before it returns, so by then
+        ffmpeg has been stopped and every status is in the journal.
+        """
+        if self.download_finished.is_set():
+            self.root.destroy()
+        else:
+            self.root.after(100, self.close_when_drained)
+    
+    def wait_for_download(self):
+        """Block until the download thread has exited, through repeated Ctrl+C as well"""
+        while True:
+            try:
+                while not self.download_finished.wait(0.1):
+                    pass
+                return
+            except KeyboardInterrupt:
+                continue
     
     def _find_and_animate_buttons(self, widget):
         """Recursively find and animate buttons"""
@@ -691,7 +1263,10 @@ class ModernDownloader:
             if 'playlist' in url or 'list=' in url:
                 self.url_status_label.config(text="✅ Playlist URL detected", fg='#00ff41')
             else:
-                self.url_status_label.config(text="✅ Video URL detected", fg='#00ff41')
+                # Only the cache is asked, so typing never waits on the network
+                title = cached_title(self.metadata, url)
+                text = f"✅ Video URL detected: {title}" if title else "✅ Video URL detected"
+                self.url_status_label.config(text=text, fg='#00ff41')
         elif 'youtube.com' in url or 'youtu.be' in url:
             self.url_status_label.config(text="⚠️ Please use full YouTube URL (https://...)", fg='#ffa502')
         else:
@@ -701,17 +1276,29 @@ class ModernDownloader:
         """Stop the current download process"""
         if self.is_downloading:
             self.stop_download = True
+            self.download_cancelled = True
+            if self.pipeline:
+                self.pipeline.stop()
             self.log_message("🛑 Stopping download...")
             self.status_var.set("🛑 Stopping download...")
             
             # Update UI immediately
             self.stop_btn.configure(text="⏳ Stopping...", state='disabled', bg='#666666')
-            self.root.update()
     
     def check_stop_flag(self):
         """Check if download should be stopped"""
         if self.stop_download:
-            raise Exception("Download stopped by user")
+            raise StopRequested()
+    
+    def update_queue_depths(self):
+        """Show how many tracks wait in front of and run inside each stage"""
+        pipeline = self.pipeline
+        if not pipeline:
+            self.queue_var.set("")
+            return
+        stats = pipeline.stage_stats()
+        self.queue_var.set("   ".join(
+            f"{stage.capitalize()}: {stats[stage][1]} active, {stats[stage][0]} queued" for stage in STAGES))
     
     def reset_download_state(self):
         """Reset download state and UI"""
@@ -722,9 +1309,11 @@ class ModernDownloader:
         # Reset UI
         self.download_btn.configure(text="🚀 Start Download", state='normal', bg='#00ff41')
         self.download_btn.pack(side='left', padx=(0, 10))
+        self.retry_btn.configure(state='normal')
         
         self.stop_btn.configure(text="⛔ Stop Download", state='normal', bg='#ff4757')
         self.stop_btn.pack_forget()
+        self.refresh_resumable()
         
         # Clear progress info
         self.current_file_var.set("")
@@ -732,8 +1321,14 @@ class ModernDownloader:
         self.download_speed_var.set("")
         self.eta_var.set("")
         self.progress_var.set("0%")
-        self.update_progress_bar(0)
+        self.queue_var.set("")
+        self.current_progress = 0
+        with self.progress_lock:
+            self.progress_updates.clear()
+            self.encode_updates.clear()
+        self.reset_progress_rows(self.row_bar_height)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = ModernDownloader()
     app.run()
@@ -0,0 +1,200 @@
+"""Keep-alive HTTP connection pool shared by every request of a run.
+
+urllib opens a new connection (TCP + TLS handshake) for every request.
+Inside a session() all urlopen() calls - pytubefix's metadata requests
+as well as downloader.py's range requests - go through pooled handlers
+instead, which keep connections open per host and reuse them once a
+response has been read to the end.
+"""
+import contextlib
+import http.client
+import socket
+import ssl
+import threading
+import urllib.request
+from urllib.error import URLError
+
+MAX_IDLE_PER_HOST = 16
+
+
+class PooledResponse(http.client.HTTPResponse):
+    """HTTPResponse that calls on_done once its body is read to the end or it is closed"""
+    abandoned = False
+    done = False
+    on_done = None
+
+    def close(self):
+        # length reaches 0 once a Content-Length body is read, even through read1()
+        if self.fp is not None and self.length != 0:
+            # Unread body bytes are still in the socket, so it cannot carry another request
+            self.abandoned = True
+        super().close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        self.done = True
+        if self.on_done:
+            on_done, self.on_done = self.on_done, None
+            on_done()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections by (scheme, host), with reuse statistics"""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._context = ssl.create_default_context()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def acquire(self, scheme, host, timeout):
+        """Return (connection, reused) for a request to host"""
+        with self._lock:
+            idle = self._idle.get((scheme, host), [])
+            while idle:
+                conn = idle.pop()
+                if conn.sock is not None:
+                    self.reused += 1
+                    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                        timeout = socket.getdefaulttimeout()
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+            self.opened += 1
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, timeout=timeout, context=self._context)
+        else:
+            conn = http.client.HTTPConnection(host, timeout=timeout)
+        conn.response_class = PooledResponse
+        return conn, False
+
+    def release(self, scheme, host, conn, response):
+        """Keep conn for the next request if response was read to the end and the server allows it"""
+        if response.abandoned or response.will_close or conn.sock is None:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.opened,
+                "connections_reused": self.reused,
+                "reuse_ratio": self.reused / self.requests if self.requests else 0.0,
+            }
+
+    def describe(self):
+        stats = self.stats()
+        return (f"{stats['requests']} HTTP requests over {stats['connections_opened']} connections "
+                f"({stats['reuse_ratio']:.0%} reused)")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class _PooledHandlerMixin:
+    scheme = None
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def _open(self, req):
+        host = req.host
+        if not host:
+            raise URLError("no host given")
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): value for name, value in headers.items()}
+
+        self.pool.count_request()
+        while True:
+            conn, reused = self.pool.acquire(self.scheme, host, req.timeout)
+            try:
+                conn.request(req.get_method(), req.selector, req.data, headers,
+                             encode_chunked=req.has_header("Transfer-encoding"))
+                response = conn.getresponse()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # The server may have dropped an idle keep-alive connection; try a fresh one
+                if reused:
+                    continue
+                raise e if isinstance(e, http.client.HTTPException) else URLError(e)
+
+        release = lambda: self.pool.release(self.scheme, host, conn, response)
+        if response.done:
+            release()  # No body at all (HEAD, 204, 304): the connection is free right away
+        else:
+            response.on_done = release
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+
+# Proxied requests keep urllib's one-connection-per-request behaviour
+
+class PooledHTTPHandler(_PooledHandlerMixin, urllib.request.HTTPHandler):
+    scheme = "http"
+
+    def http_open(self, req):
+        return super().http_open(req) if req.has_proxy() else self._open(req)
+
+
+class PooledHTTPSHandler(_PooledHandlerMixin, urllib.request.HTTPSHandler):
+    scheme = "https"
+
+    def https_open(self, req):
+        return super().https_open(req) if req.has_proxy() or req._tunnel_host else self._open(req)
+
+
+_active = None
+_sessions = 0  # Sessions open on _active
+_active_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def session():
+    """Send every urlopen() call through one ConnectionPool until the block exits.
+
+    Sessions open at the same time share one pool, whether nested, such
+    as a CLI or GUI run and the pipeline inside it, or side by side in
+    other threads, such as the service's jobs. The pool is closed when
+    the last of them exits.
+    """
+    global _active, _sessions
+    with _active_lock:
+        if _active is None:
+            _active = ConnectionPool()
+            urllib.request.install_opener(urllib.request.build_opener(
+                PooledHTTPHandler(_active), PooledHTTPSHandler(_active)))
+        _sessions += 1
+        pool = _active
+    try:
+        yield pool
+    finally:
+        with _active_lock:
+            _sessions -= 1
+            last = _sessions == 0
+            if last:
+                _active = None
+                urllib.request.install_opener(None)
+        if last:
+            pool.close()
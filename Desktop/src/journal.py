@@ -0,0 +1,250 @@
+"""Crash-safe journal of download jobs, so an interrupted run can resume.
+
+A job is the list of video and playlist URLs a run was asked for, with
+its download settings. The pipeline records each of the job's videos
+when it is queued and again on every status change, each write its own
+SQLite transaction, so the journal survives a closed window, Ctrl+C or
+a crash. Once a job ends with every video processed, or the user cancels
+it, it is deleted; a job that was stopped, or whose process died, stays
+resumable.
+
+A resumed job lists its URLs again (playlists come from the metadata
+cache) and the pipeline skips every video that was done or skipped
+before; failed videos are tried again. A video that was still in
+progress is revalidated against the output folder's ledger: if its
+output was finished before the journal heard of it, it counts as done,
+else it runs again and its download resumes from its .part file.
+
+The journal is one file in the user cache folder, shared by the CLI, the
+GUI and the service; each resumes only the jobs it started. A process
+working on jobs refreshes their heartbeat, so a job whose heartbeat is
+older than STALE_AFTER is known to have lost its process.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from metacache import default_cache_path, video_id_from_url
+
+JOURNAL_NAME = "journal.sqlite3"
+HEARTBEAT_INTERVAL = 5.0  # seconds between heartbeats of the jobs a process works on
+STALE_AFTER = 30.0  # A running job without a heartbeat for this long has lost its process
+MAX_AGE = 7 * 24 * 60 * 60  # Resumable jobs untouched this long are dropped
+
+RUNNING, STOPPED = "running", "stopped"
+COMPLETED = ("done", "skipped")  # Item statuses a resumed job does not process again
+IN_PROGRESS = ("fetching", "downloading", "downloaded", "encoding", "retrying")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    origin       TEXT NOT NULL,  -- "cli", "gui" or "service"
+    urls         TEXT NOT NULL,  -- JSON list of the video and playlist URLs asked for
+    options      TEXT NOT NULL,  -- JSON download settings, output folder included
+    state        TEXT NOT NULL,  -- "running" while a process works on it, else "stopped"
+    created_at   REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+)
+"""
+
+ITEMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    job_id     TEXT NOT NULL,
+    key        TEXT NOT NULL,  -- video ID, else the URL
+    url        TEXT NOT NULL,
+    status     TEXT NOT NULL,  -- "queued" or the last pipeline status
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, key)
+)
+"""
+
+
+def default_journal_path():
+    return os.path.join(os.path.dirname(default_cache_path()), JOURNAL_NAME)
+
+
+def item_key(url):
+    return video_id_from_url(url) or url
+
+
+class Journal:
+    """Thread-safe journal of the jobs of every process, in one SQLite file"""
+
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._active = set()  # IDs of the jobs this process works on
+        self._closed = threading.Event()
+        self._heartbeat = None
+        # The GUI, CLI and service may share the file, so wait for the other's write lock
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # Every commit survives a crash of the process; only a power loss may lose the last ones
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(SCHEMA)
+            self._db.execute(ITEMS_SCHEMA)
+            old = time.time() - MAX_AGE
+            self._db.execute("DELETE FROM items WHERE job_id IN (SELECT id FROM jobs WHERE heartbeat_at < ?)", (old,))
+            self._db.execute("DELETE FROM jobs WHERE heartbeat_at < ?", (old,))
+
+    def start(self, urls, options, origin):
+        """Journal a new job and return its JournalJob"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, origin, urls, options, state, created_at, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, origin, json.dumps(list(urls)), json.dumps(options), RUNNING, now, now))
+            self._active.add(job_id)
+        self._start_heartbeat()
+        return JournalJob(self, job_id, {})
+
+    def resumable(self, origin):
+        """The jobs of origin that were stopped or lost their process, oldest first, as dicts.
+
+        counts holds the number of the job's videos by last status.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE origin = ? AND (state = ? OR heartbeat_at < ?) ORDER BY created_at",
+                (origin, STOPPED, time.time() - STALE_AFTER)).fetchall()
+            jobs = []
+            for row in rows:
+                job = dict(row)
+                job["urls"] = json.loads(job["urls"])
+                job["options"] = json.loads(job["options"])
+                job["counts"] = dict(self._db.execute(
+                    "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job["id"],)).fetchall())
+                jobs.append(job)
+        return jobs
+
+    def claim(self, job_id):
+        """The JournalJob of a resumable job, or None if another process got to it first"""
+        now = time.time()
+        with self._lock, self._db:
+            claimed = self._db.execute(
+                "UPDATE jobs SET state = ?, heartbeat_at = ? WHERE id = ? AND (state = ? OR heartbeat_at < ?)",
+                (RUNNING, now, job_id, STOPPED, now - STALE_AFTER)).rowcount
+            if not claimed:
+                return None
+            items = dict(self._db.execute("SELECT key, status FROM items WHERE job_id = ?", (job_id,)).fetchall())
+            self._active.add(job_id)
+        self._start_heartbeat()
+        return JournalJob(self, job_id, items)
+
+    def discard(self, job_id):
+        """Delete a job, e.g. one the user cancelled"""
+        with self._lock:
+            self._active.discard(job_id)
+        self._execute(("DELETE FROM items WHERE job_id = ?", (job_id,)),
+                      ("DELETE FROM jobs WHERE id = ?", (job_id,)))
+
+    def _execute(self, *statements):
+        # Pipeline threads may still report a stopped track after close() left their job resumable
+        with self._lock:
+            if self._closed.is_set():
+                return
+            with self._db:
+                for sql, params in statements:
+                    self._db.execute(sql, params)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+                self._heartbeat.start()
+
+    def _beat(self):
+        while not self._closed.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._execute(*[("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+                                for job_id in list(self._active)])
+            except sqlite3.Error as e:
+                print(f"Could not update the job journal: {e}", file=sys.stderr)
+
+    def close(self):
+        """Close the file; jobs this process still works on are left resumable"""
+        self._closed.set()
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.executemany("UPDATE jobs SET state = ? WHERE id = ?",
+                                         [(STOPPED, job_id) for job_id in self._active])
+            except sqlite3.Error as e:
+                print(f"Could not update the job journal: {e}", file=sys.stderr)
+            self._active.clear()
+            self._db.close()
+
+
+class JournalJob:
+    """The journal entries of one job, for Pipeline(journal=...).
+
+    items maps the key of each video journaled in an earlier run to its
+    last status. resumed counts the videos skipped because an earlier run
+    finished them, revalidated those of them that were still in progress
+    according to the journal.
+    """
+
+    def __init__(self, journal, job_id, items):
+        self.journal = journal
+        self.id = job_id
+        self.items = items
+        self.resumed = 0
+        self.revalidated = 0
+
+    def _write(self, sql, params):
+        # A journal that cannot be written must not fail the download itself
+        try:
+            self.journal._execute((sql, params))
+        except sqlite3.Error as e:
+            print(f"Could not update the job journal: {e}", file=sys.stderr)
+
+    def completed(self, url, ledger, output_format):
+        """Whether an earlier run finished the video at url, checking the ledger for one left in progress"""
+        key = item_key(url)
+        status = self.items.get(key)
+        if status in IN_PROGRESS and ledger.find_current(video_id_from_url(url), output_format):
+            # Finished before its status reached the journal
+            self._write("UPDATE items SET status = ?, updated_at = ? WHERE job_id = ? AND key = ?",
+                        ("done", time.time(), self.id, key))
+            self.revalidated += 1
+            status = "done"
+        if status in COMPLETED:
+            self.resumed += 1
+            return True
+        return False
+
+    def queued(self, track):
+        # A cancelled job is gone while its pipeline winds down; queue nothing more for it
+        self._write("INSERT OR REPLACE INTO items (job_id, key, url, status, updated_at) "
+                    "SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ?)",
+                    (self.id, item_key(track.url), track.url, "queued", time.time(), self.id))
+
+    def update(self, track, status):
+        self._write("UPDATE items SET status = ?, updated_at = ? WHERE job_id = ? AND key = ?",
+                    (status, time.time(), self.id, item_key(track.url)))
+
+    def end(self, stopped):
+        """Keep a stopped job for resuming, delete one that ran to the end; only the first call counts"""
+        with self.journal._lock:
+            if self.id not in self.journal._active:
+                return
+            self.journal._active.discard(self.id)
+        if stopped:
+            self._write("UPDATE jobs SET state = ?, heartbeat_at = ? WHERE id = ?", (STOPPED, time.time(), self.id))
+        else:
+            self.discard()
+
+    def discard(self):
+        try:
+            self.journal.discard(self.id)
+        except sqlite3.Error as e:
+            print(f"Could not update the job journal: {e}", file=sys.stderr)
@@ -0,0 +1,136 @@
+"""Persistent record of finished downloads, one SQLite file per output folder.
+
+Every finished track is recorded by video ID with its output path, size,
+format and checksum. In sync mode the pipeline looks videos up here
+before fetching anything, so a video whose output is still on disk is
+skipped without a single network request.
+
+Tracks that failed are recorded too, until a later run finishes them, so
+a rerun can retry just the failures (failed_urls).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+LEDGER_NAME = ".download_ledger.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    video_id    TEXT PRIMARY KEY,
+    url         TEXT,
+    title       TEXT,
+    output_path TEXT NOT NULL,  -- relative to the ledger's folder
+    size        INTEGER NOT NULL,
+    format      TEXT NOT NULL,  -- output format setting, e.g. "mp3" or "auto"
+    bitrate     TEXT,
+    checksum    TEXT NOT NULL,  -- sha256 of the output file
+    finished_at REAL NOT NULL
+)
+"""
+
+FAILURES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    url       TEXT PRIMARY KEY,
+    video_id  TEXT,
+    title     TEXT,
+    error     TEXT,
+    cause     TEXT,     -- short label, e.g. "http_403" or "network"
+    attempts  INTEGER NOT NULL,
+    failed_at REAL NOT NULL
+)
+"""
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Ledger:
+    """Thread-safe index of finished downloads keyed by video ID"""
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = os.path.dirname(os.path.abspath(path))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute(SCHEMA)
+            self._db.execute(FAILURES_SCHEMA)
+
+    @classmethod
+    def for_folder(cls, out_folder):
+        os.makedirs(out_folder, exist_ok=True)
+        return cls(os.path.join(out_folder, LEDGER_NAME))
+
+    def get(self, video_id):
+        """The recorded entry for a video as a dict with an absolute output_path, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM downloads WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["output_path"] = os.path.join(self.folder, entry["output_path"])
+        return entry
+
+    def find_current(self, video_id, output_format):
+        """The entry for a video if its output is still on disk in this format, else None.
+
+        Only the size is compared so a sync over thousands of files stays
+        cheap; the checksum is there for a full verify.
+        """
+        if not video_id:
+            return None
+        entry = self.get(video_id)
+        if not entry or entry["format"] != output_format:
+            return None
+        try:
+            if os.path.getsize(entry["output_path"]) != entry["size"]:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def record(self, video_id, output_path, output_format, bitrate=None, url=None, title=None, checksum=None):
+        """Record a finished output, replacing any earlier entry for the video"""
+        size = os.path.getsize(output_path)
+        checksum = checksum or file_checksum(output_path)
+        relative = os.path.relpath(os.path.abspath(output_path), self.folder)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO downloads "
+                "(video_id, url, title, output_path, size, format, bitrate, checksum, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, url, title, relative, size, output_format, bitrate, checksum, time.time()))
+            self._db.execute("DELETE FROM failures WHERE url = ? OR video_id = ?", (url, video_id))
+
+    def record_failure(self, url, video_id=None, title=None, error=None, cause=None, attempts=1):
+        """Record that a video failed, replacing any earlier failure of the same URL"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO failures (url, video_id, title, error, cause, attempts, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, video_id, title, error, cause, attempts, time.time()))
+
+    def forget_failure(self, url):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM failures WHERE url = ?", (url,))
+
+    def failures(self):
+        """Every recorded failure not finished since, oldest first, as dicts"""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM failures ORDER BY failed_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def failed_urls(self):
+        return [failure["url"] for failure in self.failures()]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
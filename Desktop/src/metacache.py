@@ -0,0 +1,291 @@
+"""Local cache of YouTube metadata, persisted between runs.
+
+Holds playlist membership, video titles, lengths and audio stream descriptors so
+re-runs, retries and URL checks can skip the round trips to YouTube.
+Entries expire after a TTL and are revalidated lazily: a stale entry is
+only fetched again the next time it is looked up. At most max_entries
+are kept; the least recently used are evicted first.
+
+Stream download URLs are signed and expire, so a video entry is never
+considered fresh past the earliest "expire" of its stream URLs.
+
+pytubefix is only imported when YouTube is first asked (load_pytubefix):
+it pulls in aiohttp and takes longer to import than the rest of the app,
+and cache hits and URL checks never need it.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_TTL = 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 5000
+URL_EXPIRY_MARGIN = 30 * 60  # Stop trusting a stream URL this long before it expires
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11})")  # As pytubefix.extract.video_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,  -- JSON
+    expires_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+def load_pytubefix():
+    """The pytubefix package, imported on first use; call early from a thread to warm it up"""
+    import pytubefix
+    return pytubefix
+
+
+def default_cache_path():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "youtube-music-downloader", "metadata.sqlite3")
+
+
+class MetadataCache:
+    """Thread-safe TTL + LRU key/value cache stored in SQLite"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # The GUI and CLI may share the file, so wait for the other's write lock
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._db:
+            self._db.execute(SCHEMA)
+
+    def get(self, key):
+        """The cached value for key, or None when it is missing or stale"""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value, expires_at=None):
+        """Store value for the cache's TTL, or until expires_at if that is sooner"""
+        now = time.time()
+        expiry = now + self.ttl
+        if expires_at is not None:
+            expiry = min(expiry, expires_at)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) "
+                             "VALUES (?, ?, ?, ?)", (key, json.dumps(value), expiry, now))
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute("DELETE FROM entries WHERE key IN "
+                                 "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                                 (count - self.max_entries,))
+
+    def invalidate(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedStream:
+    """Stand-in for a pytubefix audio Stream, rebuilt from a cache entry.
+
+    Has what selection, downloader and pipeline use from a Stream, and
+    reports download progress to on_progress the way Stream does.
+    """
+    is_sabr = False
+
+    def __init__(self, descriptor, on_progress=None):
+        self.url = descriptor["url"]
+        self.itag = descriptor["itag"]
+        self.mime_type = descriptor["mime_type"]
+        self.subtype = descriptor["subtype"]
+        self.audio_codec = descriptor["audio_codec"]
+        self.abr = descriptor["abr"]
+        self.filesize = descriptor["filesize"]
+        self.is_default_audio_track = descriptor["is_default_audio_track"]
+        self.filename = descriptor["filename"]
+        self._on_progress = on_progress
+
+    def get_file_path(self, output_path=None):
+        output_path = os.path.abspath(output_path or os.getcwd())
+        os.makedirs(output_path, exist_ok=True)
+        return os.path.join(output_path, self.filename)
+
+    def on_progress_for_chunks(self, chunk, bytes_remaining):
+        if self._on_progress:
+            self._on_progress(self, chunk, bytes_remaining)
+
+
+def describe(stream):
+    """JSON-able descriptor of a pytubefix audio Stream for CachedStream"""
+    from pytubefix.file_system import file_system_verify  # Loaded by now: stream came from pytubefix
+
+    filename = stream.default_filename.translate(file_system_verify("NTFS"))
+    return {
+        "url": stream.url,
+        "itag": stream.itag,
+        "mime_type": stream.mime_type,
+        "subtype": stream.subtype,
+        "audio_codec": stream.audio_codec,
+        "abr": stream.abr,
+        "filesize": stream.filesize,
+        "is_default_audio_track": getattr(stream, "is_default_audio_track", True),
+        "filename": filename,
+    }
+
+
+def url_expiry(url):
+    """The "expire" timestamp of a signed stream URL, or None"""
+    expire = parse_qs(urlsplit(url).query).get("expire")
+    return int(expire[0]) if expire and expire[0].isdigit() else None
+
+
+def video_key(video_id):
+    return f"video:{video_id}"
+
+
+def fetch_video(cache, url, on_progress=None):
+    """Return (video_id, title, length, audio streams, from_cache) for a video URL.
+
+    length is the video's duration in seconds, or None if unknown.
+    A fresh cache entry gives CachedStreams without any network request.
+    Otherwise YouTube is asked and the answer cached, unless one of the
+    streams is SABR (no plain download URL to reuse).
+    """
+    video_id = video_id_from_url(url)
+    entry = cache.get(video_key(video_id)) if cache and video_id else None
+    if entry:
+        streams = [CachedStream(d, on_progress) for d in entry["streams"]]
+        return video_id, entry["title"], entry.get("length"), streams, True
+
+    yt = load_pytubefix().YouTube(url, on_progress_callback=on_progress)
+    streams = list(yt.streams.filter(only_audio=True))
+    if cache and streams and not any(getattr(s, "is_sabr", False) for s in streams):
+        expiries = [url_expiry(s.url) for s in streams]
+        expires_at = min(e for e in expiries if e) - URL_EXPIRY_MARGIN if any(expiries) else None
+        cache.put(video_key(yt.video_id),
+                  {"title": yt.title, "length": yt.length, "streams": [describe(s) for s in streams]},
+                  expires_at=expires_at)
+    return yt.video_id, yt.title, yt.length, streams, False
+
+
+def cached_title(cache, url):
+    """The title of a video URL if it is in the cache, without any network request"""
+    video_id = video_id_from_url(url)
+    entry = cache.get(video_key(video_id)) if video_id else None
+    return entry["title"] if entry else None
+
+
+class PlaylistUrls:
+    """The video URLs of a playlist, yielded while YouTube pages them in.
+
+    A fresh cache entry gives every URL at once. Otherwise later pages are
+    only requested as the consumer asks for more, so the first video can
+    start while a long playlist is still being listed. total is None until
+    the first page arrives, then the count the playlist page shows, and
+    the exact count once the last URL was yielded; the complete list is
+    cached then.
+    """
+
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        playlist_id = parse_qs(urlsplit(url).query).get("list")
+        self.key = f"playlist:{playlist_id[0] if playlist_id else url}"
+        self._cached = cache.get(self.key) if cache else None
+        self.total = len(self._cached) if self._cached is not None else None
+        self.complete = self._cached is not None
+
+    def __iter__(self):
+        if self._cached is not None:
+            yield from self._cached
+            return
+        playlist = load_pytubefix().Playlist(self.url)
+        video_urls = []
+        for video_url in playlist.url_generator():
+            if not video_urls:
+                try:
+                    # Read from the first page, which is already loaded
+                    self.total = playlist.length
+                except Exception:
+                    pass  # Only an estimate; the exact count follows at the end
+            video_urls.append(video_url)
+            yield video_url
+        self.total = len(video_urls)
+        self.complete = True
+        if self.cache:
+            self.cache.put(self.key, video_urls)
+
+
+def fetch_playlist_urls(cache, url):
+    """The video URLs of a playlist as a list, from the cache while the entry is fresh"""
+    return list(PlaylistUrls(cache, url))
+
+
+def is_playlist(url):
+    return "playlist" in url or "list=" in url
+
+
+class BatchUrls:
+    """The videos of a batch's URLs, listing playlists lazily and dropping duplicates.
+
+    total is the sum of every URL's count once each playlist has reported
+    at least an estimate, else None. on_playlist(url, count) is called when
+    a playlist was listed completely, on_error(url, error) when it could
+    not be; its videos listed until then are kept.
+    """
+
+    def __init__(self, urls, metadata, on_playlist=None, on_error=None):
+        self.items = [(url, PlaylistUrls(metadata, url) if is_playlist(url) else None) for url in urls]
+        self.on_playlist = on_playlist
+        self.on_error = on_error
+
+    @property
+    def total(self):
+        counts = [1 if playlist is None else playlist.total for _, playlist in self.items]
+        return None if None in counts else sum(counts)
+
+    def __iter__(self):
+        seen = set()
+        for url, playlist in self.items:
+            for video_url in self._expand(url, playlist):
+                # A video listed on its own and in a playlist must not be downloaded twice at once
+                key = video_id_from_url(video_url) or video_url
+                if key not in seen:
+                    seen.add(key)
+                    yield video_url
+
+    def _expand(self, url, playlist):
+        if playlist is None:
+            yield url
+            return
+        try:
+            yield from playlist
+        except Exception as e:
+            if self.on_error:
+                self.on_error(url, e)
+            return
+        if self.on_playlist:
+            self.on_playlist(url, playlist.total)
+
+
+def video_id_from_url(url):
+    """The video ID in a YouTube URL, or None; needs no network request"""
+    match = VIDEO_ID_PATTERN.search(url or "")
+    return match[1] if match else None
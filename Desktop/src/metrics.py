@@ -0,0 +1,271 @@
+"""Process-wide counters, gauges and histograms of the pipeline stages.
+
+The pipeline records into `registry`; both frontends can export it as a
+Prometheus text endpoint (serve) or as a JSON snapshot file rewritten
+periodically (SnapshotWriter). Metric names follow Prometheus naming
+conventions so the endpoint can be scraped as-is.
+
+Frontends read the export settings from the command line or from the
+environment variables METRICS_PORT_ENV and METRICS_JSON_ENV.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT_ENV = "YTMD_METRICS_PORT"
+METRICS_JSON_ENV = "YTMD_METRICS_JSON"
+DEFAULT_SNAPSHOT_INTERVAL = 10  # seconds
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+REALTIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up, per label set"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        """Sum over every label set"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(value)}"
+                                 for key, value in values]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, per label set"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Take the value from function() whenever the gauge is read, for values that change on their own"""
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    def _refresh(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        values = {key: function() for key, function in functions}
+        with self._lock:
+            self._values.update(values)
+
+    def total(self):
+        self._refresh()
+        return super().total()
+
+    def render(self):
+        self._refresh()
+        return super().render()
+
+    def snapshot(self):
+        self._refresh()
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum, per label set"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=SECONDS_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _cumulative(self):
+        with self._lock:
+            values = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._values.items())
+        for key, counts, total, count in values:
+            running = 0
+            cumulative = []
+            for bound, bucket_count in zip(self.buckets, counts):
+                running += bucket_count
+                cumulative.append((bound, running))
+            yield key, cumulative, total, count
+
+    def render(self):
+        lines = self._header()
+        for key, cumulative, total, count in self._cumulative():
+            for bound, running in cumulative:
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {running}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def snapshot(self):
+        return [{"labels": dict(key), "count": count, "sum": round(total, 6),
+                 "buckets": {_format_value(bound): running for bound, running in cumulative}}
+                for key, cumulative, total, count in self._cumulative()]
+
+
+class Registry:
+    """Named metrics; asking twice for the same name returns the same metric"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name, documentation):
+        return self._get(Counter, name, documentation)
+
+    def gauge(self, name, documentation):
+        return self._get(Gauge, name, documentation)
+
+    def histogram(self, name, documentation, buckets=SECONDS_BUCKETS):
+        return self._get(Histogram, name, documentation, buckets=buckets)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-able dict"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {"timestamp": round(time.time(), 3),
+                "metrics": {metric.name: {"type": metric.kind, "help": metric.documentation,
+                                          "samples": metric.snapshot()} for metric in metrics}}
+
+
+registry = Registry()
+
+
+def serve(port, host="127.0.0.1", metrics=None):
+    """Serve the registry at http://host:port/metrics from a daemon thread; returns the server"""
+    metrics = metrics or registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SnapshotWriter:
+    """Rewrite a JSON snapshot of the registry every `interval` seconds, and once more on stop()"""
+
+    def __init__(self, path, interval=DEFAULT_SNAPSHOT_INTERVAL, metrics=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics or registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._write_or_warn()
+
+    def write(self):
+        # Written next to the target and renamed, so readers never see half a file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fh:
+            json.dump(self.metrics.snapshot(), fh, indent=1)
+        os.replace(temp_path, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write_or_warn()
+
+    def _write_or_warn(self):
+        try:
+            self.write()
+        except OSError as e:
+            print(f"Could not write metrics snapshot {self.path}: {e}", file=sys.stderr)
+
+
+def start_exports(port=None, json_path=None, interval=DEFAULT_SNAPSHOT_INTERVAL):
+    """Start the exports asked for, falling back to the environment; returns (server, writer), either may be None"""
+    port = port or os.environ.get(METRICS_PORT_ENV)
+    json_path = json_path or os.environ.get(METRICS_JSON_ENV)
+    server = serve(int(port)) if port else None
+    writer = SnapshotWriter(json_path, interval).start() if json_path else None
+    return server, writer
@@ -0,0 +1,707 @@
+"""Staged download pipeline shared by the CLI and GUI.
+
+Every video goes through three stages connected by bounded queues:
+
+    fetch (threads) -> download (threads) -> encode (ffmpeg processes)
+
+so the download of one track overlaps the encode of the previous one and
+neither the network nor the CPU sits idle.
+
+In streaming mode the download stage pipes each chunk straight into
+ffmpeg as it arrives, so no temporary file is written and the MP3 is
+ready as soon as the last chunk lands; the encode stage is skipped.
+
+Tracks whose codec can be copied into the output container (see
+encoder.OUTPUT_FORMATS) are remuxed right after download and skip the
+encode stage too, so they never wait for a CPU slot.
+
+Downloads go through downloader.py: a dropped connection resumes at the
+last received byte, and in file mode a stopped or failed download keeps
+its .part file so the next run continues where it left off.
+
+URLs are taken from the iterable passed to run() only as the fetch queue
+has room, so a playlist given as a metacache.PlaylistUrls starts its
+first download while later pages are still being listed.
+
+Video titles and stream descriptors come from the metadata cache
+(metacache.py) while it is fresh, so a re-run needs no YouTube lookups.
+
+All HTTP traffic of a run, pytubefix's and the downloader's, shares one
+keep-alive connection pool (httppool.py).
+
+Finished tracks are recorded in the output folder's ledger (ledger.py).
+In sync mode a video whose output the ledger still finds on disk is
+skipped before any network request is made.
+
+Finished outputs are also added to the content store (contentstore.py).
+A video already encoded with the same format, bitrate and selection
+policy, for any folder, is linked or copied from there instead of being
+downloaded and encoded again.
+
+With adaptive concurrency a ConcurrencyController (ratelimit.py) moves
+the number of simultaneous downloads between 1 and max_concurrency,
+based on this pipeline's own throughput, reconnects and failures, so
+pipelines running side by side in the service adapt independently. The
+global bandwidth limit applies either way and is shared by all of them.
+
+A track that fails with a transient error or a rejection is retried
+with exponential backoff (retry.py); permanent errors fail it at once.
+Rejections (403/429, bot detection) feed a circuit breaker that pauses
+every fetch and download worker while YouTube keeps refusing. Failed
+tracks are recorded in the ledger, so a later run can retry only them.
+
+Every status change is also appended to the folder's JSON-lines event
+log (eventlog.py), framed by run_start and run_end events. Stage
+timings, bytes, queue depths and failures are recorded in the metrics
+registry (metrics.py).
+
+With a journal (journal.py) every queued track and status change is also
+written to the crash-safe job journal. A resumed job skips the URLs an
+earlier run finished, and one left in progress whose output the ledger
+finds on disk.
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from urllib.error import HTTPError
+import downloader
+import httppool
+import metrics
+import retry
+from ratelimit import AdaptiveLimit, ConcurrencyController
+from metacache import MetadataCache, fetch_video, video_key, video_id_from_url
+from ledger import Ledger
+from contentstore import ContentStore, profile_key
+from eventlog import EventLog
+from encoder import Encoder, EncodeError, DEFAULT_BITRATE, DEFAULT_FORMAT, DEFAULT_WORKERS as DEFAULT_ENCODE_WORKERS
+from selection import select_stream, describe_stream, DEFAULT_POLICY
+
+DEFAULT_CONCURRENCY = 3
+MAX_ADAPTIVE_CONCURRENCY = 8
+QUEUE_SIZE = 4
+
+STAGES = ("fetch", "download", "encode")
+
+_DONE = object()  # Sentinel that shuts down a stage worker
+STALE_URL_CODES = (403, 404, 410)  # A cached stream URL that gets these is fetched again
+FINAL_STATUSES = ("done", "skipped", "failed", "stopped")
+NETWORK_STAGES = ("fetch", "download")  # Stages that wait out an open circuit breaker
+
+METADATA_SECONDS = metrics.registry.histogram(
+    "ytmd_metadata_fetch_seconds", "Time to look up a video's title and audio streams, by source (cache or youtube)")
+DOWNLOAD_BYTES = metrics.registry.counter(
+    "ytmd_download_bytes_total", "Audio bytes downloaded")
+DOWNLOAD_SECONDS = metrics.registry.histogram(
+    "ytmd_download_seconds", "Duration of a track's download, by mode (file, sabr, or stream incl. encoding)")
+ENCODE_SECONDS = metrics.registry.histogram(
+    "ytmd_encode_seconds", "Duration of an ffmpeg encode of a downloaded file, by mode (transcode or remux)")
+ENCODE_REALTIME = metrics.registry.histogram(
+    "ytmd_encode_realtime_factor", "Seconds of audio encoded per second, by mode", buckets=metrics.REALTIME_BUCKETS)
+CLEANUP_SECONDS = metrics.registry.histogram(
+    "ytmd_cleanup_seconds", "Time to remove the partial files of a stopped or failed track")
+FAILURES = metrics.registry.counter(
+    "ytmd_failures_total", "Failed tracks by cause")
+TRACKS = metrics.registry.counter(
+    "ytmd_tracks_total", "Tracks that finished, by final status")
+QUEUE_DEPTH = metrics.registry.gauge(
+    "ytmd_queue_depth", "Tracks waiting in front of each stage")
+ACTIVE = metrics.registry.gauge(
+    "ytmd_stage_active", "Tracks being worked on in each stage")
+RETRIES = metrics.registry.counter(
+    "ytmd_retries_total", "Retries of failed tracks by stage and cause")
+
+
+class StopRequested(Exception):
+    """Raised inside a stage when the user stopped the pipeline"""
+    def __init__(self):
+        super().__init__("Download stopped by user")
+
+
+def failure_cause(error):
+    """Short label for why a track failed, e.g. "http_403", "network" or "encode" """
+    if isinstance(error, HTTPError):
+        return f"http_{error.code}"
+    if isinstance(error, EncodeError):
+        return "encode"
+    if downloader.is_transient(error):
+        return "network"
+    return type(error).__name__
+
+
+def _remove_earlier_output(path):
+    """Delete an earlier output before ffmpeg writes a new one.
+
+    It may be a hardlink into the content store, which ffmpeg would
+    otherwise overwrite in place.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class Track:
+    """One video moving through the pipeline"""
+    def __init__(self, index, url, out_folder, total=None):
+        self.index = index
+        self.url = url
+        self.out_folder = out_folder
+        self.total = total
+        self.title = None
+        self.video_id = None
+        self.duration = None  # seconds
+        self.stream = None
+        self.cached = False
+        self.downloaded_path = None
+        self.output_path = None
+        self.output_written = False  # Whether this attempt replaced output_path, so it may remove it
+        self.extension = None
+        self.remux = False
+        self.status = "queued"
+        self.error = None
+        self.retries = 0
+        self.queued_at = time.time()
+
+    @property
+    def position(self):
+        return f" ({self.index}/{self.total})" if self.total and self.total > 1 else ""
+
+    @property
+    def name(self):
+        return self.title or self.url
+
+
+class Pipeline:
+    """Run many videos through the fetch -> download -> encode stages.
+
+    on_status(track, status, message) is called from the stage threads
+    whenever a track changes state; status is one of "fetching",
+    "downloading", "downloaded", "encoding", "retrying", "done",
+    "skipped", "failed" or "stopped".
+    on_progress(track, stream, chunk, bytes_remaining) forwards the
+    pytubefix download progress of each track.
+    on_encode_progress(track, fraction) reports how far ffmpeg has got
+    through an encode or remux, from ffmpeg's own position output.
+    on_pause(seconds) is called when the circuit breaker pauses every
+    fetch and download because YouTube keeps rejecting requests.
+    on_total(total) is called when the number of videos of a lazily
+    listed playlist becomes known or changes (see run).
+    """
+
+    def __init__(self, out_folder, concurrency=DEFAULT_CONCURRENCY,
+                 encode_workers=DEFAULT_ENCODE_WORKERS, queue_size=QUEUE_SIZE,
+                 on_status=None, on_progress=None, on_encode_progress=None, on_pause=None, on_total=None,
+                 stop_on_error=False, encoder=None,
+                 streaming=False, output_format=DEFAULT_FORMAT, bitrate=DEFAULT_BITRATE,
+                 selection=DEFAULT_POLICY, sync=False, ledger=None, metadata=None,
+                 connections=downloader.DEFAULT_CONNECTIONS, event_log=None,
+                 adaptive=False, max_concurrency=MAX_ADAPTIVE_CONCURRENCY, retry_policy=None,
+                 dedup=True, store=None, journal=None):
+        self.out_folder = out_folder
+        self.concurrency = max(1, concurrency)
+        # Adaptive runs start enough download threads for the maximum; the slots decide how many work
+        self.download_slots = AdaptiveLimit(self.concurrency, max(self.concurrency, max_concurrency)) if adaptive else None
+        self.encode_workers = max(1, encode_workers)
+        self.encoder = encoder or Encoder(workers=self.encode_workers, bitrate=bitrate,
+                                          output_format=output_format)
+        self.selection = selection
+        self.connections = max(1, connections)
+        self.sync = sync
+        self._owns_ledger = ledger is None
+        self.ledger = ledger or Ledger.for_folder(out_folder)
+        self._owns_metadata = metadata is None
+        self.metadata = metadata or MetadataCache()
+        self._owns_store = dedup and store is None
+        self.store = (store or ContentStore()) if dedup else None
+        self.profile = profile_key(self.encoder.output_format, self.encoder.bitrate, selection)
+        self._owns_event_log = event_log is None
+        self.event_log = event_log or EventLog.for_folder(out_folder)
+        self.journal = journal  # journal.JournalJob, or None
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_encode_progress = on_encode_progress
+        self.on_pause = on_pause
+        self.on_total = on_total
+        self.stop_on_error = stop_on_error
+        self.retry_policy = retry_policy or retry.RetryPolicy()
+        self.breaker = retry.CircuitBreaker(on_open=self._on_breaker_open)
+        self.streaming = streaming
+        self.total = None
+        self.tracks = []
+        self.http = None
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES}
+        self.waiting = {stage: 0 for stage in STAGES}
+        self.active = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stopped_by_user = False
+        # This pipeline's share of DOWNLOAD_BYTES, reconnects, RETRIES and FAILURES
+        self.bytes_downloaded = 0
+        self.errors = 0
+
+    def stop(self):
+        """Stop every stage; queued tracks are skipped"""
+        self.stopped_by_user = True
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def check_stop(self):
+        if self._stop.is_set():
+            raise StopRequested()
+
+    def queue_depths(self):
+        """Number of tracks waiting in front of each stage"""
+        with self._lock:
+            return dict(self.waiting)
+
+    def stage_stats(self):
+        """(waiting, active) track counts for each stage"""
+        with self._lock:
+            return {stage: (self.waiting[stage], self.active[stage]) for stage in STAGES}
+
+    @property
+    def download_limit(self):
+        """Downloads allowed to run at once right now"""
+        return self.download_slots.limit if self.download_slots else self.concurrency
+
+    def _count_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def run(self, urls, total=None):
+        """Process every URL and return the list of tracks once all are finished.
+
+        Without a total, urls may be an iterable with a `total` attribute,
+        such as metacache.PlaylistUrls, read as tracks are queued; every
+        track gets the exact count once the last URL has been queued.
+        """
+        with httppool.session() as self.http:
+            return self._run(urls, total)
+
+    def _run(self, urls, total):
+        self.total = total
+        started = time.time()
+        self.event_log.write("run_start", out_folder=os.path.abspath(self.out_folder), total=total,
+                             output_format=self.encoder.output_format, bitrate=self.encoder.bitrate,
+                             selection=self.selection, streaming=self.streaming, sync=self.sync,
+                             concurrency=self.concurrency, connections=self.connections,
+                             retries=self.retry_policy.retries)
+        stages = [
+            ("fetch", self._fetch, self.concurrency),
+            ("download", self._download,
+             self.download_slots.maximum if self.download_slots else self.concurrency),
+            ("encode", self._encode, self.encode_workers),
+        ]
+        controller = None
+        if self.download_slots:
+            controller = ConcurrencyController(
+                self.download_slots, bytes_done=lambda: self.bytes_downloaded, errors=lambda: self.errors,
+                shared_bytes_done=DOWNLOAD_BYTES.total, on_change=lambda limit, throughput: self.event_log.write(
+                    "concurrency", limit=limit, bytes_per_second=round(throughput))).start()
+        workers = []
+        for stage, handler, count in stages:
+            exited = [threading.Event() for _ in range(count)]
+            for event in exited:
+                threading.Thread(target=self._stage_worker, args=(stage, handler, event), daemon=True).start()
+            workers.append((stage, exited))
+
+        lazy_total = total is None and hasattr(urls, "total")
+        listing_error = None
+        interrupted = False
+        resumed = 0
+        try:
+            for url in urls:
+                if self.stopped:
+                    break
+                if self.journal and self.journal.completed(url, self.ledger, self.encoder.output_format):
+                    resumed += 1
+                    continue
+                index = len(self.tracks) + 1
+                if lazy_total and urls.total is not None:
+                    self._update_total(max(urls.total - resumed, index))
+                track = Track(index, url, self.out_folder, self.total)
+                self.tracks.append(track)
+                if self.journal:
+                    self.journal.queued(track)
+                self._enqueue("fetch", track)
+            else:
+                if lazy_total or resumed:
+                    self._update_total(len(self.tracks))
+        except KeyboardInterrupt:
+            interrupted = True
+            self.stop()
+        except Exception as e:
+            # A playlist page that fails to load ends the listing; what was queued still runs
+            listing_error = e
+
+        interrupted = self._shut_down(workers) or interrupted
+        if controller:
+            controller.stop()
+        counts = {}
+        for track in self.tracks:
+            counts[track.status] = counts.get(track.status, 0) + 1
+        self.event_log.write("run_end", elapsed=round(time.time() - started, 3), tracks=len(self.tracks),
+                             statuses=counts, stopped_by_user=self.stopped_by_user, resumed=resumed,
+                             http=self.http.stats() if self.http else None,
+                             store=self.store.stats() if self.store else None,
+                             listing_error=str(listing_error) if listing_error else None)
+        if self.journal:
+            # A stopped job stays resumable; one that ran out of URLs, or cannot list more, is over
+            self.journal.end(stopped=self.stopped)
+        if self._owns_event_log:
+            self.event_log.close()
+        if self._owns_ledger:
+            self.ledger.close()
+        if self._owns_metadata:
+            self.metadata.close()
+        if self._owns_store:
+            self.store.close()
+        if interrupted:
+            raise KeyboardInterrupt
+        if listing_error:
+            raise listing_error
+        return self.tracks
+
+    def _shut_down(self, workers):
+        """Shut the stages down in order so every queued track is drained; True if Ctrl+C came meanwhile.
+
+        Ctrl+C stops every stage but still waits for the workers, so ffmpeg
+        is killed and each track cleans up before the caller closes the
+        ledger, caches and journal the workers write to. Each worker sets
+        its event on exit: a Thread.join() interrupted by Ctrl+C reports the
+        thread as finished on Python 3.11, so it cannot be waited on again.
+        """
+        interrupted = False
+        sent = {stage: 0 for stage, _ in workers}
+        while True:
+            try:
+                for stage, exited in workers:
+                    while sent[stage] < len(exited):
+                        self.queues[stage].put(_DONE)
+                        sent[stage] += 1
+                    for event in exited:
+                        while not event.wait(0.1):
+                            pass
+                return interrupted
+            except KeyboardInterrupt:
+                interrupted = True
+                self.stop()
+
+    def _update_total(self, total):
+        if total == self.total:
+            return
+        self.total = total
+        for track in self.tracks:
+            track.total = total
+        self.event_log.write("total", total=total)
+        if self.on_total:
+            self.on_total(total)
+
+    def _stage_worker(self, stage, handler, exited):
+        try:
+            self._work(stage, handler)
+        finally:
+            exited.set()
+
+    def _work(self, stage, handler):
+        while True:
+            track = self.queues[stage].get()
+            if track is _DONE:
+                return
+            with self._lock:
+                self.waiting[stage] -= 1
+                self.active[stage] += 1
+                self._publish_depths(stage)
+            try:
+                if stage == "download" and self.download_slots:
+                    with self.download_slots:
+                        self._process(stage, handler, track)
+                else:
+                    self._process(stage, handler, track)
+            except Exception as e:
+                # A failing status callback must not take the worker down,
+                # or the queues in front of this stage would never drain
+                traceback.print_exc()
+                if track.status not in FINAL_STATUSES:
+                    self._fail_safely(track, e)
+            finally:
+                with self._lock:
+                    self.active[stage] -= 1
+                    self._publish_depths(stage)
+
+    def _process(self, stage, handler, track):
+        try:
+            if self.stopped and track.status == "queued":
+                # Never started, so there is nothing to report or clean up
+                track.status = "stopped"
+                return
+            next_stage = self._attempt(stage, handler, track)
+            if next_stage:
+                self._enqueue(next_stage, track)
+        except StopRequested:
+            self._cleanup(track)
+            self._set_status(track, "stopped", "Download stopped by user")
+        except Exception as e:
+            self._cleanup(track)
+            self._fail(track, e)
+
+    def _fail(self, track, error):
+        """Report track as failed: metrics, ledger, event log, journal and on_status"""
+        track.error = error
+        cause = failure_cause(error)
+        FAILURES.inc(cause=cause)
+        self._count_error()
+        self._record_failure(track, cause)
+        if self.stop_on_error:
+            self._stop.set()
+        self._set_status(track, "failed", str(error))
+
+    def _fail_safely(self, track, error):
+        """_fail for a track whose processing broke down; the track ends failed even if reporting raises"""
+        try:
+            self._fail(track, error)
+        except Exception:
+            track.status = "failed"
+            traceback.print_exc()
+
+    def _attempt(self, stage, handler, track):
+        """Run handler on track, retrying transient failures and rejections with backoff"""
+        network = stage in NETWORK_STAGES
+        while True:
+            if network and self.breaker.wait(self._stop):
+                raise StopRequested()
+            self.check_stop()
+            try:
+                next_stage = handler(track)
+            except StopRequested:
+                raise
+            except Exception as e:
+                if network:
+                    self.breaker.record(retry.classify(e))
+                if self.stopped or not self.retry_policy.should_retry(e, track.retries):
+                    raise
+                track.retries += 1
+                delay = self.retry_policy.delay(track.retries)
+                RETRIES.inc(stage=stage, cause=failure_cause(e))
+                self._count_error()
+                self._cleanup(track)
+                self._set_status(track, "retrying", f"{e}; retry {track.retries}/{self.retry_policy.retries} "
+                                                    f"in {delay:.0f}s")
+                if self._stop.wait(delay):
+                    raise StopRequested()
+                continue
+            if network:
+                self.breaker.record(None)
+            return next_stage
+
+    def _on_breaker_open(self, cooldown):
+        self.event_log.write("circuit_open", cooldown=round(cooldown, 1), trips=self.breaker.trips)
+        if self.on_pause:
+            self.on_pause(cooldown)
+
+    def _record_failure(self, track, cause):
+        try:
+            self.ledger.record_failure(track.url, track.video_id, track.title, str(track.error), cause,
+                                       attempts=track.retries + 1)
+        except sqlite3.Error as e:
+            print(f"Could not record the failure of {track.name} in the download ledger: {e}", file=sys.stderr)
+
+    def _enqueue(self, stage, track):
+        with self._lock:
+            self.waiting[stage] += 1
+            self._publish_depths(stage)
+        self.queues[stage].put(track)
+
+    def _publish_depths(self, stage):
+        QUEUE_DEPTH.set(self.waiting[stage], stage=stage)
+        ACTIVE.set(self.active[stage], stage=stage)
+
+    def _set_status(self, track, status, message=""):
+        track.status = status
+        self.event_log.track(track, status, message)
+        if self.journal:
+            self.journal.update(track, status)
+        if status in FINAL_STATUSES:
+            TRACKS.inc(status=status)
+        if self.on_status:
+            self.on_status(track, status, message)
+
+    def _progress(self, track, stream, chunk, bytes_remaining):
+        self.check_stop()
+        DOWNLOAD_BYTES.inc(len(chunk))
+        with self._lock:
+            self.bytes_downloaded += len(chunk)
+        if self.on_progress:
+            self.on_progress(track, stream, chunk, bytes_remaining)
+
+    def _fetch(self, track):
+        track.video_id = video_id_from_url(track.url)
+        if self.sync:
+            entry = self.ledger.find_current(track.video_id, self.encoder.output_format)
+            if entry:
+                track.title = entry["title"]
+                track.output_path = entry["output_path"]
+                self._set_status(track, "skipped", os.path.basename(track.output_path))
+                return None
+        self._set_status(track, "fetching", "Fetching video information...")
+        if self.store and self._from_store(track):
+            return None
+        self._resolve(track)
+        return "download"
+
+    def _from_store(self, track):
+        """Materialize the track from the content store; False if it is not there"""
+        try:
+            entry = self.store.lookup(track.video_id, self.profile)
+            if not entry:
+                return False
+            target = os.path.join(track.out_folder, entry["filename"])
+            # Appears at target only once complete, so a failure leaves an earlier output alone
+            method = self.store.materialize(entry, target)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Could not use the content store for {track.name}: {e}", file=sys.stderr)
+            return False
+        track.title = entry["title"]
+        track.output_path = target
+        self._complete(track, checksum=entry["checksum"], note=f"from store, {method}")
+        return True
+
+    def _resolve(self, track):
+        """Look up the title and pick the audio stream, from the metadata cache if fresh"""
+        started = time.perf_counter()
+        track.video_id, track.title, track.duration, streams, track.cached = fetch_video(
+            self.metadata, track.url,
+            lambda stream, chunk, remaining: self._progress(track, stream, chunk, remaining))
+        METADATA_SECONDS.observe(time.perf_counter() - started, source="cache" if track.cached else "youtube")
+        track.stream = select_stream(streams, self.selection, self.encoder,
+                                     target_kbps=int(self.encoder.bitrate.rstrip("kK")))
+        if not track.stream:
+            raise Exception("No audio stream available")
+        track.extension, track.remux = self.encoder.plan(track.stream.audio_codec)
+
+    def _download(self, track):
+        try:
+            return self._download_stream(track)
+        except HTTPError as e:
+            if not track.cached or e.code not in STALE_URL_CODES:
+                raise
+            # YouTube refused the cached URL early; fetch fresh metadata once and retry
+            self.metadata.invalidate(video_key(track.video_id))
+            self._resolve(track)
+            return self._download_stream(track)
+
+    def _download_stream(self, track):
+        # SABR streams can only be fetched through Stream.download()
+        sabr = getattr(track.stream, "is_sabr", False)
+        file_path = track.stream.get_file_path(output_path=track.out_folder)
+        resume_from = 0 if sabr or self.streaming else downloader.resume_offset(track.stream, file_path, track.video_id)
+        message = (f"File size: {track.stream.filesize / (1024*1024):.1f} MB, "
+                   f"{describe_stream(track.stream)} stream (policy: {self.selection})")
+        if resume_from:
+            message += f", resuming at {resume_from * 100 // track.stream.filesize}%"
+        self._set_status(track, "downloading", message)
+        if self.streaming and not sabr:
+            return self._download_streaming(track)
+        started = time.perf_counter()
+        if sabr:
+            track.downloaded_path = track.stream.download(output_path=track.out_folder)
+        else:
+            downloader.download(track.stream, file_path, track.video_id, self.connections, self._count_error)
+            track.downloaded_path = file_path
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, mode="sabr" if sabr else "file")
+        self.check_stop()
+        base, extension = os.path.splitext(track.downloaded_path)
+        track.output_path = base + track.extension
+        if track.output_path == track.downloaded_path:
+            # ffmpeg cannot remux a file onto itself
+            track.downloaded_path = base + ".source" + extension
+            os.replace(track.output_path, track.downloaded_path)
+        if track.remux:
+            # Copying the codec is I/O-bound, so do it here instead of queueing for a CPU slot
+            return self._encode(track)
+        self._set_status(track, "downloaded", "Waiting for encoder")
+        return "encode"
+
+    def _download_streaming(self, track):
+        base, _ = os.path.splitext(track.stream.get_file_path(output_path=track.out_folder))
+        track.output_path = base + track.extension
+        started = time.perf_counter()
+        try:
+            chunks = downloader.iter_stream(track.stream, connections=self.connections,
+                                            on_reconnect=self._count_error)
+            track.output_written = True
+            _remove_earlier_output(track.output_path)
+            self.encoder.encode_stream(chunks, track.output_path, remux=track.remux)
+        except EncodeError:
+            self.check_stop()
+            raise
+        self.check_stop()
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, mode="stream")
+        self._complete(track)
+        return None
+
+    def _encode(self, track):
+        if track.remux:
+            self._set_status(track, "encoding", f"Remuxing to {track.extension} without re-encoding...")
+        else:
+            self._set_status(track, "encoding", f"Converting to {track.extension[1:].upper()}...")
+        try:
+            on_progress = None
+            if self.on_encode_progress:
+                on_progress = lambda fraction: self.on_encode_progress(track, fraction)
+            track.output_written = True
+            _remove_earlier_output(track.output_path)
+            started = time.perf_counter()
+            self.encoder.encode(track.downloaded_path, track.output_path,
+                                should_stop=lambda: self.stopped, remux=track.remux,
+                                duration=track.duration, on_progress=on_progress)
+        except EncodeError:
+            self.check_stop()  # A cancelled encode is a stop, not a failure
+            raise
+        self.check_stop()
+        elapsed = time.perf_counter() - started
+        mode = "remux" if track.remux else "transcode"
+        ENCODE_SECONDS.observe(elapsed, mode=mode)
+        if track.duration and elapsed > 0:
+            ENCODE_REALTIME.observe(track.duration / elapsed, mode=mode)
+        if os.path.exists(track.downloaded_path):
+            os.remove(track.downloaded_path)
+        self._complete(track)
+        return None
+
+    def _complete(self, track, checksum=None, note=None):
+        if self.store and not checksum:
+            try:
+                checksum = self.store.add(track.video_id, self.profile, track.output_path, track.title)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Could not add {track.name} to the content store: {e}", file=sys.stderr)
+        try:
+            self.ledger.record(track.video_id, track.output_path, self.encoder.output_format,
+                               self.encoder.bitrate, url=track.url, title=track.title, checksum=checksum)
+        except (sqlite3.Error, OSError) as e:
+            # The output is fine; only the next sync will process this video again
+            print(f"Could not record {track.name} in the download ledger: {e}", file=sys.stderr)
+        message = os.path.basename(track.output_path)
+        self._set_status(track, "done", f"{message} ({note})" if note else message)
+
+    def _cleanup(self, track):
+        """Remove partial files left behind by a stopped or failed track.
+
+        An unfinished download is still only a .part file at this point and
+        is kept, so the next run can resume it. An output this attempt did
+        not start writing is an earlier run's, and is kept too.
+        """
+        started = time.perf_counter()
+        for path in (track.downloaded_path, track.output_path if track.output_written else None):
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+        track.output_written = False
+        CLEANUP_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,223 @@
+"""Bandwidth limiting and adaptive download concurrency.
+
+`limiter` is one token bucket shared by every download in the process:
+each block read by downloader.py takes its size in tokens, so all
+connections together stay under the configured rate. The rate can
+follow a daily schedule, e.g. capped during business hours and
+unlimited at night.
+
+AdaptiveLimit bounds how many downloads run at once, and a
+ConcurrencyController moves that bound between 1 and its maximum:
+one more download while throughput keeps growing, half as many as soon
+as the remote answers with errors or throttling (additive increase,
+multiplicative decrease).
+
+Each pipeline has a limit and controller of its own, fed by its own
+bytes and errors, so one job backing off does not slow the jobs running
+beside it in the service. Only the bandwidth limit is shared: a
+controller stops adding downloads once the whole process, not just its
+own pipeline, reaches the rate.
+"""
+import re
+import threading
+import time
+
+import metrics
+
+CONTROL_INTERVAL = 5.0  # seconds between concurrency decisions
+GAIN_THRESHOLD = 1.1  # Throughput must grow 10% for another download to be worth it
+
+RATE_LIMIT = metrics.registry.gauge(
+    "ytmd_rate_limit_bytes_per_second", "Current global download rate limit, 0 when unlimited")
+CONCURRENCY_LIMIT = metrics.registry.gauge(
+    "ytmd_download_concurrency", "Downloads allowed to run at once, over every adaptive pipeline running")
+
+
+def parse_rate(text):
+    """Bytes per second from text such as "500K", "2M", "2MB/s" or "1.5m"; 0 or "" means unlimited"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*", (text or "0").lower())
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r}")
+    return int(float(match[1]) * 1024 ** " kmg".index(match[2] or " "))
+
+
+class RateSchedule:
+    """Rates for times of day, from a spec like "09:00-18:00=2M,18:00-23:00=5M".
+
+    A window may wrap past midnight ("22:00-06:00=0"). Times outside every
+    window use the default rate.
+    """
+
+    def __init__(self, spec):
+        self.windows = []
+        for part in filter(None, (part.strip() for part in spec.split(","))):
+            match = re.fullmatch(r"(\d{1,2}):?(\d{2})?\s*-\s*(\d{1,2}):?(\d{2})?\s*=\s*(.+)", part)
+            if not match:
+                raise ValueError(f"Invalid schedule window: {part!r} (expected HH:MM-HH:MM=RATE)")
+            start = int(match[1]) * 60 + int(match[2] or 0)
+            end = int(match[3]) * 60 + int(match[4] or 0)
+            self.windows.append((start, end, parse_rate(match[5])))
+
+    def rate_at(self, when=None, default=0):
+        local = time.localtime(when)
+        minute = local.tm_hour * 60 + local.tm_min
+        for start, end, rate in self.windows:
+            inside = start <= minute < end if start <= end else minute >= start or minute < end
+            if inside:
+                return rate
+        return default
+
+
+class TokenBucket:
+    """Thread-safe token bucket; consume() blocks until the bytes fit under the rate.
+
+    Callers take their tokens up front and then sleep off any deficit, so
+    concurrent readers are served in the order they asked. A rate of 0
+    means unlimited.
+    """
+
+    def __init__(self, rate=0, burst=None, schedule=None):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.configure(rate, burst, schedule)
+
+    def configure(self, rate=0, burst=None, schedule=None):
+        """Set the default rate (bytes/s), the burst size and an optional RateSchedule"""
+        with self._lock:
+            self.default_rate = rate
+            self.burst = burst
+            self.schedule = schedule
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+    @property
+    def rate(self):
+        if self.schedule:
+            return self.schedule.rate_at(default=self.default_rate)
+        return self.default_rate
+
+    def consume(self, amount):
+        rate = self.rate
+        if not rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            burst = self.burst or rate  # One second's worth by default
+            self._tokens = min(burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= amount
+            deficit = -self._tokens
+        if deficit > 0:
+            time.sleep(deficit / rate)
+
+
+limiter = TokenBucket()
+# Read at export time: a schedule changes the rate without any call to configure()
+RATE_LIMIT.set_function(lambda: limiter.rate)
+
+
+class AdaptiveLimit:
+    """A semaphore whose number of slots can change while it is in use"""
+
+    def __init__(self, limit, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = min(max(1, limit), self.maximum)
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_use >= self.limit:
+                self._condition.wait()
+            self.in_use += 1
+
+    def release(self):
+        with self._condition:
+            self.in_use -= 1
+            self._condition.notify()
+
+    def set_limit(self, limit):
+        with self._condition:
+            self.limit = min(max(1, limit), self.maximum)
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ConcurrencyController:
+    """Adjusts an AdaptiveLimit every `interval` seconds from measured throughput and errors.
+
+    bytes_done() and errors() return running totals (e.g. metrics
+    counters); only their change since the last decision matters.
+    shared_bytes_done() is the running total of every download under the
+    bandwidth limit, bytes_done() by default. While it runs, its limit
+    counts towards CONCURRENCY_LIMIT.
+    """
+
+    def __init__(self, limit, bytes_done, errors, interval=CONTROL_INTERVAL, on_change=None,
+                 shared_bytes_done=None):
+        self.limit = limit
+        self.bytes_done = bytes_done
+        self.errors = errors
+        self.shared_bytes_done = shared_bytes_done or bytes_done
+        self.interval = interval
+        self.on_change = on_change
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="concurrency-controller")
+        self._best = {}  # limit -> best throughput seen with it
+
+    def start(self):
+        CONCURRENCY_LIMIT.inc(self.limit.limit)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        CONCURRENCY_LIMIT.inc(-self.limit.limit)
+
+    def decide(self, throughput, new_errors, busy, shared_throughput=None):
+        """The next limit given the last interval's bytes/s, error count and whether every slot was used.
+
+        shared_throughput is the bytes/s of every download under the
+        bandwidth limit, throughput when None.
+        """
+        current = self.limit.limit
+        self._best[current] = max(self._best.get(current, 0), throughput)
+        if new_errors:
+            return max(1, current // 2)
+        rate = limiter.rate
+        if rate and (throughput if shared_throughput is None else shared_throughput) >= rate * 0.9:
+            return current  # The bandwidth cap is the bottleneck; more downloads cannot help
+        below = self._best.get(current - 1)
+        if below is not None and throughput < below * (2 - GAIN_THRESHOLD):
+            return current - 1  # The last step up made things worse
+        if busy and (below is None or throughput >= below * GAIN_THRESHOLD):
+            return current + 1
+        return current
+
+    def _loop(self):
+        last_bytes, last_errors, last_shared = self.bytes_done(), self.errors(), self.shared_bytes_done()
+        last_time = time.monotonic()
+        busy = False
+        while not self._stop.wait(self.interval / 5):
+            busy = busy or self.limit.in_use >= self.limit.limit
+            now = time.monotonic()
+            if now - last_time < self.interval:
+                continue
+            total_bytes, total_errors, total_shared = self.bytes_done(), self.errors(), self.shared_bytes_done()
+            throughput = (total_bytes - last_bytes) / (now - last_time)
+            shared_throughput = (total_shared - last_shared) / (now - last_time)
+            limit = self.decide(throughput, total_errors - last_errors, busy, shared_throughput)
+            if limit != self.limit.limit:
+                CONCURRENCY_LIMIT.inc(limit - self.limit.limit)
+                self.limit.set_limit(limit)
+                if self.on_change:
+                    self.on_change(limit, throughput)
+            last_bytes, last_errors, last_shared, last_time, busy = total_bytes, total_errors, total_shared, now, False
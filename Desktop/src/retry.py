@@ -0,0 +1,131 @@
+"""Retrying failed tracks and backing off when YouTube starts refusing.
+
+classify() sorts an error into one of three kinds:
+
+    transient  dropped connections, timeouts, 5xx - worth another try
+    rejected   HTTP 403/429 or bot detection - the remote is refusing us
+    permanent  private/removed videos, encode errors, anything unknown
+
+The pipeline retries transient and rejected failures of a track up to
+RetryPolicy.retries times, waiting an exponentially growing, jittered
+delay in between so many failing tracks do not retry in lockstep.
+
+Rejections also feed a CircuitBreaker: after `threshold` of them in a row
+every fetch and download worker pauses for a cooldown, which doubles
+each time the remote is still refusing afterwards.
+"""
+import random
+import sys
+import threading
+import time
+from urllib.error import HTTPError
+
+import downloader
+import metrics
+
+TRANSIENT, REJECTED, PERMANENT = "transient", "rejected", "permanent"
+REJECTION_CODES = (403, 429)
+
+DEFAULT_RETRIES = 3
+DEFAULT_BASE_DELAY = 5.0  # seconds before the first retry
+MAX_DELAY = 300.0
+BREAKER_THRESHOLD = 5  # rejections in a row that pause every worker
+BREAKER_COOLDOWN = 60.0  # seconds of the first pause
+BREAKER_MAX_COOLDOWN = 900.0
+
+CIRCUIT_OPEN = metrics.registry.gauge(
+    "ytmd_circuit_open", "1 while the workers are paused because the remote keeps rejecting requests")
+CIRCUIT_TRIPS = metrics.registry.counter(
+    "ytmd_circuit_trips_total", "Times the workers were paused because the remote kept rejecting requests")
+
+
+def classify(error):
+    """TRANSIENT, REJECTED or PERMANENT for an exception raised while processing a track"""
+    if isinstance(error, HTTPError) and error.code in REJECTION_CODES:
+        return REJECTED
+    # pytubefix is imported lazily; if it is not loaded yet, it raised nothing
+    pytubefix_errors = sys.modules.get("pytubefix.exceptions")
+    if pytubefix_errors and isinstance(error, (pytubefix_errors.BotDetection, pytubefix_errors.PoTokenRequired)):
+        return REJECTED
+    if downloader.is_transient(error):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """How often and how long to wait before retrying a failed track"""
+
+    def __init__(self, retries=DEFAULT_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=MAX_DELAY):
+        self.retries = max(0, retries)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max_delay
+
+    def should_retry(self, error, attempts):
+        """Whether a track that failed with error after `attempts` retries gets another one"""
+        return attempts < self.retries and classify(error) != PERMANENT
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt` (1-based).
+
+        Half the exponential step is fixed and half random, so the wait
+        still grows but concurrent retries spread out.
+        """
+        step = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return step / 2 + random.uniform(0, step / 2)
+
+
+class CircuitBreaker:
+    """Pauses every worker while the remote keeps rejecting requests.
+
+    record() is told the outcome of each network attempt: None for a
+    success, else the kind from classify(). After `threshold` rejections
+    in a row the breaker opens for `cooldown` seconds and wait() blocks
+    every caller until then. The first attempts after a pause are a
+    probe: one more rejection reopens it for twice as long.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN, on_open=None):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.on_open = on_open
+        self.rejections = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def record(self, kind):
+        opened = None
+        with self._lock:
+            if kind != REJECTED:
+                self.rejections = 0
+                if kind is None:
+                    self.trips = 0
+                return
+            self.rejections += 1
+            if self.rejections >= self.threshold and not self.is_open:
+                opened = min(self.max_cooldown, self.cooldown * 2 ** self.trips)
+                self.trips += 1
+                self.open_until = time.monotonic() + opened
+                # Half-open: a single rejection after the pause trips it again
+                self.rejections = self.threshold - 1
+        if opened:
+            CIRCUIT_OPEN.set(1)
+            CIRCUIT_TRIPS.inc()
+            if self.on_open:
+                self.on_open(opened)
+
+    def wait(self, stop_event):
+        """Block while the breaker is open; True if stop_event was set meanwhile"""
+        while True:
+            remaining = self.open_until - time.monotonic()
+            if remaining <= 0:
+                CIRCUIT_OPEN.set(0)
+                return False
+            if stop_event.wait(remaining):
+                return True
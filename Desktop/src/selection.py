@@ -0,0 +1,61 @@
+"""Audio stream selection policies.
+
+    match     - a stream whose codec the output format can copy as-is
+                (see encoder.plan), otherwise the highest bitrate
+    best      - the highest average bitrate
+    smallest  - the lowest bitrate that still meets the output bitrate,
+                otherwise the highest bitrate
+    opus, aac - prefer that codec, highest bitrate first
+    first     - whatever pytubefix lists first
+"""
+from encoder import source_codec
+
+SELECTION_POLICIES = ("match", "best", "smallest", "opus", "aac", "first")
+DEFAULT_POLICY = "match"
+
+
+def stream_kbps(stream):
+    """Average bitrate of a stream in kbit/s, 0 when pytubefix does not know it"""
+    try:
+        return int((stream.abr or "0").rstrip("kbps"))
+    except ValueError:
+        return 0
+
+
+def describe_stream(stream):
+    codec = source_codec(stream.audio_codec)
+    kbps = stream_kbps(stream)
+    return f"{codec} {kbps}kbps" if kbps else codec
+
+
+def select_stream(streams, policy=DEFAULT_POLICY, encoder=None, target_kbps=None):
+    """Pick one of a video's audio streams (pytubefix or cached Streams).
+
+    encoder is used by the "match" policy to find codecs that can be
+    remuxed; target_kbps by the "smallest" policy.
+    """
+    if policy not in SELECTION_POLICIES:
+        raise ValueError(f"Unknown stream selection policy: {policy}")
+    audio = list(streams)
+    if not audio or policy == "first":
+        return audio[0] if audio else None
+
+    # Dubbed videos list one stream per language; keep the original track
+    original = [s for s in audio if getattr(s, "is_default_audio_track", True)]
+    audio = original or audio
+    best = max(audio, key=stream_kbps)
+
+    if policy == "best":
+        return best
+    if policy == "smallest":
+        if not target_kbps:
+            return best
+        meeting = [s for s in audio if stream_kbps(s) >= target_kbps]
+        return min(meeting, key=stream_kbps) if meeting else best
+    if policy == "match":
+        if encoder is None:
+            return best
+        candidates = [s for s in audio if encoder.plan(s.audio_codec)[1]]
+    else:
+        candidates = [s for s in audio if source_codec(s.audio_codec) == policy]
+    return max(candidates, key=stream_kbps) if candidates else best
@@ -0,0 +1,694 @@
+"""Background download service with a local HTTP/JSON job API.
+
+A CLI run or GUI session starts cold: it imports pytubefix, opens the
+metadata cache and content store and builds a connection pool, and all
+of it is thrown away when it exits. The service keeps them for its whole
+lifetime and runs each submitted job - a list of video and playlist URLs
+with download options - through a Pipeline of its own, so every job
+reuses the warm caches and the open connections of the jobs before it.
+
+    python cli_main.py --serve                  # run the service
+    python cli_main.py --service URL [URL ...]  # submit a job and follow it
+
+The API listens on 127.0.0.1 only. Every request must carry the token
+the service writes, with its address, to service.json in the user cache
+folder; that is also how clients find it (Client.discover).
+
+    GET    /health            includes the bandwidth limit every job shares
+    POST   /jobs              {"urls": [...], "options": {...}} -> the new job
+    GET    /jobs              every job the service remembers
+    GET    /jobs/<id>?since=N the job, the progress of its active tracks
+                              and its events from number N on
+    DELETE /jobs/<id>         cancel a queued or running job
+
+A job's events are the status changes of its tracks as its pipeline
+reports them. Client.follow() replays them through the callbacks a local
+Pipeline would call, so the CLI and GUI show a service job the same way
+as a download of their own.
+
+Jobs are written to the job journal (journal.py) as they are submitted.
+A job that was queued or running when the service stopped or crashed is
+queued again on its next start and resumes where it left off; a
+cancelled job is dropped from the journal.
+"""
+import contextlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlsplit
+
+import downloader
+import httppool
+import metrics
+import ratelimit
+import retry
+from contentstore import ContentStore
+from encoder import OUTPUT_FORMATS, DEFAULT_FORMAT, DEFAULT_BITRATE
+from journal import Journal
+from ledger import Ledger
+from metacache import MetadataCache, BatchUrls, is_playlist, default_cache_path, load_pytubefix
+from pipeline import Pipeline, Track, failure_cause, FINAL_STATUSES, DEFAULT_CONCURRENCY, MAX_ADAPTIVE_CONCURRENCY
+from selection import SELECTION_POLICIES, DEFAULT_POLICY
+
+STATE_NAME = "service.json"
+DEFAULT_JOBS = 1  # Jobs run at once; each has its own pipeline and concurrency
+MAX_FINISHED_JOBS = 200  # Finished jobs remembered for clients, oldest forgotten first
+MAX_BODY = 16 * 1024 * 1024
+POLL_INTERVAL = 0.25  # seconds between a following client's requests
+CLIENT_TIMEOUT = 10
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+INTERRUPTED = "interrupted"  # Stopped by the service shutting down; resumed on its next start
+FINISHED_STATES = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+# Options a job may set, with their defaults; "output" must be given as an absolute path
+DEFAULT_OPTIONS = {
+    "output": None,
+    "format": DEFAULT_FORMAT,
+    "bitrate": DEFAULT_BITRATE,
+    "selection": DEFAULT_POLICY,
+    "concurrency": DEFAULT_CONCURRENCY,
+    "connections": downloader.DEFAULT_CONNECTIONS,
+    "streaming": True,
+    "sync": False,
+    "adaptive": False,
+    "max_concurrency": MAX_ADAPTIVE_CONCURRENCY,
+    "retries": retry.DEFAULT_RETRIES,
+    "retry_delay": retry.DEFAULT_BASE_DELAY,
+    "dedup": True,
+}
+RETIRED_OPTIONS = ("segment_threshold",)  # Ignored: sent by older clients and kept in older journals
+
+JOBS = metrics.registry.counter(
+    "ytmd_service_jobs_total", "Service jobs that ended, by final state")
+
+
+class ServiceError(Exception):
+    """The service refused a request or answered with an error"""
+
+
+def default_state_path():
+    return os.path.join(os.path.dirname(default_cache_path()), STATE_NAME)
+
+
+def parse_options(options):
+    """The pipeline settings of a job from the options a client sent; raises ValueError"""
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    options = {name: value for name, value in options.items() if name not in RETIRED_OPTIONS}
+    unknown = sorted(set(options) - set(DEFAULT_OPTIONS))
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(unknown)}")
+    settings = {**DEFAULT_OPTIONS, **options}
+    if not isinstance(settings["output"], str) or not os.path.isabs(settings["output"]):
+        raise ValueError("output must be an absolute path")
+    if settings["format"] not in OUTPUT_FORMATS:
+        raise ValueError(f"invalid format: {settings['format']}")
+    if settings["selection"] not in SELECTION_POLICIES:
+        raise ValueError(f"invalid selection: {settings['selection']}")
+    bitrate = str(settings["bitrate"]).strip().lower().rstrip("k")
+    if not bitrate.isdigit() or int(bitrate) <= 0:
+        raise ValueError(f"invalid bitrate: {settings['bitrate']}")
+    settings["bitrate"] = f"{bitrate}k"
+    for name, minimum in (("concurrency", 1), ("connections", 1), ("max_concurrency", 1), ("retries", 0)):
+        if not isinstance(settings[name], int) or isinstance(settings[name], bool) or settings[name] < minimum:
+            raise ValueError(f"{name} must be an integer of at least {minimum}")
+    if (not isinstance(settings["retry_delay"], (int, float)) or isinstance(settings["retry_delay"], bool)
+            or settings["retry_delay"] < 0):
+        raise ValueError("retry_delay must be a number of at least 0")
+    for name in ("streaming", "sync", "adaptive", "dedup"):
+        if not isinstance(settings[name], bool):
+            raise ValueError(f"{name} must be true or false")
+    return settings
+
+
+def _track_fields(track):
+    return {"index": track.index, "url": track.url, "total": track.total, "title": track.title,
+            "video_id": track.video_id, "remux": track.remux, "output": track.output_path}
+
+
+class Job:
+    """One submitted batch of URLs and what became of each of its tracks.
+
+    Status changes are appended to events, numbered from 0, for clients to
+    replay. Download and encode progress only updates the track's entry,
+    which clients read while the track is active.
+    journal is the job's journal.JournalJob, or None.
+
+    Each job adapts its parallel downloads on its own pipeline's
+    throughput and errors; its summary reports its current download
+    limit and the bytes it downloaded.
+    """
+
+    def __init__(self, urls, options, journal=None):
+        self.id = journal.id if journal else uuid.uuid4().hex[:12]
+        self.journal = journal
+        self.urls = urls
+        self.options = options
+        self.state = QUEUED
+        self.error = None
+        self.total = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.counts = {status: 0 for status in FINAL_STATUSES}
+        self.bytes_downloaded = 0
+        self.tracks = {}  # Track index -> fields, status and progress
+        self.events = []
+        self.pipeline = None
+        self.cancelled = False
+        self.interrupted = False
+        self._lock = threading.Lock()
+
+    def _add_event(self, event, **fields):
+        self.events.append({"seq": len(self.events), "ts": round(time.time(), 3), "event": event, **fields})
+
+    def on_status(self, track, status, message):
+        fields = _track_fields(track)
+        with self._lock:
+            entry = self.tracks.setdefault(track.index, {})
+            if status in ("fetching", "downloading", "retrying"):
+                entry.pop("bytes", None)
+                entry.pop("size", None)
+            if status in ("encoding", "retrying"):
+                entry.pop("encoded", None)
+            entry.update(fields, status=status, message=message)
+            if status in FINAL_STATUSES:
+                self.counts[status] += 1
+            self._add_event("status", track=fields, status=status, message=message)
+
+    def on_progress(self, track, stream, chunk, bytes_remaining):
+        with self._lock:
+            entry = self.tracks.get(track.index)
+            if entry is not None:
+                entry["size"] = stream.filesize
+                entry["bytes"] = stream.filesize - bytes_remaining
+
+    def on_encode_progress(self, track, fraction):
+        with self._lock:
+            entry = self.tracks.get(track.index)
+            if entry is not None:
+                entry["encoded"] = round(fraction, 4)
+
+    def on_total(self, total):
+        with self._lock:
+            self.total = total
+            self._add_event("total", total=total)
+
+    def on_pause(self, seconds):
+        with self._lock:
+            self._add_event("pause", seconds=round(seconds, 1))
+
+    def on_playlist(self, url, count):
+        with self._lock:
+            self._add_event("playlist", url=url, videos=count)
+
+    def on_playlist_error(self, url, error):
+        with self._lock:
+            self.counts["failed"] += 1
+            self._add_event("playlist_error", url=url, error=str(error))
+
+    def start(self, pipeline):
+        """Mark the job running on pipeline; False if it was cancelled meanwhile"""
+        with self._lock:
+            if self.state != QUEUED:
+                return False
+            self.state = RUNNING
+            self.started_at = time.time()
+            self.pipeline = pipeline
+            return True
+
+    def cancel(self):
+        with self._lock:
+            if self.state in FINISHED_STATES:
+                return
+            self.cancelled = True
+            if self.state == QUEUED:
+                self.state = CANCELLED
+                self.finished_at = time.time()
+                JOBS.inc(state=CANCELLED)
+            pipeline = self.pipeline
+        if self.journal:
+            self.journal.discard()
+        if pipeline:
+            pipeline.stop()
+
+    def interrupt(self):
+        """Stop a running job without cancelling it, so it stays in the journal"""
+        with self._lock:
+            self.interrupted = True
+            pipeline = self.pipeline
+        if pipeline:
+            pipeline.stop()
+
+    def finish(self, error=None):
+        with self._lock:
+            self.error = str(error) if error else None
+            if self.cancelled:
+                self.state = CANCELLED
+            elif self.interrupted:
+                self.state = INTERRUPTED
+            elif error or self.counts["failed"]:
+                self.state = FAILED
+            else:
+                self.state = DONE
+            self.finished_at = time.time()
+            if self.pipeline:
+                self.bytes_downloaded = self.pipeline.bytes_downloaded
+            self.pipeline = None
+        JOBS.inc(state=self.state)
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def summary(self):
+        with self._lock:
+            return self._summary()
+
+    def _summary(self):
+        pipeline = self.pipeline
+        return {"id": self.id, "state": self.state, "urls": len(self.urls), "total": self.total,
+                "counts": dict(self.counts), "output": self.options["output"], "error": self.error,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+                "download_limit": pipeline.download_limit if pipeline else None,
+                "bytes_downloaded": pipeline.bytes_downloaded if pipeline else self.bytes_downloaded}
+
+    def snapshot(self, since=0):
+        """The summary, active tracks and events from number since on, taken at one instant"""
+        with self._lock:
+            active = [dict(entry) for entry in self.tracks.values() if entry["status"] not in FINAL_STATUSES]
+            return {"job": self._summary(), "active": active, "events": self.events[since:],
+                    "next": len(self.events)}
+
+
+class Service:
+    """Runs submitted jobs, `jobs` at a time, with caches and connections kept warm between them.
+
+    on_status(job, track, status, message) and on_job(job) let the
+    process running the service log what its jobs do.
+    """
+
+    def __init__(self, jobs=DEFAULT_JOBS, store_folder=None, on_status=None, on_job=None):
+        self.store_folder = store_folder
+        self.on_status = on_status
+        self.on_job = on_job
+        self.started_at = time.time()
+        self.jobs = {}  # Job ID -> Job, in submission order
+        self.metadata = None
+        self.store = None
+        self.http = None
+        self.journal = None
+        self._closing = False
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._resources = contextlib.ExitStack()
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, jobs))]
+
+    def start(self):
+        self.metadata = MetadataCache()
+        self._resources.callback(self.metadata.close)
+        self.store = ContentStore(self.store_folder)
+        self._resources.callback(self.store.close)
+        # Closed before the caches, once the workers are done; unfinished jobs stay resumable
+        self.journal = Journal()
+        self._resources.callback(self.journal.close)
+        # One pool for the service's lifetime; every job's pipeline joins it
+        self.http = self._resources.enter_context(httppool.session())
+        threading.Thread(target=load_pytubefix, daemon=True).start()
+        for worker in self._workers:
+            worker.start()
+        self._resume()
+        return self
+
+    def _resume(self):
+        """Queue the jobs an earlier service left unfinished"""
+        for entry in self.journal.resumable("service"):
+            journal_job = self.journal.claim(entry["id"])
+            if journal_job is None:
+                continue
+            try:
+                job = Job(entry["urls"], parse_options(entry["options"]), journal_job)
+            except ValueError:
+                journal_job.discard()  # Options of another version of the service
+                continue
+            with self._lock:
+                self.jobs[job.id] = job
+            self._queue.put(job)
+            self._report_job(job)
+
+    def close(self):
+        """Stop every job, keeping the unfinished ones for the next start, and release the caches"""
+        self._closing = True
+        for job in self.list_jobs():
+            if not job.finished:
+                job.interrupt()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._resources.close()
+
+    def submit(self, urls, options=None):
+        """Queue a job for urls; raises ValueError for bad URLs or options"""
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.startswith("http")
+                                                             for url in urls):
+            raise ValueError("urls must be a non-empty list of http(s) URLs")
+        settings = parse_options(options or {})
+        job = Job(urls, settings, self.journal.start(urls, settings, "service"))
+        with self._lock:
+            self.jobs[job.id] = job
+            finished = [old for old in self.jobs.values() if old.finished]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+        self._queue.put(job)
+        self._report_job(job)
+        return job
+
+    def get(self, job_id):
+        """The job with job_id; raises KeyError"""
+        with self._lock:
+            return self.jobs[job_id]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        job.cancel()
+        return job
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def health(self):
+        states = {}
+        for job in self.list_jobs():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"status": "ok", "pid": os.getpid(), "started_at": self.started_at, "jobs": states,
+                "rate_limit": ratelimit.limiter.rate,
+                "http": self.http.stats() if self.http else None,
+                "store": self.store.stats() if self.store else None}
+
+    def _report_job(self, job):
+        if self.on_job:
+            self.on_job(job)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.state == QUEUED and not self._closing:
+                self._run(job)
+
+    def _run(self, job):
+        settings = job.options
+
+        def on_status(track, status, message):
+            job.on_status(track, status, message)
+            if self.on_status:
+                self.on_status(job, track, status, message)
+
+        def on_playlist(url, count):
+            ledger.forget_failure(url)
+            job.on_playlist(url, count)
+
+        def on_playlist_error(url, error):
+            ledger.record_failure(url, error=str(error), cause=failure_cause(error))
+            job.on_playlist_error(url, error)
+
+        error = None
+        ledger = None
+        try:
+            ledger = Ledger.for_folder(settings["output"])
+            pipeline = Pipeline(settings["output"], concurrency=settings["concurrency"], on_status=on_status,
+                                on_progress=job.on_progress, on_encode_progress=job.on_encode_progress,
+                                on_pause=job.on_pause, on_total=job.on_total, streaming=settings["streaming"],
+                                output_format=settings["format"], bitrate=settings["bitrate"],
+                                selection=settings["selection"], sync=settings["sync"], metadata=self.metadata,
+                                connections=settings["connections"], adaptive=settings["adaptive"],
+                                max_concurrency=settings["max_concurrency"], ledger=ledger,
+                                dedup=settings["dedup"], store=self.store if settings["dedup"] else None,
+                                journal=job.journal,
+                                retry_policy=retry.RetryPolicy(settings["retries"], settings["retry_delay"]))
+            if not job.start(pipeline):
+                pipeline.event_log.close()
+                return
+            if self._closing:
+                job.interrupt()  # close() may have looked for running jobs before this one started
+            self._report_job(job)
+            if len(job.urls) > 1 or is_playlist(job.urls[0]):
+                pipeline.run(BatchUrls(job.urls, self.metadata, on_playlist=on_playlist, on_error=on_playlist_error))
+            else:
+                pipeline.run(job.urls)  # A single video has no total
+        except Exception as e:
+            error = e
+        finally:
+            if ledger:
+                ledger.close()
+            if (job.cancelled or error) and job.journal:
+                job.journal.discard()
+        if job.state == RUNNING or error:
+            job.finish(error)
+            self._report_job(job)
+
+
+def _route(service, method, path, query, read_body):
+    """(HTTP status, JSON-able body) of one API request"""
+    if path == ["health"] and method == "GET":
+        return 200, service.health()
+    if path == ["jobs"]:
+        if method == "GET":
+            return 200, {"jobs": [job.summary() for job in service.list_jobs()]}
+        if method == "POST":
+            request = read_body()
+            if not isinstance(request, dict):
+                raise ValueError("the request must be a JSON object")
+            return 201, service.submit(request.get("urls"), request.get("options")).summary()
+        return 405, {"error": f"{method} not allowed"}
+    if len(path) == 2 and path[0] == "jobs":
+        job = service.get(path[1])
+        if method == "GET":
+            since = query.get("since", ["0"])[0]
+            if not since.isdigit():
+                raise ValueError("since must be a non-negative integer")
+            return 200, job.snapshot(int(since))
+        if method == "DELETE":
+            job.cancel()
+            return 200, job.summary()
+        return 405, {"error": f"{method} not allowed"}
+    return 404, {"error": "no such endpoint"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, for clients that poll
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request too large")
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            raise ValueError("the request is not valid JSON") from None
+
+    def _handle(self, method):
+        if not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.server.token}"):
+            status, body = 401, {"error": "missing or wrong token"}
+        else:
+            parts = urlsplit(self.path)
+            try:
+                status, body = _route(self.server.service, method, [p for p in parts.path.split("/") if p],
+                                      parse_qs(parts.query), self._read_body)
+            except KeyError:
+                status, body = 404, {"error": "no such job"}
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+        if method == "POST" and status >= 400:
+            self.close_connection = True  # An unread body may still be in the socket
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    """The API of a Service, advertised in state_path with a fresh token while it runs"""
+    daemon_threads = True
+
+    def __init__(self, service, port=0, host="127.0.0.1", state_path=None):
+        super().__init__((host, port), _Handler)
+        self.service = service
+        self.token = secrets.token_urlsafe(24)
+        self.url = f"http://{host}:{self.server_port}"
+        self.state_path = state_path or default_state_path()
+        self._write_state()
+
+    def _write_state(self):
+        # Only the user may read the token; written aside and renamed so readers never see half a file
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"url": self.url, "token": self.token, "pid": os.getpid(),
+                       "started_at": self.service.started_at}, fh)
+        os.replace(temp_path, self.state_path)
+
+    def shutdown(self):
+        """Stop serving and withdraw the advertisement, unless another service has replaced it"""
+        super().shutdown()
+        self.server_close()
+        try:
+            with open(self.state_path, encoding="utf-8") as fh:
+                ours = json.load(fh).get("token") == self.token
+            if ours:
+                os.remove(self.state_path)
+        except (OSError, ValueError):
+            pass
+
+
+def serve(service, port=0, host="127.0.0.1", state_path=None):
+    """Serve service's API from a daemon thread; returns the ServiceServer. Port 0 picks a free port."""
+    server = ServiceServer(service, port, host, state_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _Stream:
+    """Stands in for a track's stream in replayed on_progress calls; only its size is known"""
+
+    def __init__(self, filesize):
+        self.filesize = filesize
+
+
+class Client:
+    """Submits, follows and cancels jobs of a running service"""
+
+    def __init__(self, url, token, timeout=CLIENT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        # The service is local: never through a proxy, nor through an httppool session of this process
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    @classmethod
+    def discover(cls, state_path=None):
+        """A client of the service advertised in the user cache folder, or None if none is running"""
+        try:
+            with open(state_path or default_state_path(), encoding="utf-8") as fh:
+                state = json.load(fh)
+            client = cls(state["url"], state["token"])
+            client.health()
+        except (OSError, ValueError, KeyError, TypeError, ServiceError):
+            return None
+        return client
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Authorization": f"Bearer {self.token}",
+                                                  "Content-Type": "application/json"})
+        try:
+            with self._opener.open(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except HTTPError as e:
+            try:
+                message = json.load(e).get("error")
+            except (ValueError, AttributeError):
+                message = None
+            raise ServiceError(message or f"HTTP {e.code}") from None
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def submit(self, urls, options=None):
+        """Queue a job; returns its summary"""
+        return self._request("POST", "/jobs", {"urls": list(urls), "options": options or {}})
+
+    def jobs(self):
+        return self._request("GET", "/jobs")["jobs"]
+
+    def job(self, job_id, since=0):
+        return self._request("GET", f"/jobs/{job_id}?since={since}")
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def follow(self, job_id, on_status=None, on_progress=None, on_encode_progress=None, on_pause=None,
+               on_total=None, on_playlist=None, on_playlist_error=None, should_stop=None,
+               interval=POLL_INTERVAL):
+        """Replay a job through Pipeline-style callbacks until it has finished; returns its summary.
+
+        Tracks are passed as pipeline.Track objects kept up to date from
+        the events. Once should_stop() returns true the job is cancelled,
+        and followed on until its tracks have stopped.
+        """
+        tracks = {}
+        since = 0
+        cancelled = False
+        while True:
+            state = self.job(job_id, since)
+            output = state["job"]["output"]
+            for event in state["events"]:
+                kind = event["event"]
+                if kind == "status":
+                    track = self._track(tracks, event["track"], output)
+                    track.status = event["status"]
+                    if on_status:
+                        on_status(track, event["status"], event["message"])
+                elif kind == "total" and on_total:
+                    on_total(event["total"])
+                elif kind == "pause" and on_pause:
+                    on_pause(event["seconds"])
+                elif kind == "playlist" and on_playlist:
+                    on_playlist(event["url"], event["videos"])
+                elif kind == "playlist_error" and on_playlist_error:
+                    on_playlist_error(event["url"], event["error"])
+            since = state["next"]
+            for entry in state["active"]:
+                track = tracks.get(entry["index"])
+                if track is None or track.status in FINAL_STATUSES:
+                    continue
+                if on_progress and entry.get("size") and entry["status"] == "downloading":
+                    on_progress(track, _Stream(entry["size"]), None, entry["size"] - entry["bytes"])
+                if on_encode_progress and "encoded" in entry and entry["status"] == "encoding":
+                    on_encode_progress(track, entry["encoded"])
+            if state["job"]["state"] in FINISHED_STATES:
+                return state["job"]
+            if should_stop and not cancelled and should_stop():
+                self.cancel(job_id)
+                cancelled = True
+            time.sleep(interval)
+
+    @staticmethod
+    def _track(tracks, fields, output):
+        track = tracks.get(fields["index"])
+        if track is None:
+            track = tracks[fields["index"]] = Track(fields["index"], fields["url"], output, fields["total"])
+        track.total = fields["total"]
+        track.title = fields["title"]
+        track.video_id = fields["video_id"]
+        track.remux = fields["remux"]
+        track.output_path = fields["output"]
+        return track
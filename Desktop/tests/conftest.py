@@ -0,0 +1,43 @@
+"""Shared fixtures; the modules under test live in src/, next to this folder"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+from encoder import EncodeError, find_ffmpeg  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def ffmpeg():
+    try:
+        return find_ffmpeg()
+    except EncodeError:
+        pytest.skip("ffmpeg is not installed")
+
+
+@pytest.fixture(scope="session")
+def make_audio(ffmpeg, tmp_path_factory):
+    """make_audio(seconds, name) writes a synthetic stereo AAC source of a few harmonics over a hiss"""
+    folder = tmp_path_factory.mktemp("audio")
+
+    def make(seconds, name="source.m4a"):
+        path = str(folder / name)
+        tones = "0.3*sin(2*PI*220*t)+0.15*sin(2*PI*330*t)+0.1*sin(2*PI*440*t+sin(2*PI*5*t))"
+        expression = f"({tones})*(0.6+0.4*sin(2*PI*t/4))+0.01*random(0)-0.005"
+        subprocess.run([ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+                        "-f", "lavfi", "-i", f"aevalsrc={expression}:s=44100:d={seconds}",
+                        "-ac", "2", "-c:a", "aac", "-b:a", "192k", path], check=True)
+        return path
+
+    return make
+
+
+def decode(ffmpeg, path):
+    """Interleaved 16-bit samples of an audio file, as ffmpeg decodes it"""
+    completed = subprocess.run([ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", path,
+                                "-f", "s16le", "-"], stdout=subprocess.PIPE, check=True)
+    return memoryview(completed.stdout).cast("h")
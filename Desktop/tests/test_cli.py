@@ -0,0 +1,145 @@
+"""Headless CLI arguments, JSON lines and exit status, over a pipeline that needs no network"""
+import json
+import types
+
+import pytest
+
+import cli_main
+import httppool
+import metacache
+from ledger import Ledger
+from pipeline import Track
+
+PLAYLIST = "https://www.youtube.com/playlist?list=PLfake"
+
+
+class FakePipeline:
+    """Finishes each URL by its name: 'fail' fails, 'interrupt' is Ctrl+C, anything else is done"""
+
+    def __init__(self, out_folder, on_status=None, **options):
+        self.out_folder = out_folder
+        self.on_status = on_status
+        self.http = httppool.ConnectionPool()
+        self.store = None
+        self.event_log = types.SimpleNamespace(path="events.jsonl")
+
+    def run(self, urls, total=None):
+        tracks = []
+        for index, url in enumerate(urls, 1):
+            if "interrupt" in url:
+                raise KeyboardInterrupt
+            track = Track(index, url, self.out_folder, total)
+            track.title = url.rsplit("=", 1)[-1]
+            track.status = "failed" if "fail" in url else "done"
+            track.output_path = None if track.status == "failed" else f"{track.title}.mp3"
+            self.on_status(track, track.status, "HTTP Error 410: Gone" if track.status == "failed" else None)
+            tracks.append(track)
+        return tracks
+
+    def stop(self):
+        pass
+
+
+class BrokenPlaylist:
+    """Lists one video, then fails on the next page"""
+    total = None
+
+    def __init__(self, metadata, url):
+        pass
+
+    def __iter__(self):
+        yield "https://www.youtube.com/watch?v=listed"
+        raise OSError("playlist page failed")
+
+
+@pytest.fixture(autouse=True)
+def offline(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))  # Journal and metadata cache
+    monkeypatch.setattr(cli_main, "Pipeline", FakePipeline)
+    monkeypatch.setattr(metacache, "PlaylistUrls", BrokenPlaylist)
+
+
+def run(tmp_path, *argv):
+    return cli_main.main(cli_main.parse_args(["-o", str(tmp_path / "out"), "--no-dedup", *argv]))
+
+
+def records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_parse_args_normalizes_the_bitrate():
+    args = cli_main.parse_args(["-b", "192", "https://y/watch?v=a"])
+    assert args.bitrate == "192k"
+    assert args.urls == ["https://y/watch?v=a"]
+    assert args.concurrency == cli_main.DEFAULT_CONCURRENCY
+
+
+@pytest.mark.parametrize("argv", [
+    ["-b", "fast", "URL"],
+    ["--concurrency", "0", "URL"],
+    ["--retries", "-1", "URL"],
+    ["--detach", "URL"],
+    ["--serve", "URL"],
+    ["--resume", "URL"],
+    ["-f", "wav", "URL"],
+])
+def test_bad_arguments_exit_with_status_2(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        cli_main.parse_args(argv)
+    assert exit.value.code == cli_main.EXIT_USAGE
+    assert capsys.readouterr().err
+
+
+@pytest.mark.parametrize("urls, exit_code", [
+    (["https://y/watch?v=one", "https://y/watch?v=two"], cli_main.EXIT_OK),
+    (["https://y/watch?v=one", "https://y/watch?v=fail"], cli_main.EXIT_FAILED),
+    (["https://y/watch?v=interrupt"], cli_main.EXIT_INTERRUPTED),
+])
+def test_exit_status_follows_the_worst_item(tmp_path, urls, exit_code):
+    assert run(tmp_path, *urls) == exit_code
+
+
+def test_no_urls_exits_with_status_2(tmp_path, monkeypatch):
+    monkeypatch.setattr("sys.stdin", types.SimpleNamespace(isatty=lambda: True))
+    assert run(tmp_path) == cli_main.EXIT_USAGE
+
+
+def test_json_lines_have_one_result_per_item_and_a_summary(tmp_path, capsys):
+    assert run(tmp_path, "--json", "https://y/watch?v=one", "https://y/watch?v=fail") == cli_main.EXIT_FAILED
+    lines = records(capsys)
+    results = {line["url"]: line for line in lines if line["event"] == "result"}
+    assert results["https://y/watch?v=one"]["status"] == "done"
+    assert results["https://y/watch?v=one"]["exit_code"] == cli_main.EXIT_OK
+    assert results["https://y/watch?v=fail"]["error"] == "HTTP Error 410: Gone"
+    assert results["https://y/watch?v=fail"]["exit_code"] == cli_main.EXIT_FAILED
+    summary = lines[-1]
+    assert summary["event"] == "summary"
+    assert (summary["items"], summary["done"], summary["failed"]) == (2, 1, 1)
+    assert summary["exit_code"] == cli_main.EXIT_FAILED
+
+
+def test_unreadable_playlist_is_a_failed_item_and_keeps_the_videos_listed(tmp_path, capsys):
+    assert run(tmp_path, "--json", PLAYLIST) == cli_main.EXIT_FAILED
+    results = [line for line in records(capsys) if line["event"] == "result"]
+    assert [(line["url"], line["status"]) for line in results] == [
+        ("https://www.youtube.com/watch?v=listed", "done"), (PLAYLIST, "failed")]
+    assert results[1]["error"] == "playlist page failed"
+    ledger = Ledger.for_folder(str(tmp_path / "out"))
+    try:
+        assert ledger.failed_urls() == [PLAYLIST]
+    finally:
+        ledger.close()
+
+
+def test_interactive_playlist_error_is_reported_like_a_failed_video(tmp_path, capsys):
+    out = tmp_path / "out"
+    out.mkdir()
+    assert cli_main.process_playlist(PLAYLIST, str(out), concurrency=1) is False
+    captured = capsys.readouterr()
+    assert f"Error reading playlist {PLAYLIST}: playlist page failed" in captured.err
+    assert "Event log:" in captured.out  # The run's summary is still printed
+    ledger = Ledger.for_folder(str(out))
+    try:
+        assert ledger.failed_urls() == [PLAYLIST]
+    finally:
+        ledger.close()
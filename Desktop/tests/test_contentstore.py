@@ -0,0 +1,18 @@
+"""Putting store objects in place"""
+import os
+
+import pytest
+
+from contentstore import link
+
+
+@pytest.mark.parametrize("methods", [("hardlink",), ("copy",)])
+def test_linking_over_an_earlier_link_leaves_no_temporary_file(tmp_path, methods):
+    source = tmp_path / "object"
+    source.write_bytes(b"encoded")
+    target = tmp_path / "out" / "Song.mp3"
+    target.parent.mkdir()
+    for _ in range(2):  # The second time target is already a link to source
+        assert link(str(source), str(target), methods) == methods[0]
+    assert os.listdir(target.parent) == ["Song.mp3"]
+    assert target.read_bytes() == b"encoded"
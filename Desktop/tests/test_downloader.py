@@ -0,0 +1,126 @@
+"""Resuming downloads from .part files with HTTP Range requests"""
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+from downloader import PART_SUFFIX, STATE_SUFFIX
+
+DATA = os.urandom(5 * 1024 * 1024 + 123)  # More than two segments, and not a whole number of them
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    honour_range = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.ranges = []  # (start, end) of every request, end None for the whole file
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.server.honour_range:
+            start = int(match[1])
+            end = int(match[2]) if match[2] else len(DATA) - 1
+            self.server.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            start, end = 0, len(DATA) - 1
+            self.server.ranges.append((start, None))
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(DATA[start:end + 1])
+
+
+class Stream:
+    """The parts of a pytubefix Stream the downloader uses"""
+
+    def __init__(self, url, itag=140, stop_after=None):
+        self.url = url
+        self.itag = itag
+        self.filesize = len(DATA)
+        self.stop_after = stop_after  # Bytes after which the "user" stops the download
+
+    def on_progress_for_chunks(self, chunk, bytes_remaining):
+        if self.stop_after is not None and self.filesize - bytes_remaining >= self.stop_after:
+            raise KeyboardInterrupt
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/audio"
+
+
+def interrupted(url, path, connections=1, stop_after=1024 * 1024):
+    """Stop a download after about stop_after bytes; the size of the .part file it left"""
+    with pytest.raises(KeyboardInterrupt):
+        downloader.download(Stream(url, stop_after=stop_after), path, "video000001", connections)
+    return os.path.getsize(path + PART_SUFFIX)
+
+
+@pytest.mark.parametrize("connections", [1, 4])
+def test_stopped_download_resumes_from_its_part_file(server, url, tmp_path, connections):
+    path = str(tmp_path / "audio.m4a")
+    kept = interrupted(url, path, connections)
+    assert 0 < kept < len(DATA)
+    with open(path + STATE_SUFFIX, encoding="utf-8") as fh:
+        state = json.load(fh)
+    assert state["stream"] == {"video_id": "video000001", "itag": 140, "filesize": len(DATA)}
+    assert downloader.resume_offset(Stream(url), path, "video000001") == kept
+
+    del server.ranges[:]
+    assert downloader.download(Stream(url), path, "video000001", connections) == kept
+    with open(path, "rb") as fh:
+        assert fh.read() == DATA
+    assert not os.path.exists(path + PART_SUFFIX) and not os.path.exists(path + STATE_SUFFIX)
+    assert min(start for start, _ in server.ranges) == kept  # Nothing before the .part file's end again
+
+
+def test_part_file_of_another_stream_is_downloaded_again(server, url, tmp_path):
+    path = str(tmp_path / "audio.m4a")
+    interrupted(url, path)
+    assert downloader.resume_offset(Stream(url, itag=251), path, "video000001") == 0
+    assert downloader.resume_offset(Stream(url), path, "video000002") == 0
+
+    assert downloader.download(Stream(url, itag=251), path, "video000001") == 0
+    with open(path, "rb") as fh:
+        assert fh.read() == DATA
+
+
+def test_part_file_without_sidecar_is_not_trusted(url, tmp_path):
+    path = str(tmp_path / "audio.m4a")
+    interrupted(url, path)
+    os.remove(path + STATE_SUFFIX)
+    assert downloader.resume_offset(Stream(url), path, "video000001") == 0
+
+
+def test_server_ignoring_range_still_resumes_at_the_right_byte(server, url, tmp_path):
+    path = str(tmp_path / "audio.m4a")
+    kept = interrupted(url, path)
+    server.honour_range = False
+    assert downloader.download(Stream(url), path, "video000001", connections=1) == kept
+    with open(path, "rb") as fh:
+        assert fh.read() == DATA
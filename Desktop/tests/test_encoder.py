@@ -0,0 +1,107 @@
+"""ffmpeg encodes, decoded sample by sample"""
+import re
+import subprocess
+
+import pytest
+
+from conftest import decode
+from encoder import Encoder
+
+BITRATES = ("320k", "256k", "192k", "160k", "128k")  # Those the GUI offers
+SECONDS = 40
+CHUNK = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def source(make_audio):
+    return make_audio(SECONDS)
+
+
+@pytest.fixture(scope="module")
+def streams(ffmpeg, make_audio, tmp_path_factory):
+    """Short sources packed as YouTube serves audio: AAC in fragmented MP4, Opus in WebM"""
+    source = make_audio(8, "short.m4a")
+    folder = tmp_path_factory.mktemp("streams")
+    m4a, webm = str(folder / "dash.m4a"), str(folder / "audio.webm")
+    convert = [ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y", "-i", source]
+    subprocess.run(convert + ["-c:a", "copy", "-movflags", "frag_keyframe+empty_moov", m4a], check=True)
+    subprocess.run(convert + ["-c:a", "libopus", "-b:a", "128k", webm], check=True)
+    return {"aac": m4a, "opus": webm}
+
+
+def audio_codec(ffmpeg, path):
+    """The codec of path's audio stream, as ffmpeg names it"""
+    probe = subprocess.run([ffmpeg, "-hide_banner", "-nostdin", "-i", path], stderr=subprocess.PIPE, text=True)
+    return re.search(r"Audio: (\w+)", probe.stderr)[1]
+
+
+def packets(ffmpeg, path):
+    """The compressed audio packets of path, without their container"""
+    return subprocess.run([ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", path,
+                           "-map", "0:a:0", "-c", "copy", "-f", "data", "-"], stdout=subprocess.PIPE, check=True).stdout
+
+
+def chunks(path):
+    with open(path, "rb") as fh:
+        yield from iter(lambda: fh.read(CHUNK), b"")
+
+
+@pytest.mark.parametrize("codec", ["aac", "opus"])
+def test_streamed_encode_decodes_like_an_encode_of_the_file(ffmpeg, streams, tmp_path, codec):
+    streamed, from_file = str(tmp_path / "streamed.mp3"), str(tmp_path / "file.mp3")
+    encoder = Encoder(workers=1, bitrate="192k")
+    encoder.encode_stream(chunks(streams[codec]), streamed)
+    encoder.encode(streams[codec], from_file)
+    assert decode(ffmpeg, streamed) == decode(ffmpeg, from_file)
+
+
+def test_stopped_stream_kills_ffmpeg_and_removes_the_partial_output(ffmpeg, streams, tmp_path):
+    output = tmp_path / "stopped.mp3"
+
+    def stopped():
+        yield from list(chunks(streams["aac"]))[:2]
+        raise InterruptedError("stopped by the user")
+
+    with pytest.raises(InterruptedError):
+        Encoder(workers=1).encode_stream(stopped(), str(output))
+    assert not output.exists()
+
+
+@pytest.mark.parametrize("output_format, codec, extension", [
+    ("m4a", "aac", ".m4a"),
+    ("opus", "opus", ".opus"),
+    ("auto", "aac", ".m4a"),
+    ("auto", "opus", ".opus"),
+])
+@pytest.mark.parametrize("streamed", [False, True])
+def test_remux_copies_the_source_packets_into_the_new_container(ffmpeg, streams, tmp_path, output_format, codec,
+                                                                 extension, streamed):
+    encoder = Encoder(workers=1, bitrate="128k", output_format=output_format)
+    assert encoder.plan("mp4a.40.2" if codec == "aac" else "opus") == (extension, True)
+    output = str(tmp_path / ("remuxed" + extension))
+    if streamed:
+        encoder.encode_stream(chunks(streams[codec]), output, remux=True)
+    else:
+        encoder.encode(streams[codec], output, remux=True)
+    assert audio_codec(ffmpeg, output) == codec
+    # Byte for byte the packets of the source; a transcode, even to the same codec, would change them
+    assert packets(ffmpeg, output) == packets(ffmpeg, streams[codec])
+
+
+@pytest.mark.parametrize("output_format, audio_codec_name, plan", [
+    ("mp3", "mp4a.40.2", (".mp3", False)),
+    ("m4a", "opus", (".m4a", False)),
+    ("opus", "mp4a.40.2", (".opus", False)),
+    ("auto", "vorbis", (".mp3", False)),
+])
+def test_sources_without_a_matching_container_are_transcoded(ffmpeg, output_format, audio_codec_name, plan):
+    assert Encoder(workers=1, output_format=output_format).plan(audio_codec_name) == plan
+
+
+@pytest.mark.parametrize("bitrate", BITRATES)
+def test_long_encode_decodes_like_a_single_pass(ffmpeg, source, tmp_path, bitrate):
+    long, single = str(tmp_path / "long.mp3"), str(tmp_path / "single.mp3")
+    # The metadata claims a three-hour mix; it is still encoded in one pass
+    Encoder(workers=4, bitrate=bitrate).encode(source, long, duration=3 * 60 * 60)
+    Encoder(workers=1, bitrate=bitrate).encode(source, single)
+    assert decode(ffmpeg, long) == decode(ffmpeg, single)
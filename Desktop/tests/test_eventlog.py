@@ -0,0 +1,39 @@
+"""Event log rotation while the log is being written"""
+import json
+import os
+
+from eventlog import EventLog
+
+
+def lines(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_log_rotates_on_write_once_it_outgrows_max_bytes(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    log = EventLog(path, max_bytes=2000)
+    try:
+        for index in range(100):
+            log.write("track", index=index)
+        assert os.path.exists(path + ".1")
+        assert os.path.getsize(path + ".1") <= 2000 + 200  # One event past the limit at most
+        assert os.path.getsize(path) <= 2000 + 200
+        # Only the newest events survive, in order and none lost between the two files
+        indexes = [event["index"] for event in lines(path + ".1") + lines(path)]
+        assert indexes == list(range(indexes[0], 100))
+    finally:
+        log.close()
+
+
+def test_writer_follows_a_rotation_by_another_writer(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    first, second = EventLog(path, max_bytes=1000), EventLog(path, max_bytes=10 ** 6)
+    try:
+        for index in range(30):
+            first.write("track", index=index)
+        second.write("track", index="second")
+        assert lines(path)[-1]["index"] == "second"
+    finally:
+        first.close()
+        second.close()
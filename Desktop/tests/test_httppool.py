@@ -0,0 +1,118 @@
+"""Keep-alive connection reuse and the lifetime of the shared pool"""
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import httppool
+
+BODY = b"x" * 1000
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.connections = set()  # Client ports, one per TCP connection
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/"
+
+
+def fetch(url, read=True):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return response.read() if read else response.read(10)
+
+
+def test_requests_in_a_session_reuse_one_connection(server, url):
+    with httppool.session() as pool:
+        for _ in range(5):
+            assert fetch(url) == BODY
+        assert pool.stats()["requests"] == 5
+        assert pool.stats()["connections_opened"] == 1
+        assert pool.stats()["connections_reused"] == 4
+    assert len(server.connections) == 1
+
+
+def test_a_response_not_read_to_the_end_does_not_give_back_its_connection(server, url):
+    with httppool.session() as pool:
+        fetch(url, read=False)
+        assert fetch(url) == BODY
+        assert pool.stats()["connections_opened"] == 2
+    assert len(server.connections) == 2
+
+
+def test_without_a_session_urllib_opens_a_connection_per_request(server, url):
+    for _ in range(3):
+        assert fetch(url) == BODY
+    assert len(server.connections) == 3
+
+
+def test_nested_sessions_share_the_outer_pool(url):
+    with httppool.session() as outer:
+        with httppool.session() as inner:
+            assert inner is outer
+            fetch(url)
+        # The inner session ending leaves the pool open for the outer one
+        fetch(url)
+        assert outer.stats()["connections_reused"] == 1
+
+
+def test_pool_closes_only_when_the_last_of_overlapping_sessions_exits(url):
+    first_open, second_open, first_closed, second_done = (threading.Event() for _ in range(4))
+    pools = {}
+
+    def second():
+        first_open.wait()
+        with httppool.session() as pools["second"]:
+            second_open.set()
+            first_closed.wait()
+            # The session that created the pool has ended; this one still reuses its connection
+            fetch(url)
+        second_done.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    with httppool.session() as pools["first"]:
+        first_open.set()
+        second_open.wait()
+        fetch(url)
+    first_closed.set()
+    second_done.wait(10)
+    thread.join()
+
+    pool = pools["first"]
+    assert pools["second"] is pool
+    assert pool.stats()["connections_opened"] == 1 and pool.stats()["connections_reused"] == 1
+    assert pool._idle == {}  # Closed with the last session
+    assert urllib.request._opener is None
+    with httppool.session() as fresh:
+        assert fresh is not pool
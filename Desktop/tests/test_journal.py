@@ -0,0 +1,122 @@
+"""Job journal: claiming, resuming and revalidating jobs of another process"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import journal
+from journal import Journal
+from ledger import Ledger
+
+URLS = [f"https://www.youtube.com/watch?v=video{k:06d}" for k in range(4)]
+OPTIONS = {"output": "out", "format": "mp3"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.sqlite3")
+
+
+@pytest.fixture
+def journals(path):
+    opened = []
+
+    def open_journal():
+        opened.append(Journal(path))
+        return opened[-1]
+
+    yield open_journal
+    for each in opened:
+        each.close()
+
+
+def track(url):
+    return SimpleNamespace(url=url)
+
+
+def stopped_job(journals, statuses):
+    """A job stopped with the items of URLS in statuses, from a process that closed its journal"""
+    first = journals()
+    job = first.start(URLS, OPTIONS, "cli")
+    for url, status in zip(URLS, statuses):
+        job.queued(track(url))
+        if status != "queued":
+            job.update(track(url), status)
+    job.end(stopped=True)
+    return job.id
+
+
+def test_finished_job_is_deleted(journals):
+    job = journals().start(URLS, OPTIONS, "cli")
+    job.queued(track(URLS[0]))
+    job.end(stopped=False)
+    assert journals().resumable("cli") == []
+
+
+def test_stopped_job_resumes_once_with_its_urls_options_and_counts(journals):
+    job_id = stopped_job(journals, ["done", "failed", "downloading", "queued"])
+    other = journals()
+    [entry] = other.resumable("cli")
+    assert (entry["id"], entry["urls"], entry["options"]) == (job_id, URLS, OPTIONS)
+    assert entry["counts"] == {"done": 1, "failed": 1, "downloading": 1, "queued": 1}
+    assert other.resumable("gui") == []
+
+    resumed = other.claim(job_id)
+    assert resumed.items[journal.item_key(URLS[0])] == "done"
+    assert journals().claim(job_id) is None  # Already running in another process
+
+
+def test_job_of_a_live_process_is_not_resumable_until_its_heartbeat_is_stale(journals):
+    running = journals()
+    job = running.start(URLS, OPTIONS, "gui")
+    other = journals()
+    assert other.resumable("gui") == []
+    assert other.claim(job.id) is None
+
+    # The process died: its heartbeat stopped
+    running._execute(("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                      (time.time() - journal.STALE_AFTER - 1, job.id)))
+    assert [entry["id"] for entry in other.resumable("gui")] == [job.id]
+    assert other.claim(job.id) is not None
+
+
+def test_resume_skips_finished_videos_and_tries_failed_ones_again(journals, tmp_path):
+    job_id = stopped_job(journals, ["done", "skipped", "failed", "queued"])
+    resumed = journals().claim(job_id)
+    ledger = Ledger.for_folder(str(tmp_path))
+    try:
+        assert [resumed.completed(url, ledger, "mp3") for url in URLS] == [True, True, False, False]
+    finally:
+        ledger.close()
+    assert resumed.resumed == 2
+
+
+def test_video_in_progress_counts_as_done_once_the_ledger_has_its_output(journals, tmp_path):
+    job_id = stopped_job(journals, ["encoding", "downloading", "done", "done"])
+    output = tmp_path / "finished.mp3"
+    output.write_bytes(b"\xff\xfb" * 100)
+    ledger = Ledger.for_folder(str(tmp_path))
+    try:
+        ledger.record("video000000", str(output), "mp3")
+        resumed = journals().claim(job_id)
+        assert resumed.completed(URLS[0], ledger, "mp3")
+        assert not resumed.completed(URLS[1], ledger, "mp3")  # Never finished: download it again
+    finally:
+        ledger.close()
+    assert (resumed.resumed, resumed.revalidated) == (1, 1)
+    status = resumed.journal._db.execute("SELECT status FROM items WHERE job_id = ? AND key = ?",
+                                         (job_id, journal.item_key(URLS[0]))).fetchone()[0]
+    assert status == "done"
+
+
+def test_cancelled_job_is_deleted_and_later_writes_are_ignored(journals):
+    job = journals().start(URLS, OPTIONS, "service")
+    job.queued(track(URLS[0]))
+    job.discard()
+    # The pipeline winds down after the user cancelled
+    job.queued(track(URLS[1]))
+    job.update(track(URLS[0]), "stopped")
+    job.end(stopped=True)
+    assert journals().resumable("service") == []
+    rows = journals()._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    assert rows == 0
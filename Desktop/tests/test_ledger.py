@@ -0,0 +1,78 @@
+"""What the ledger counts as already downloaded, and the failures it keeps for a rerun"""
+import pytest
+
+import pipeline as pipeline_module
+from ledger import Ledger
+from metacache import MetadataCache
+from pipeline import Pipeline
+
+VIDEO_ID = "video000001"
+URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = Ledger.for_folder(str(tmp_path))
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / "Song.mp3"
+    path.write_bytes(b"encoded audio")
+    return path
+
+
+def test_recorded_output_is_current_while_it_is_on_disk_in_the_same_format(ledger, output):
+    ledger.record(VIDEO_ID, str(output), "mp3", "192k", URL, "Song")
+    entry = ledger.find_current(VIDEO_ID, "mp3")
+    assert entry["output_path"] == str(output)
+    assert entry["title"] == "Song"
+    assert ledger.find_current(VIDEO_ID, "m4a") is None
+    assert ledger.find_current(None, "mp3") is None
+
+    output.write_bytes(b"truncated")
+    assert ledger.find_current(VIDEO_ID, "mp3") is None
+    output.unlink()
+    assert ledger.find_current(VIDEO_ID, "mp3") is None
+
+
+def test_ledger_is_read_back_after_a_reopen(tmp_path, ledger, output):
+    ledger.record(VIDEO_ID, str(output), "mp3", url=URL)
+    reopened = Ledger.for_folder(str(tmp_path))
+    try:
+        assert reopened.find_current(VIDEO_ID, "mp3")["size"] == output.stat().st_size
+    finally:
+        reopened.close()
+
+
+def test_failures_are_kept_until_the_video_finishes(ledger, output):
+    ledger.record_failure(URL, VIDEO_ID, error="HTTP Error 403", cause="http_403")
+    ledger.record_failure("https://www.youtube.com/playlist?list=PL", error="gone")
+    assert ledger.failed_urls() == [URL, "https://www.youtube.com/playlist?list=PL"]
+
+    ledger.record_failure(URL, VIDEO_ID, error="timed out", cause="network", attempts=2)
+    assert [(f["url"], f["cause"], f["attempts"]) for f in ledger.failures()][-1] == (URL, "network", 2)
+
+    ledger.record(VIDEO_ID, str(output), "mp3", url=URL)
+    ledger.forget_failure("https://www.youtube.com/playlist?list=PL")
+    assert ledger.failed_urls() == []
+
+
+def test_sync_skips_a_recorded_video_without_fetching_it(ffmpeg, tmp_path, output, monkeypatch):
+    ledger = Ledger.for_folder(str(tmp_path))
+    ledger.record(VIDEO_ID, str(output), "mp3", url=URL, title="Song")
+    ledger.close()
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("fetched a video the ledger has")
+
+    monkeypatch.setattr(pipeline_module, "fetch_video", no_network)
+    metadata = MetadataCache(str(tmp_path / "metadata.sqlite3"))
+    try:
+        tracks = Pipeline(str(tmp_path), sync=True, dedup=False, metadata=metadata).run([URL])
+    finally:
+        metadata.close()
+    assert [(track.status, track.output_path, track.title) for track in tracks] == [
+        ("skipped", str(output), "Song")]
@@ -0,0 +1,181 @@
+"""Metadata cache expiry and eviction, videos answered from it without YouTube, and lazy playlist listing"""
+import threading
+import types
+
+import pytest
+
+import metacache
+import pipeline as pipeline_module
+from metacache import (BatchUrls, CachedStream, MetadataCache, PlaylistUrls, fetch_video, url_expiry,
+                       video_id_from_url, video_key)
+from pipeline import Pipeline
+
+VIDEO_ID = "video000001"
+DESCRIPTOR = {"url": "https://host/videoplayback?expire=2000000000&itag=140", "itag": 140,
+              "mime_type": "audio/mp4", "subtype": "mp4", "audio_codec": "mp4a.40.2", "abr": "128kbps",
+              "filesize": 1000, "is_default_audio_track": True, "filename": "Song.m4a"}
+PLAYLIST = "https://www.youtube.com/playlist?list=PLfake"
+PAGES = [[f"https://www.youtube.com/watch?v=video0000{page}{index}" for index in range(2)] for page in range(3)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metacache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MetadataCache(str(tmp_path / "metadata.sqlite3"), ttl=60, max_entries=2)
+    yield cache
+    cache.close()
+
+
+def test_entries_expire_after_the_ttl_or_their_own_expiry(cache, clock):
+    cache.put("a", {"title": "A"})
+    cache.put("b", ["url"], expires_at=clock.now + 10)
+    clock.now += 30
+    assert cache.get("a") == {"title": "A"}
+    assert cache.get("b") is None
+    clock.now += 31
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted_first(cache, clock):
+    cache.put("a", 1)
+    clock.now += 1
+    cache.put("b", 2)
+    clock.now += 1
+    assert cache.get("a") == 1  # Now used more recently than b
+    clock.now += 1
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_cached_video_needs_no_request_to_youtube(cache, monkeypatch):
+    def no_network():
+        raise AssertionError("asked YouTube for a cached video")
+
+    monkeypatch.setattr(metacache, "load_pytubefix", no_network)
+    cache.put(video_key(VIDEO_ID), {"title": "Song", "length": 180, "streams": [DESCRIPTOR]})
+    progress = []
+    video_id, title, length, streams, from_cache = fetch_video(
+        cache, f"https://youtu.be/{VIDEO_ID}", on_progress=lambda *args: progress.append(args))
+    assert (video_id, title, length, from_cache) == (VIDEO_ID, "Song", 180, True)
+
+    stream = streams[0]
+    assert (stream.itag, stream.audio_codec, stream.filesize) == (140, "mp4a.40.2", 1000)
+    stream.on_progress_for_chunks(b"x" * 10, 990)
+    assert progress == [(stream, b"x" * 10, 990)]
+
+
+def test_cached_stream_downloads_to_its_filename(tmp_path):
+    stream = CachedStream(DESCRIPTOR)
+    assert stream.get_file_path(str(tmp_path / "new")) == str(tmp_path / "new" / "Song.m4a")
+    assert (tmp_path / "new").is_dir()
+    stream.on_progress_for_chunks(b"", 0)  # Without a callback, progress goes nowhere
+
+
+@pytest.mark.parametrize("url, video_id", [
+    (f"https://www.youtube.com/watch?v={VIDEO_ID}", VIDEO_ID),
+    (f"https://www.youtube.com/watch?v={VIDEO_ID}&list=PL123", VIDEO_ID),
+    (f"https://youtu.be/{VIDEO_ID}?t=30", VIDEO_ID),
+    (f"https://www.youtube.com/shorts/{VIDEO_ID}", VIDEO_ID),
+    ("https://www.youtube.com/playlist?list=PL123", None),
+    ("", None),
+    (None, None),
+])
+def test_video_id_from_url(url, video_id):
+    assert video_id_from_url(url) == video_id
+
+
+def test_url_expiry():
+    assert url_expiry(DESCRIPTOR["url"]) == 2000000000
+    assert url_expiry("https://host/videoplayback?itag=140") is None
+
+
+class FakePlaylist:
+    """pytubefix.Playlist over PAGES, showing an estimated length; later pages load as they are asked for"""
+    length = 7
+    pages_loaded = 0
+    fail_after = None  # Pages that load before the next one fails
+    before_page = None  # Called before each page after the first
+
+    def __init__(self, url):
+        assert url == PLAYLIST
+
+    def url_generator(self):
+        for number, page in enumerate(PAGES):
+            if number and FakePlaylist.before_page:
+                FakePlaylist.before_page()
+            if number == FakePlaylist.fail_after:
+                raise OSError("page failed")
+            FakePlaylist.pages_loaded += 1
+            yield from page
+
+
+@pytest.fixture
+def playlist(monkeypatch):
+    monkeypatch.setattr(FakePlaylist, "pages_loaded", 0)
+    monkeypatch.setattr(metacache, "load_pytubefix", lambda: types.SimpleNamespace(Playlist=FakePlaylist))
+    return FakePlaylist
+
+
+def test_playlist_is_listed_page_by_page_and_cached_once_complete(cache, playlist):
+    urls = PlaylistUrls(cache, PLAYLIST)
+    assert urls.total is None
+    listing = iter(urls)
+    assert next(listing) == PAGES[0][0]
+    assert playlist.pages_loaded == 1
+    assert urls.total == 7  # The estimate the first page shows
+    assert list(listing) == PAGES[0][1:] + PAGES[1] + PAGES[2]
+    assert urls.total == 6 and urls.complete
+
+    cached = PlaylistUrls(cache, PLAYLIST)
+    assert cached.total == 6
+    assert list(cached) == [url for page in PAGES for url in page]
+    assert playlist.pages_loaded == 3
+
+
+def test_batch_drops_duplicates_and_keeps_the_videos_listed_before_an_error(cache, playlist, monkeypatch):
+    monkeypatch.setattr(playlist, "fail_after", 2)
+    listed, errors = [], []
+    batch = BatchUrls([PAGES[0][1], PLAYLIST, "https://youtu.be/video000099"], cache,
+                      on_playlist=lambda url, count: listed.append(url),
+                      on_error=lambda url, error: errors.append((url, str(error))))
+    assert batch.total is None  # Until the playlist shows a count
+    assert list(batch) == [PAGES[0][1], PAGES[0][0]] + PAGES[1] + ["https://youtu.be/video000099"]
+    assert listed == [] and errors == [(PLAYLIST, "page failed")]
+    assert cache.get("playlist:PLfake") is None  # An incomplete listing is not cached
+
+    monkeypatch.setattr(playlist, "fail_after", None)
+    batch = BatchUrls([PLAYLIST], cache, on_playlist=lambda url, count: listed.append((url, count)))
+    list(batch)
+    assert batch.total == 6 and listed == [(PLAYLIST, 6)]
+
+
+def test_first_video_is_fetched_before_the_playlist_is_fully_listed(ffmpeg, tmp_path, cache, playlist,
+                                                                     monkeypatch):
+    fetched = threading.Event()
+    fetched_before = []
+    monkeypatch.setattr(playlist, "before_page", lambda: fetched_before.append(fetched.wait(10)))
+
+    def fetch(cache, url, on_progress=None):
+        fetched.set()
+        raise ValueError("no network in tests")
+
+    monkeypatch.setattr(pipeline_module, "fetch_video", fetch)
+    tracks = Pipeline(str(tmp_path / "out"), dedup=False, metadata=cache).run(PlaylistUrls(cache, PLAYLIST))
+    assert fetched_before == [True, True]
+    assert len(tracks) == 6
+    assert {track.total for track in tracks} == {6}  # The estimate is corrected once the listing ends
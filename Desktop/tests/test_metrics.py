@@ -0,0 +1,35 @@
+"""Metric types and the JSON snapshot export"""
+import json
+
+from metrics import Registry, SnapshotWriter
+
+
+def test_snapshot_writer_warns_instead_of_raising_when_it_cannot_write(tmp_path, capsys):
+    registry = Registry()
+    registry.counter("test_total", "Test").inc()
+    writer = SnapshotWriter(str(tmp_path / "missing" / "metrics.json"), interval=60, metrics=registry).start()
+    writer.stop()
+    assert "Could not write metrics snapshot" in capsys.readouterr().err
+
+
+def test_snapshot_writer_writes_once_more_on_stop(tmp_path):
+    registry = Registry()
+    counter = registry.counter("test_total", "Test")
+    path = tmp_path / "metrics.json"
+    writer = SnapshotWriter(str(path), interval=60, metrics=registry).start()
+    counter.inc(3)
+    writer.stop()
+    assert "test_total" in path.read_text(encoding="utf-8")
+    assert json.loads(path.read_text(encoding="utf-8"))
+
+
+
+def test_gauge_function_is_read_whenever_the_gauge_is():
+    registry = Registry()
+    gauge = registry.gauge("test_value", "Test")
+    value = [1]
+    gauge.set_function(lambda: value[0])
+    assert gauge.total() == 1
+    value[0] = 5
+    assert "test_value 5" in gauge.render()
+    assert gauge.snapshot() == [{"labels": {}, "value": 5}]
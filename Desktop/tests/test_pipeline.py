@@ -0,0 +1,110 @@
+"""What the pipeline leaves on disk when a track fails, how it reports the failure, and what it counts as its own"""
+import pytest
+
+import contentstore
+import pipeline as pipeline_module
+from contentstore import ContentStore
+from ledger import Ledger
+from metacache import MetadataCache
+from pipeline import Pipeline, Track
+
+VIDEO_ID = "video000001"
+URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+
+@pytest.fixture
+def pipeline(ffmpeg, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    store = ContentStore(str(tmp_path / "store"))
+    pipeline = Pipeline(str(out), store=store, metadata=MetadataCache(str(tmp_path / "metadata.sqlite3")))
+    yield pipeline
+    for resource in (pipeline.ledger, pipeline.metadata, pipeline.store, pipeline.event_log):
+        resource.close()
+
+
+def earlier_output(pipeline, tmp_path):
+    """An output of an earlier run, also in the content store"""
+    output = tmp_path / "out" / "Song.mp3"
+    output.write_bytes(b"earlier output")
+    pipeline.store.add(VIDEO_ID, pipeline.profile, str(output), "Song")
+    return output
+
+
+def test_failed_materialize_keeps_the_earlier_output(pipeline, tmp_path, monkeypatch):
+    output = earlier_output(pipeline, tmp_path)
+
+    def failing_link(source, target, methods=None):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(contentstore, "link", failing_link)
+    track = Track(1, URL, pipeline.out_folder)
+    track.video_id = VIDEO_ID
+    assert not pipeline._from_store(track)
+    assert track.output_path is None
+
+    # The download that runs instead fails too
+    pipeline._cleanup(track)
+    assert output.read_bytes() == b"earlier output"
+
+
+def test_output_is_only_removed_once_this_attempt_started_writing_it(pipeline, tmp_path):
+    output = earlier_output(pipeline, tmp_path)
+    downloaded = tmp_path / "out" / "Song.webm"
+    downloaded.write_bytes(b"source")
+    track = Track(1, URL, pipeline.out_folder)
+    track.downloaded_path, track.output_path = str(downloaded), str(output)
+
+    pipeline._cleanup(track)  # Stopped after the download, before the encode
+    assert not downloaded.exists() and output.exists()
+
+    track.output_written = True  # The encode started replacing it
+    pipeline._cleanup(track)
+    assert not output.exists()
+
+
+def test_adaptive_pipelines_count_only_their_own_downloads_and_errors(pipeline, tmp_path):
+    other = Pipeline(str(tmp_path / "out"), adaptive=True, ledger=pipeline.ledger, metadata=pipeline.metadata,
+                     store=pipeline.store, event_log=pipeline.event_log)
+    track = Track(1, URL, pipeline.out_folder)
+    pipeline._progress(track, None, b"x" * 100, 0)
+    pipeline._count_error()
+    assert (pipeline.bytes_downloaded, pipeline.errors) == (100, 1)
+    assert (other.bytes_downloaded, other.errors) == (0, 0)
+    assert other.download_limit == other.concurrency
+
+
+def test_failure_that_breaks_the_worker_is_still_reported(pipeline, tmp_path, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ValueError("Video unavailable")
+
+    def broken_cleanup(track):
+        raise RuntimeError("cleanup broke")
+
+    monkeypatch.setattr(pipeline_module, "fetch_video", unavailable)
+    monkeypatch.setattr(pipeline, "_cleanup", broken_cleanup)
+    statuses = []
+    pipeline.on_status = lambda track, status, message: statuses.append((track.index, status, message))
+    tracks = pipeline.run([URL, "https://www.youtube.com/watch?v=video000002"])
+
+    assert [track.status for track in tracks] == ["failed", "failed"]
+    assert sorted(entry for entry in statuses if entry[1] == "failed") == [
+        (1, "failed", "cleanup broke"), (2, "failed", "cleanup broke")]
+    ledger = Ledger.for_folder(str(tmp_path / "out"))
+    try:
+        assert sorted(ledger.failed_urls()) == [URL, "https://www.youtube.com/watch?v=video000002"]
+    finally:
+        ledger.close()
+
+
+def test_status_callback_that_raises_does_not_stop_the_run(pipeline, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ValueError("Video unavailable")
+
+    def broken_callback(track, status, message):
+        raise RuntimeError("callback broke")
+
+    monkeypatch.setattr(pipeline_module, "fetch_video", unavailable)
+    pipeline.on_status = broken_callback
+    tracks = pipeline.run([URL])
+    assert tracks[0].status == "failed"
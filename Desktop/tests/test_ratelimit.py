@@ -0,0 +1,54 @@
+"""Adaptive concurrency of pipelines sharing the bandwidth limit"""
+import pytest
+
+import ratelimit
+from ratelimit import CONCURRENCY_LIMIT, AdaptiveLimit, ConcurrencyController
+
+
+@pytest.fixture
+def rate_limit():
+    ratelimit.limiter.configure(1000)
+    yield 1000
+    ratelimit.limiter.configure(0)
+
+
+def controller(limit=2, maximum=8, errors=0):
+    return ConcurrencyController(AdaptiveLimit(limit, maximum), bytes_done=lambda: 0, errors=lambda: errors)
+
+
+def test_errors_halve_the_limit_and_growth_adds_one():
+    assert controller(limit=6).decide(100, new_errors=1, busy=True) == 3
+    assert controller(limit=1).decide(100, new_errors=3, busy=True) == 1
+    assert controller().decide(100, new_errors=0, busy=True) == 3
+    assert controller().decide(100, new_errors=0, busy=False) == 2
+
+
+def test_the_shared_bandwidth_limit_holds_every_pipeline(rate_limit):
+    # Alone at the cap: more downloads cannot help
+    assert controller().decide(950, new_errors=0, busy=True) == 2
+    # Half the cap for this pipeline, but the process as a whole is at it
+    assert controller().decide(500, new_errors=0, busy=True, shared_throughput=950) == 2
+    # Room left under the cap
+    assert controller().decide(500, new_errors=0, busy=True, shared_throughput=600) == 3
+
+
+def test_limit_gauge_counts_every_running_controller():
+    before = CONCURRENCY_LIMIT.total()
+    first, second = controller(limit=3).start(), controller(limit=2).start()
+    assert CONCURRENCY_LIMIT.total() == before + 5
+    first.stop()
+    assert CONCURRENCY_LIMIT.total() == before + 2
+    second.stop()
+    assert CONCURRENCY_LIMIT.total() == before
+
+
+def test_rate_gauge_follows_a_schedule_without_a_new_configure(monkeypatch):
+    schedule = ratelimit.RateSchedule("00:00-23:59=2M")
+    ratelimit.limiter.configure(500, schedule=schedule)
+    try:
+        assert ratelimit.RATE_LIMIT.total() == 2 * 1024 * 1024
+        monkeypatch.setattr(schedule, "rate_at", lambda when=None, default=0: default)  # The window closes
+        assert ratelimit.RATE_LIMIT.total() == 500
+    finally:
+        ratelimit.limiter.configure(0)
+    assert ratelimit.RATE_LIMIT.total() == 0
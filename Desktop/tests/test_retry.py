@@ -0,0 +1,93 @@
+"""Failure classification, retry backoff and the circuit breaker"""
+import socket
+import threading
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+import retry
+from encoder import EncodeError
+from retry import PERMANENT, REJECTED, TRANSIENT, CircuitBreaker, RetryPolicy
+
+
+def http_error(code):
+    return HTTPError("https://example.com", code, "error", {}, None)
+
+
+@pytest.mark.parametrize("error, kind", [
+    (http_error(403), REJECTED),
+    (http_error(429), REJECTED),
+    (http_error(500), TRANSIENT),
+    (http_error(503), TRANSIENT),
+    (http_error(408), TRANSIENT),
+    (URLError("connection refused"), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (socket.timeout(), TRANSIENT),
+    (http_error(404), PERMANENT),
+    (http_error(410), PERMANENT),
+    (EncodeError("Invalid data found when processing input"), PERMANENT),
+    (ValueError("unknown"), PERMANENT),
+])
+def test_classify(error, kind):
+    assert retry.classify(error) == kind
+
+
+def test_only_transient_and_rejected_failures_are_retried_up_to_the_limit():
+    policy = RetryPolicy(retries=2)
+    assert policy.should_retry(http_error(503), 0)
+    assert policy.should_retry(http_error(429), 1)
+    assert not policy.should_retry(http_error(503), 2)
+    assert not policy.should_retry(http_error(404), 0)
+    assert not RetryPolicy(retries=0).should_retry(http_error(503), 0)
+
+
+def test_delay_grows_exponentially_with_jitter_and_a_cap():
+    policy = RetryPolicy(base_delay=4, max_delay=20)
+    for attempt, step in ((1, 4), (2, 8), (3, 16), (4, 20), (10, 20)):
+        delays = [policy.delay(attempt) for _ in range(50)]
+        assert all(step / 2 <= delay <= step for delay in delays)
+        assert len(set(delays)) > 1
+
+
+def test_breaker_opens_after_threshold_rejections_in_a_row():
+    opened = []
+    breaker = CircuitBreaker(threshold=3, cooldown=60, on_open=opened.append)
+    breaker.record(REJECTED)
+    breaker.record(REJECTED)
+    breaker.record(TRANSIENT)  # Not a rejection: the count starts over
+    breaker.record(REJECTED)
+    breaker.record(REJECTED)
+    assert not breaker.is_open
+    breaker.record(REJECTED)
+    assert breaker.is_open and opened == [60]
+
+
+def test_breaker_doubles_its_cooldown_while_rejections_go_on_and_resets_on_success():
+    opened = []
+    breaker = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=30, on_open=opened.append)
+    for _ in range(2):
+        breaker.record(REJECTED)
+    for _ in range(3):
+        breaker.open_until = 0  # The pause is over
+        breaker.record(REJECTED)  # A single rejection of the probe reopens it
+    assert opened == [10, 20, 30, 30]
+
+    breaker.open_until = 0
+    breaker.record(None)
+    for _ in range(2):
+        breaker.record(REJECTED)
+    assert opened[-1] == 10
+
+
+def test_wait_blocks_while_open_and_returns_early_when_stopped():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.2)
+    stop = threading.Event()
+    assert breaker.wait(stop) is False  # Closed: no wait at all
+    breaker.record(REJECTED)
+    assert breaker.wait(stop) is False
+    assert not breaker.is_open
+
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record(REJECTED)
+    threading.Timer(0.1, stop.set).start()
+    assert breaker.wait(stop) is True
@@ -0,0 +1,69 @@
+"""Audio stream selection policies"""
+from types import SimpleNamespace
+
+import pytest
+
+from encoder import Encoder
+from selection import describe_stream, select_stream, stream_kbps
+
+
+def stream(codec, abr, default=True):
+    return SimpleNamespace(audio_codec=codec, abr=abr, is_default_audio_track=default)
+
+
+OPUS_160 = stream("opus", "160kbps")
+OPUS_70 = stream("opus", "70kbps")
+AAC_128 = stream("mp4a.40.2", "128kbps")
+AAC_48 = stream("mp4a.40.5", "48kbps")
+STREAMS = [AAC_48, OPUS_70, AAC_128, OPUS_160]
+
+
+@pytest.fixture
+def encoder(ffmpeg):
+    return lambda output_format: Encoder(workers=1, output_format=output_format)
+
+
+def test_first_takes_the_stream_listed_first():
+    assert select_stream(STREAMS, "first") is AAC_48
+
+
+def test_best_takes_the_highest_bitrate():
+    assert select_stream(STREAMS, "best") is OPUS_160
+
+
+@pytest.mark.parametrize("target, expected", [(64, OPUS_70), (128, AAC_128), (100, AAC_128), (256, OPUS_160),
+                                              (None, OPUS_160)])
+def test_smallest_takes_the_lowest_bitrate_meeting_the_target(target, expected):
+    assert select_stream(STREAMS, "smallest", target_kbps=target) is expected
+
+
+@pytest.mark.parametrize("policy, expected", [("aac", AAC_128), ("opus", OPUS_160)])
+def test_codec_policies_prefer_their_codec(policy, expected):
+    assert select_stream(STREAMS, policy) is expected
+    # Without a stream of that codec, the best one will do
+    assert select_stream([AAC_48], "opus") is AAC_48
+
+
+@pytest.mark.parametrize("output_format, expected", [("m4a", AAC_128), ("opus", OPUS_160), ("mp3", OPUS_160)])
+def test_match_prefers_a_stream_the_output_format_can_copy(encoder, output_format, expected):
+    assert select_stream(STREAMS, "match", encoder(output_format)) is expected
+
+
+def test_dubbed_tracks_are_skipped_for_the_original():
+    dubbed = stream("opus", "160kbps", default=False)
+    original = stream("opus", "50kbps")
+    assert select_stream([dubbed, original], "best") is original
+
+
+def test_no_streams_and_unknown_policies():
+    assert select_stream([], "best") is None
+    with pytest.raises(ValueError):
+        select_stream(STREAMS, "loudest")
+
+
+def test_bitrates_pytubefix_does_not_know_count_as_zero():
+    unknown = stream("opus", None)
+    assert stream_kbps(unknown) == 0
+    assert select_stream([unknown, OPUS_70], "best") is OPUS_70
+    assert describe_stream(unknown) == "opus"
+    assert describe_stream(AAC_128) == "aac 128kbps"
@@ -0,0 +1,103 @@
+"""The service's HTTP API on an ephemeral port, with a pipeline that needs no network"""
+import threading
+import time
+import types
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+
+import service
+from pipeline import Track
+
+
+class FakePipeline:
+    """Finishes each URL at once, except those with 'block' in them, which wait until stopped"""
+
+    def __init__(self, out_folder, on_status=None, **options):
+        self.out_folder = out_folder
+        self.on_status = on_status
+        self.bytes_downloaded = 0
+        self.download_limit = None
+        self.event_log = types.SimpleNamespace(close=lambda: None)
+        self.blocking = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self, urls, total=None):
+        for index, url in enumerate(urls, 1):
+            track = Track(index, url, self.out_folder, total)
+            track.title = url.rsplit("=", 1)[-1]
+            self.on_status(track, "fetching", None)
+            if "block" in url:
+                self.blocking.set()
+                self._stopped.wait(10)
+            status = "stopped" if self._stopped.is_set() else "done"
+            self.on_status(track, status, None)
+
+    def stop(self):
+        self._stopped.set()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))  # Journal, metadata cache and service.json
+    monkeypatch.setattr(service, "Pipeline", FakePipeline)
+    daemon = service.Service(store_folder=str(tmp_path / "store")).start()
+    server = service.serve(daemon)
+    yield server
+    server.shutdown()
+    daemon.close()
+
+
+@pytest.fixture
+def client(server):
+    return service.Client.discover()
+
+
+def options(tmp_path):
+    return {"output": str(tmp_path / "out")}
+
+
+def test_requests_without_the_token_are_rejected(server):
+    for token in (None, "wrong"):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        request = urllib.request.Request(server.url + "/jobs", headers=headers)
+        with pytest.raises(HTTPError) as error:
+            urllib.request.urlopen(request, timeout=10)
+        assert error.value.code == 401
+    with pytest.raises(service.ServiceError, match="token"):
+        service.Client(server.url, "wrong").health()
+
+
+def test_submitted_job_is_followed_to_completion(client, tmp_path):
+    urls = ["https://y/watch?v=one", "https://y/watch?v=two"]
+    job = client.submit(urls, options(tmp_path))
+    assert job["state"] in (service.QUEUED, service.RUNNING)
+    statuses = []
+    summary = client.follow(job["id"], on_status=lambda track, status, message: statuses.append(
+        (track.url, status)), interval=0.01)
+    assert summary["state"] == service.DONE
+    assert summary["counts"]["done"] == 2
+    assert [status for url, status in statuses if url == urls[0]] == ["fetching", "done"]
+    assert {url for url, status in statuses if status == "done"} == set(urls)
+    assert [job["id"] for job in client.jobs()] == [summary["id"]]
+
+
+def test_delete_cancels_a_running_job(client, server, tmp_path):
+    job = client.submit(["https://y/watch?v=block"], options(tmp_path))
+    running = server.service.get(job["id"])
+    deadline = time.time() + 10
+    while running.pipeline is None and time.time() < deadline:  # Queued until a worker takes it
+        time.sleep(0.01)
+    assert running.pipeline.blocking.wait(10)
+    assert client.cancel(job["id"])["id"] == job["id"]
+    summary = client.follow(job["id"], interval=0.01)
+    assert summary["state"] == service.CANCELLED
+    assert summary["counts"]["stopped"] == 1
+
+
+def test_unknown_job_and_bad_options_are_client_errors(client, tmp_path):
+    with pytest.raises(service.ServiceError, match="no such job"):
+        client.cancel("nosuchjob")
+    with pytest.raises(service.ServiceError):
+        client.submit(["https://y/watch?v=one"], {**options(tmp_path), "concurrency": 0})
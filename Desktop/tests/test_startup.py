@@ -0,0 +1,19 @@
+"""Cold start of the entry points, with the budgets of benchmarks/startup.py"""
+import importlib.util
+import os
+
+import pytest
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "startup.py")
+spec = importlib.util.spec_from_file_location("startup_benchmark", BENCHMARK)
+startup = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(startup)
+
+SCALE = 3  # Generous: the suite runs on loaded CI machines; the benchmark holds the real budget
+
+
+@pytest.mark.parametrize("module", sorted(startup.BUDGETS))
+def test_entry_point_starts_without_deferred_modules_and_within_budget(module):
+    seconds, loaded = startup.measure(module, runs=3)
+    assert loaded == [], f"{module} imports {', '.join(loaded)} at startup"
+    assert seconds <= startup.BUDGETS[module] * SCALE